@@ -1,20 +1,43 @@
-from flask import Blueprint, jsonify
-import analytics_service
+from flask import Blueprint, jsonify, request
+from datetime import datetime
+from routes.auth_routes import token_required
+from services import analytics_service
 
 analytics_bp = Blueprint("analytics", __name__)
 
+
+def _date_range():
+    """Optional ?start= / ?end= (ISO dates; start inclusive, end exclusive)."""
+    start, end = request.args.get("start"), request.args.get("end")
+    return (
+        datetime.fromisoformat(start) if start else None,
+        datetime.fromisoformat(end) if end else None
+    )
+
+
+def _report(build, current_user):
+    try:
+        start, end = _date_range()
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates (YYYY-MM-DD)"}), 400
+    return jsonify(build(current_user.organization_id, start, end))
+
 @analytics_bp.route("/api/analytics/revenue")
-def revenue():
-    return jsonify(analytics_service.get_revenue_analytics())
+@token_required
+def revenue(current_user):
+    return _report(analytics_service.get_revenue_analytics, current_user)
 
 @analytics_bp.route("/api/analytics/pipeline")
-def pipeline():
-    return jsonify(analytics_service.get_pipeline_analytics())
+@token_required
+def pipeline(current_user):
+    return _report(analytics_service.get_pipeline_analytics, current_user)
 
 @analytics_bp.route("/api/analytics/leads")
-def leads():
-    return jsonify(analytics_service.get_lead_analytics())
+@token_required
+def leads(current_user):
+    return _report(analytics_service.get_lead_analytics, current_user)
 
 @analytics_bp.route("/api/analytics/kpi")
-def kpi():
-    return jsonify(analytics_service.get_kpi_analytics())
\ No newline at end of file
+@token_required
+def kpi(current_user):
+    return _report(analytics_service.get_kpi_analytics, current_user)
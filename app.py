@@ -54,6 +54,13 @@ from models.calendar_event import CalendarEvent
 from models.reminder import Reminder
 from models.team import Team, LocationTeamMapping
 from scheduler import process_drip_emails
+from services.rollup_service import refresh_dirty_rollups
+from services.customer_health_service import refresh_all_customer_health
+from services.import_job_service import resume_import_jobs
+from services.campaign_service import dispatch_due_campaigns
+from services.job_lease import run_exclusive
+from services.webhook_ingest_service import ensure_ingest_worker
+from services.outbound_service import ensure_outbound_worker
 from services.scheduler_instance import scheduler # Import global scheduler
 
 import models.automation # Register Automation Models
@@ -75,6 +82,14 @@ import models.branch
 import models.team_user
 import models.sales_rule
 import models.subscription
+import models.dashboard_rollup # Register Dashboard Rollup Model
+import models.import_job # Register Import Job Model
+import models.lead_tag # Register Lead Tag Model
+import models.scheduler_lease # Register Scheduler Lease Model
+import models.webhook_event # Register Webhook Event Model
+import models.conversation_read # Register Conversation Read Model
+import models.outbound_message # Register Outbound Message Model
+import models.reference_cache_version # Register Reference Cache Version Model
 
 
 
@@ -86,7 +101,9 @@ app.config['MAIL_PORT'] = int(os.getenv("MAIL_PORT", 587))
 app.config['MAIL_USE_TLS'] = os.getenv("MAIL_USE_TLS", "True") == "True"
 app.config['MAIL_USERNAME'] = os.getenv("MAIL_USERNAME")
 app.config['MAIL_PASSWORD'] = os.getenv("MAIL_PASSWORD")
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+from services.realtime import init_realtime
+init_realtime(app, socketio)
 print(f"[OK] Database URI: {app.config.get('SQLALCHEMY_DATABASE_URI')}")
 
 @app.before_request
@@ -124,6 +141,11 @@ mail.init_app(app)
 bcrypt.init_app(app)
 migrate = Migrate(app, db) #Fix: Only migrate once
 
+from services.log_buffer import init_log_buffer
+init_log_buffer(app) # Write-behind activity/audit logs
+from services.reference_cache import init_reference_cache
+init_reference_cache(app) # Per-org reference data cache
+
 app.register_blueprint(auth_bp, url_prefix="/auth")
 app.register_blueprint(social_bp, url_prefix="/api/auth")
 app.register_blueprint(website_bp) # No prefix for main website
@@ -939,6 +961,22 @@ with app.app_context():
     except Exception as e:
         pass
 
+    # --- Auto-Migration for Campaign Heartbeat (dispatch lease) ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("SELECT heartbeat_at FROM campaigns LIMIT 1"))
+            except Exception:
+                connection.rollback()
+                try:
+                    connection.execute(text("ALTER TABLE campaigns ADD COLUMN heartbeat_at DATETIME"))
+                    connection.commit()
+                    print("[OK] Added column: heartbeat_at to campaigns")
+                except Exception as e:
+                    print(f"[FAIL] Error adding heartbeat_at to campaigns: {e}")
+    except Exception as e:
+        print(f"Campaign Heartbeat Migration Error: {e}")
+
     # --- Auto-Migration for Landing Pages (New Schema) ---
     try:
         with db.engine.connect() as connection:
@@ -1105,6 +1143,195 @@ with app.app_context():
         print(f"Automation Migration Error: {e}")
     '''
 
+    # --- Auto-Migration for Inbox Columns (Webhook Ingest) ---
+    try:
+        with db.engine.connect() as connection:
+            inbox_new_cols = [
+                ("conversations", "organization_id", "INTEGER"),
+                ("conversations", "last_message_at", "DATETIME"),
+                ("messages", "whatsapp_message_id", "VARCHAR(255)")
+            ]
+            for table_name, col_name, col_type in inbox_new_cols:
+                try:
+                    connection.execute(text(f"SELECT {col_name} FROM {table_name} LIMIT 1"))
+                except Exception:
+                    connection.rollback()
+                    try:
+                        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type}"))
+                        connection.commit()
+                        print(f"[OK] Added column: {col_name} to {table_name}")
+                    except Exception as e:
+                        print(f"[FAIL] Error adding {col_name} to {table_name}: {e}")
+
+            # Conversations from before organization_id existed take their lead's org
+            # (the inbox list and socket joins are scoped by it)
+            try:
+                backfilled = connection.execute(text(
+                    "UPDATE conversations SET organization_id = "
+                    "(SELECT organization_id FROM leads WHERE leads.id = conversations.lead_id) "
+                    "WHERE organization_id IS NULL AND lead_id IS NOT NULL"
+                )).rowcount
+                connection.commit()
+                if backfilled:
+                    print(f"[OK] Backfilled organization_id on {backfilled} conversation(s).")
+            except Exception as e:
+                connection.rollback()
+                print(f"[FAIL] Error backfilling conversations.organization_id: {e}")
+
+            # wamid dedup and delivery receipts look messages up by whatsapp_message_id
+            try:
+                connection.execute(text("CREATE INDEX ix_messages_whatsapp_message_id ON messages (whatsapp_message_id)"))
+                connection.commit()
+                print("[OK] Added index ix_messages_whatsapp_message_id on messages.")
+            except Exception:
+                connection.rollback() # Already exists
+    except Exception as e:
+        print(f"Inbox Migration Error: {e}")
+
+    # --- Auto-Migration for Lead Phone Lookup (normalized phone + index) ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("SELECT phone_normalized FROM leads LIMIT 1"))
+            except Exception:
+                connection.rollback()
+                print("[WARN] Column 'phone_normalized' missing in leads. Adding...")
+                try:
+                    connection.execute(text("ALTER TABLE leads ADD COLUMN phone_normalized VARCHAR(32)"))
+                    connection.execute(text("CREATE INDEX ix_leads_org_phone_normalized ON leads (organization_id, phone_normalized)"))
+                    connection.commit()
+
+                    # Backfill in keyset batches
+                    from services.phone_service import normalize_phone
+                    last_id = 0
+                    while True:
+                        rows = connection.execute(text(
+                            "SELECT id, phone FROM leads WHERE id > :last_id AND phone IS NOT NULL ORDER BY id LIMIT 1000"
+                        ), {"last_id": last_id}).fetchall()
+                        if not rows:
+                            break
+                        connection.execute(
+                            text("UPDATE leads SET phone_normalized = :phone_normalized WHERE id = :id"),
+                            [{"id": row[0], "phone_normalized": normalize_phone(row[1])} for row in rows]
+                        )
+                        connection.commit()
+                        last_id = rows[-1][0]
+                    print("[OK] Added and backfilled phone_normalized on leads.")
+                except Exception as e:
+                    print(f"[FAIL] Error adding phone_normalized to leads: {e}")
+    except Exception as e:
+        print(f"Lead Phone Migration Error: {e}")
+
+    # --- Auto-Migration for Inbox Projection (denormalized list columns) ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("SELECT inbound_count FROM conversations LIMIT 1"))
+            except Exception:
+                connection.rollback()
+                print("[WARN] Inbox projection columns missing in conversations. Adding...")
+                try:
+                    for col_name, col_type in [
+                        ("last_message_preview", "VARCHAR(255)"),
+                        ("last_sender_type", "VARCHAR(20)"),
+                        ("lead_name", "VARCHAR(100)"),
+                        ("inbound_count", "INTEGER NOT NULL DEFAULT 0")
+                    ]:
+                        try:
+                            connection.execute(text(f"SELECT {col_name} FROM conversations LIMIT 1"))
+                        except Exception:
+                            connection.rollback()
+                            connection.execute(text(f"ALTER TABLE conversations ADD COLUMN {col_name} {col_type}"))
+                    connection.execute(text("CREATE INDEX ix_conversations_org_last_message ON conversations (organization_id, last_message_at, id)"))
+                    connection.commit()
+
+                    # Backfill from leads and messages
+                    connection.execute(text("UPDATE conversations SET lead_name = (SELECT name FROM leads WHERE leads.id = conversations.lead_id)"))
+                    connection.execute(text(
+                        "UPDATE conversations SET inbound_count = "
+                        "(SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id AND messages.sender_type = 'customer')"
+                    ))
+                    connection.execute(text(
+                        "UPDATE conversations SET "
+                        "last_message_preview = (SELECT SUBSTR(m.content, 1, 255) FROM messages m WHERE m.conversation_id = conversations.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1), "
+                        "last_sender_type = (SELECT m.sender_type FROM messages m WHERE m.conversation_id = conversations.id ORDER BY m.created_at DESC, m.id DESC LIMIT 1)"
+                    ))
+                    connection.execute(text("UPDATE conversations SET last_message_at = created_at WHERE last_message_at IS NULL"))
+                    connection.commit()
+                    print("[OK] Added and backfilled inbox projection columns on conversations.")
+                except Exception as e:
+                    print(f"[FAIL] Error adding inbox projection columns: {e}")
+    except Exception as e:
+        print(f"Inbox Projection Migration Error: {e}")
+
+    # --- Auto-Migration for User Token Version ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("SELECT token_version FROM users LIMIT 1"))
+            except Exception:
+                connection.rollback()
+                try:
+                    connection.execute(text("ALTER TABLE users ADD COLUMN token_version INTEGER DEFAULT 0"))
+                    connection.commit()
+                    print("[OK] Added column: token_version to users")
+                except Exception as e:
+                    print(f"[FAIL] Error adding token_version to users: {e}")
+    except Exception as e:
+        print(f"User Token Version Migration Error: {e}")
+
+    # --- Auto-Migration for Message History Index ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("CREATE INDEX ix_messages_conversation_created ON messages (conversation_id, created_at, id)"))
+                connection.commit()
+                print("[OK] Added index ix_messages_conversation_created on messages.")
+            except Exception:
+                connection.rollback() # Already exists
+    except Exception as e:
+        print(f"Message Index Migration Error: {e}")
+
+    # --- Auto-Migration for Lead Email Index (import de-duplication) ---
+    try:
+        with db.engine.connect() as connection:
+            try:
+                connection.execute(text("CREATE INDEX ix_leads_org_email ON leads (organization_id, email)"))
+                connection.commit()
+                print("[OK] Added index ix_leads_org_email on leads.")
+            except Exception:
+                connection.rollback() # Already exists
+    except Exception as e:
+        print(f"Lead Email Index Migration Error: {e}")
+
+    # --- Auto-Migration for Deal Soft Delete (NULL -> false) ---
+    # The deal list filters on is_deleted = false alone (see deal_list_filters); rows
+    # written before the column had a default would otherwise vanish from it
+    try:
+        with db.engine.connect() as connection:
+            backfilled = connection.execute(text("UPDATE deals SET is_deleted = :false WHERE is_deleted IS NULL"), {"false": False}).rowcount
+            connection.commit()
+            if backfilled:
+                print(f"[OK] Backfilled is_deleted on {backfilled} deal(s).")
+    except Exception as e:
+        print(f"Deal Soft Delete Migration Error: {e}")
+
+    # --- Auto-Migration for Import Job Errors (TEXT -> LONGTEXT) ---
+    # A 64 KB TEXT overflows once a large import has a few hundred failed rows
+    if db.engine.name == 'mysql':
+        try:
+            with db.engine.connect() as connection:
+                data_type = connection.execute(text(
+                    "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'import_jobs' AND COLUMN_NAME = 'errors'"
+                )).scalar()
+                if data_type and data_type.lower() != 'longtext':
+                    connection.execute(text("ALTER TABLE import_jobs MODIFY errors LONGTEXT"))
+                    connection.commit()
+                    print("[OK] Widened import_jobs.errors to LONGTEXT.")
+        except Exception as e:
+            print(f"Import Job Errors Migration Error: {e}")
+
     # --- Auto-Migration for Inbox Tables ---
     '''
     try:
@@ -1206,7 +1433,13 @@ with app.app_context():
             db.session.commit()
         print("✅ Teams seeded for testing.")
 
-if __name__ == "__main__":
+def start_scheduler():
+    """
+    Registers and starts the background jobs. Safe to run in every process
+    (gunicorn workers, several nodes): drip batches are claimed with
+    SKIP LOCKED, scheduled campaigns with a conditional status UPDATE, singleton
+    jobs with a DB lease (services/job_lease.py) and import jobs with their own claim.
+    """
     # --- Background Scheduler for Drip Campaigns ---
     def job_function():
         with app.app_context():
@@ -1214,9 +1447,45 @@ if __name__ == "__main__":
 
     # Add Drip Campaign Job
     scheduler.add_job(func=job_function, trigger="interval", minutes=1, id="drip_email_job")
+
+    # Send campaigns whose scheduled_at has passed
+    def campaign_dispatch_job_function():
+        with app.app_context():
+            dispatch_due_campaigns()
+
+    scheduler.add_job(func=campaign_dispatch_job_function, trigger="interval", minutes=1, id="campaign_dispatch_job")
+
+    # Refresh dashboard rollups for organizations written to since the last tick
+    # (dirty orgs are tracked per process, so every worker refreshes its own)
+    def rollup_job_function():
+        with app.app_context():
+            refresh_dirty_rollups()
+
+    scheduler.add_job(func=rollup_job_function, trigger="interval", minutes=1, id="dashboard_rollup_job")
+
+    # Batch customer health scoring (read by /api/customer-health/dashboard); one process per run
+    scheduler.add_job(
+        func=run_exclusive, args=[app, "customer_health_job", 14 * 60, refresh_all_customer_health],
+        trigger="interval", minutes=15, id="customer_health_job"
+    )
+
+    # Start this process's webhook ingest worker (also drains events left by a crashed process)
+    ensure_ingest_worker(app)
+    ensure_outbound_worker(app) # Also sends anything queued before a restart
+
+    # Pick up queued import jobs and resume any interrupted by a crash/restart
+    resume_import_jobs(app)
+    scheduler.add_job(func=resume_import_jobs, args=[app], trigger="interval", minutes=1, id="import_job_recovery")
     
     # Start the global scheduler
     scheduler.start()
-    print("[OK] Background scheduler started (Campaigns + Drip).")
+    print("[OK] Background scheduler started (Campaigns + Drip + Rollups).")
+
+# Under gunicorn app.py is imported, not run; opt in per deployment
+if os.getenv("RUN_SCHEDULER", "false").lower() == "true" and __name__ != "__main__":
+    start_scheduler()
+
+if __name__ == "__main__":
+    start_scheduler()
 
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)
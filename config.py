@@ -7,6 +7,75 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get("SECRET_KEY") or "a-dev-secret-key-that-is-not-so-secret"
 
+    # Dashboard rollups older than this (seconds) are refreshed in the background when read
+    DASHBOARD_ROLLUP_MAX_AGE = int(os.environ.get('DASHBOARD_ROLLUP_MAX_AGE', 300))
+
+    # Background import jobs (/api/import/<module>?async=true)
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+    IMPORT_JOB_STALE_SECONDS = int(os.environ.get('IMPORT_JOB_STALE_SECONDS', 300)) # No checkpoint for this long = crashed
+
+    # Campaign delivery engine
+    CAMPAIGN_WORKERS = int(os.environ.get('CAMPAIGN_WORKERS', 8))
+    CAMPAIGN_LOG_BATCH_SIZE = int(os.environ.get('CAMPAIGN_LOG_BATCH_SIZE', 500))
+    CAMPAIGN_MOCK_DELAY = float(os.environ.get('CAMPAIGN_MOCK_DELAY', 0.1)) # Seconds per send on the simulated provider
+    CAMPAIGN_RATE_LIMITS = { # Messages per second, per channel, shared across campaigns
+        'email': float(os.environ.get('CAMPAIGN_RATE_EMAIL', 50)),
+        'whatsapp': float(os.environ.get('CAMPAIGN_RATE_WHATSAPP', 20)),
+        'social': float(os.environ.get('CAMPAIGN_RATE_SOCIAL', 1)),
+    }
+    # Scheduled campaigns overdue by more than this are marked Expired instead of sent
+    CAMPAIGN_SCHEDULE_MAX_LATENESS_HOURS = int(os.environ.get('CAMPAIGN_SCHEDULE_MAX_LATENESS_HOURS', 24))
+    CAMPAIGN_DISPATCH_WORKERS = int(os.environ.get('CAMPAIGN_DISPATCH_WORKERS', 2)) # Campaigns sent at once per process
+    CAMPAIGN_HEARTBEAT_SECONDS = int(os.environ.get('CAMPAIGN_HEARTBEAT_SECONDS', 30))
+    CAMPAIGN_STALE_SECONDS = int(os.environ.get('CAMPAIGN_STALE_SECONDS', 300)) # No heartbeat for this long = crashed
+
+    # Drip email scheduler (scheduler.py)
+    DRIP_BATCH_SIZE = int(os.environ.get('DRIP_BATCH_SIZE', 1000))
+    DRIP_SMTP_CONNECTIONS = int(os.environ.get('DRIP_SMTP_CONNECTIONS', 4))
+    DRIP_TICK_SECONDS = int(os.environ.get('DRIP_TICK_SECONDS', 55)) # Stay inside the 1-minute job interval
+    DRIP_RETRY_MINUTES = int(os.environ.get('DRIP_RETRY_MINUTES', 15)) # Delay before resending a refused message
+
+    # WhatsApp webhook ingest queue
+    WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 200))
+    WEBHOOK_POLL_SECONDS = int(os.environ.get('WEBHOOK_POLL_SECONDS', 2))
+    WEBHOOK_CLAIM_TIMEOUT = int(os.environ.get('WEBHOOK_CLAIM_TIMEOUT', 300)) # Reclaim events a crashed worker left in 'processing'
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 5))
+
+    # Outbound message queue (agent replies to WhatsApp)
+    OUTBOUND_PROVIDER = os.environ.get('OUTBOUND_PROVIDER', 'stub') # stub (local, no network) / whatsapp
+    OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', 4)) # Parallel sends = pooled HTTP connections
+    OUTBOUND_BATCH_SIZE = int(os.environ.get('OUTBOUND_BATCH_SIZE', 100))
+    OUTBOUND_POLL_SECONDS = int(os.environ.get('OUTBOUND_POLL_SECONDS', 2))
+    OUTBOUND_MAX_ATTEMPTS = int(os.environ.get('OUTBOUND_MAX_ATTEMPTS', 5))
+    OUTBOUND_RETRY_BASE_SECONDS = int(os.environ.get('OUTBOUND_RETRY_BASE_SECONDS', 5)) # Doubles per attempt
+    OUTBOUND_RETRY_MAX_SECONDS = int(os.environ.get('OUTBOUND_RETRY_MAX_SECONDS', 900))
+    OUTBOUND_CLAIM_TIMEOUT = int(os.environ.get('OUTBOUND_CLAIM_TIMEOUT', 300))
+    OUTBOUND_RATE_PER_ACCOUNT = float(os.environ.get('OUTBOUND_RATE_PER_ACCOUNT', 20)) # Messages / second
+    OUTBOUND_RECEIPT_HOLD_SECONDS = int(os.environ.get('OUTBOUND_RECEIPT_HOLD_SECONDS', 86400)) # Keep unmatched receipts this long
+
+    # Realtime (Socket.IO) delivery
+    # Broker shared by all server processes, e.g. redis://localhost:6379/0 (unset = single process)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    REALTIME_BUS = os.environ.get('REALTIME_BUS', 'inprocess') # inprocess / broker
+    REALTIME_FLUSH_MS = int(os.environ.get('REALTIME_FLUSH_MS', 200)) # Batch window for coalescing events
+    REALTIME_MAX_BATCH = int(os.environ.get('REALTIME_MAX_BATCH', 500))
+
+    # Write-behind activity/audit logging (services/log_buffer.py)
+    LOG_BUFFER_ENABLED = os.environ.get('LOG_BUFFER_ENABLED', 'true').lower() in ['true', 'on', '1']
+    LOG_FLUSH_SIZE = int(os.environ.get('LOG_FLUSH_SIZE', 200))
+    LOG_FLUSH_INTERVAL_MS = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', 1000))
+    LOG_BUFFER_MAX_SIZE = int(os.environ.get('LOG_BUFFER_MAX_SIZE', 10000)) # Full buffer flushes inline
+
+    # Automation rules (services/automation_engine.py); 0 runs rules inline in the caller
+    AUTOMATION_WORKERS = int(os.environ.get('AUTOMATION_WORKERS', 4))
+
+    # Per-org reference data cache (services/reference_cache.py)
+    REFERENCE_CACHE_BACKEND = os.environ.get('REFERENCE_CACHE_BACKEND', 'database') # database (shared by all processes) / local
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 300))
+    REFERENCE_CACHE_MAX_SIZE = int(os.environ.get('REFERENCE_CACHE_MAX_SIZE', 10000))
+    REFERENCE_CACHE_POLL_MS = int(os.environ.get('REFERENCE_CACHE_POLL_MS', 2000)) # How often other processes' invalidations are picked up
+
     # Flask-Mail configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -26,6 +26,9 @@ class DripStep(db.Model):
 
 class DripEnrollment(db.Model):
     __tablename__ = 'drip_enrollments'
+    __table_args__ = (
+        db.Index('ix_drip_enrollments_status_next_send', 'status', 'next_send_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     campaign_id = db.Column(db.Integer, db.ForeignKey('drip_campaigns.id'), nullable=False)
     lead_id = db.Column(db.Integer, db.ForeignKey('leads.id'), nullable=False)
@@ -0,0 +1,193 @@
+"""
+Runs EXPLAIN on the hot dashboard, inbox, scheduler and list queries and flags
+full table scans and per-query sorts (SQLite "USE TEMP B-TREE", MySQL "Using
+filesort"). The list and inbox pages are built by the same code the endpoints
+run (build_list_query / inbox_page_query).
+
+    python explain_queries.py            # against DATABASE_URL (MySQL or SQLite)
+    python explain_queries.py --seed 500 # first add 500 synthetic rows per table
+
+Exits with status 1 when any query is flagged, so it can gate a deploy.
+Use --seed only on a scratch database.
+"""
+import sys
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, text
+from werkzeug.datastructures import MultiDict
+from app import app
+from extensions import db
+from models.crm import Lead, Deal
+from models.contact import Contact
+from models.ticket import Ticket
+from models.activity_log import ActivityLog
+from models.conversation import Conversation
+from models.message import Message
+from models.reminder import Reminder
+from models.webhook_event import WebhookEvent
+from models.outbound_message import OutboundMessage
+from drip_campaign import DripEnrollment
+from routes.lead_routes import LEAD_LIST, lead_list_filters
+from routes.deal_routes import DEAL_LIST, deal_list_filters
+from routes.contact_routes import CONTACT_LIST, contact_list_filters
+from services.list_query import build_list_query, _encode_cursor
+from services.inbox_service import inbox_page_query
+from services.identity_cache import Identity
+
+ORG_ID = 1
+
+# Who the inbox pages are planned for (agents only see their assigned conversations)
+MANAGER = Identity(1, 'MANAGER', ORG_ID, None, False, 0)
+AGENT = Identity(2, 'AGENT', ORG_ID, None, False, 0)
+
+
+def list_page(spec, filters, **args):
+    """The page statement the list endpoint runs for these query args."""
+    return build_list_query(spec, filters(ORG_ID), MultiDict(args))[0]
+
+
+def _cursor(last_id):
+    """X-Next-Cursor of a page (default id sort) ending at last_id."""
+    return _encode_cursor(last_id, last_id)
+
+
+def hot_queries():
+    """(name, statement) for the access paths that run on every page load or scheduler tick."""
+    now = datetime.utcnow()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return [
+        # List APIs (services/list_query.py), default sort and the second page
+        ("leads list page", list_page(LEAD_LIST, lead_list_filters, limit=100)),
+        ("leads list next page", list_page(LEAD_LIST, lead_list_filters, cursor=_cursor(500))),
+        ("deals list page", list_page(DEAL_LIST, deal_list_filters, limit=100)),
+        ("contacts list page", list_page(CONTACT_LIST, contact_list_filters, limit=100)),
+        ("deals by pipeline/stage", select(Deal.id)
+            .where(Deal.organization_id == ORG_ID, Deal.pipeline == 'Sales', Deal.stage == 'Won')),
+
+        # Dashboard
+        ("dashboard leads this month", select(func.count(Lead.id))
+            .where(Lead.organization_id == ORG_ID, Lead.is_deleted == False, Lead.created_at >= month_start)),
+        ("dashboard leads by status", select(Lead.status, func.count(Lead.id))
+            .where(Lead.organization_id == ORG_ID).group_by(Lead.status)),
+        ("dashboard deals this month", select(func.sum(Deal.value))
+            .where(Deal.organization_id == ORG_ID, Deal.created_at >= month_start)),
+        ("open tickets", select(Ticket.id)
+            .where(Ticket.organization_id == ORG_ID, Ticket.status == 'Open')
+            .order_by(Ticket.created_at.desc()).limit(50)),
+        ("activity feed", select(ActivityLog.id, ActivityLog.description)
+            .where(ActivityLog.company_id == ORG_ID)
+            .order_by(ActivityLog.created_at.desc()).limit(50)),
+
+        # Inbox
+        ("inbox page", inbox_page_query(MANAGER, 51)),
+        ("inbox next page", inbox_page_query(MANAGER, 51, after=(now, 500))),
+        ("inbox page (agent)", inbox_page_query(AGENT, 51)),
+        ("inbox never-messaged phase", inbox_page_query(MANAGER, 51, after=(None, 500), never_messaged=True)),
+        ("message history page", select(Message.id, Message.content)
+            .where(Message.conversation_id == 1)
+            .order_by(Message.created_at.desc(), Message.id.desc()).limit(51)),
+        ("lead by phone", select(Lead.id)
+            .where(Lead.organization_id == ORG_ID, Lead.phone_normalized == '+919876543210')),
+
+        # Schedulers / workers
+        ("drip due enrollments", select(DripEnrollment.id)
+            .where(DripEnrollment.status == 'active', DripEnrollment.next_send_at <= now)
+            .order_by(DripEnrollment.next_send_at).limit(1000)),
+        ("due reminders", select(Reminder.id)
+            .where(Reminder.is_sent == False, Reminder.remind_at <= now)
+            .order_by(Reminder.remind_at)),
+        ("webhook queue claim", select(WebhookEvent.id)
+            .where(WebhookEvent.status == 'pending').order_by(WebhookEvent.id).limit(200)),
+        ("outbound queue claim", select(OutboundMessage.id)
+            .where(OutboundMessage.status == 'pending', OutboundMessage.next_attempt_at <= now)
+            .order_by(OutboundMessage.next_attempt_at).limit(100)),
+    ]
+
+
+def explain(stmt):
+    """Returns (plan lines, problem): problem is 'FULL SCAN', 'SORT' or None."""
+    dialect = db.engine.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        lines = [row[-1] for row in rows]
+        # "SCAN leads" is a full scan; "SCAN leads USING INDEX ..." / "SEARCH ..." are not
+        if any(line.startswith('SCAN ') and 'USING' not in line for line in lines):
+            return lines, 'FULL SCAN'
+        if any('USE TEMP B-TREE' in line for line in lines):
+            return lines, 'SORT'
+        return lines, None
+
+    rows = db.session.execute(text(f"EXPLAIN {sql}")).mappings().all()
+    lines = [f"{r.get('table')}: type={r.get('type')} key={r.get('key')} rows={r.get('rows')} {r.get('Extra') or ''}"
+             for r in rows]
+    if any(r.get('type') == 'ALL' for r in rows):
+        return lines, 'FULL SCAN'
+    if any('Using filesort' in (r.get('Extra') or '') for r in rows):
+        return lines, 'SORT'
+    return lines, None
+
+
+def seed(count):
+    """Synthetic rows so the planner has something to choose between (scratch databases only)."""
+    now = datetime.utcnow()
+    db.session.execute(Lead.__table__.insert(), [{
+        "name": f"Lead {i}", "organization_id": (i % 5) + 1, "status": 'new' if i % 3 else 'hot',
+        "is_deleted": False, "created_at": now - timedelta(days=i % 90), "phone_normalized": f"+91{9000000000 + i}"
+    } for i in range(count)])
+    db.session.execute(Deal.__table__.insert(), [{
+        "title": f"Deal {i}", "organization_id": (i % 5) + 1, "pipeline": 'Sales', "stage": 'Won' if i % 4 else 'Lost',
+        "value": i * 10, "is_deleted": False, "created_at": now - timedelta(days=i % 90)
+    } for i in range(count)])
+    db.session.execute(Contact.__table__.insert(), [{
+        "name": f"Contact {i}", "email": f"c{i}@example.com", "organization_id": (i % 5) + 1, "is_deleted": False
+    } for i in range(count)])
+    db.session.execute(ActivityLog.__table__.insert(), [{
+        "module": 'lead', "action": 'created', "user_id": 1, "company_id": (i % 5) + 1,
+        "created_at": now - timedelta(minutes=i)
+    } for i in range(count)])
+    db.session.execute(Conversation.__table__.insert(), [{
+        "organization_id": (i % 5) + 1, "channel": 'whatsapp', "assigned_to": (i % 2) + 1,
+        "last_message_at": None if i % 10 == 0 else now - timedelta(minutes=i)
+    } for i in range(count)])
+    db.session.commit()
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text("ANALYZE"))
+    print(f"[OK] Seeded {count} rows into leads, deals, contacts, activity_logs and conversations.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help="insert N synthetic rows per table first")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.seed:
+            seed(args.seed)
+
+        flagged = []
+        for name, stmt in hot_queries():
+            try:
+                lines, problem = explain(stmt)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[WARN] {name}: could not EXPLAIN ({e})")
+                continue
+            status = f"[FAIL] {problem}" if problem else "[OK]"
+            print(f"{status} {name}")
+            for line in lines:
+                print(f"       {line}")
+            if problem:
+                flagged.append(name)
+
+        print()
+        if flagged:
+            print(f"[FAIL] {len(flagged)} quer{'y' if len(flagged) == 1 else 'ies'} with full scans or sorts: {', '.join(flagged)}")
+            return 1
+        print("[OK] No full scans or sorts.")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Add composite indexes for the multi-tenant hot query paths
+
+Revision ID: 5d2c8e1f7a90
+Revises: 0b7efb7cca65
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d2c8e1f7a90'
+down_revision = '0b7efb7cca65'
+branch_labels = None
+depends_on = None
+
+
+# (index name, table, columns, partial-index predicate or None)
+# SQLite only uses a partial index when the query's WHERE matches the predicate
+# textually, and SQLAlchemy renders False as 0 there.
+# Leading organization_id/company_id keeps each tenant's rows together; the
+# trailing column serves the ORDER BY / range of the query listed next to it.
+INDEXES = [
+    # GET /api/leads keyset pages (WHERE org AND NOT is_deleted ORDER BY id)
+    ('ix_leads_org_deleted_id', 'leads', ['organization_id', 'is_deleted', 'id'], None),
+    # Dashboard / report ranges (WHERE org AND NOT is_deleted AND created_at >= ?)
+    ('ix_leads_org_deleted_created', 'leads', ['organization_id', 'is_deleted', 'created_at'], None),
+    ('ix_leads_org_status', 'leads', ['organization_id', 'status'], None),
+
+    ('ix_deals_org_deleted_id', 'deals', ['organization_id', 'is_deleted', 'id'], None),
+    ('ix_deals_org_pipeline_stage', 'deals', ['organization_id', 'pipeline', 'stage'], None),
+    ('ix_deals_org_created', 'deals', ['organization_id', 'created_at'], None),
+
+    ('ix_contacts_org_deleted_id', 'contacts', ['organization_id', 'is_deleted', 'id'], None),
+
+    ('ix_tickets_org_status_created', 'tickets', ['organization_id', 'status', 'created_at'], None),
+    ('ix_tickets_assigned_status', 'tickets', ['assigned_to', 'status'], None),
+
+    # Activity feed (WHERE company_id ORDER BY created_at DESC)
+    ('ix_activity_logs_company_created', 'activity_logs', ['company_id', 'created_at'], None),
+
+    # Due reminders. Partial where the database supports it (SQLite/PostgreSQL);
+    # MySQL has no partial indexes and gets the full composite
+    ('ix_reminders_due', 'reminders', ['is_sent', 'remind_at'], 'is_sent = 0'),
+]
+
+# Already created by app.py's auto-migrations on running deployments; created here
+# if missing so a migrated database has the full plan, but never dropped by downgrade
+SHARED_INDEXES = [
+    ('ix_leads_org_phone_normalized', 'leads', ['organization_id', 'phone_normalized'], None),
+    ('ix_conversations_org_last_message', 'conversations', ['organization_id', 'last_message_at', 'id'], None),
+    ('ix_messages_conversation_created', 'messages', ['conversation_id', 'created_at', 'id'], None),
+    ('ix_drip_enrollments_status_next_send', 'drip_enrollments', ['status', 'next_send_at'], None),
+]
+
+
+def _existing_indexes(table):
+    try:
+        return {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+    except sa.exc.NoSuchTableError:
+        return None
+
+
+def upgrade():
+    # db.create_all() builds these from the models on fresh databases: skip existing ones
+    for name, table, columns, where in INDEXES + SHARED_INDEXES:
+        existing = _existing_indexes(table)
+        if existing is None or name in existing:
+            continue
+        kwargs = {}
+        if where:
+            kwargs = {'sqlite_where': sa.text(where), 'postgresql_where': sa.text(where.replace('= 0', '= false'))}
+        op.create_index(name, table, columns, unique=False, **kwargs)
+
+
+def downgrade():
+    for name, table, columns, where in reversed(INDEXES):
+        existing = _existing_indexes(table)
+        if existing and name in existing:
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,27 @@
+"""Backfill deals.is_deleted so the deal list can use ix_deals_org_deleted_id
+
+Revision ID: 9a1f3c5e7b20
+Revises: 5d2c8e1f7a90
+Create Date: 2026-10-18 16:40:12.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9a1f3c5e7b20'
+down_revision = '5d2c8e1f7a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows from before the soft-delete column had a default. With them set, the
+    # deal list filters on is_deleted = false alone instead of "= false OR IS NULL",
+    # which no index can serve in id order
+    deals = sa.table('deals', sa.column('is_deleted', sa.Boolean))
+    op.execute(deals.update().where(deals.c.is_deleted.is_(None)).values(is_deleted=False))
+
+
+def downgrade():
+    pass # NULL and false both meant "not deleted"
@@ -0,0 +1,37 @@
+"""Index messages.whatsapp_message_id and backfill conversations.organization_id
+
+Revision ID: b4e7d2a9c1f3
+Revises: 9a1f3c5e7b20
+Create Date: 2026-10-18 18:05:47.302914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b4e7d2a9c1f3'
+down_revision = '9a1f3c5e7b20'
+branch_labels = None
+depends_on = None
+
+
+def _has_index(table, name):
+    return name in {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # wamid dedup on ingest and delivery receipts look messages up by this column
+    if not _has_index('messages', 'ix_messages_whatsapp_message_id'):
+        op.create_index('ix_messages_whatsapp_message_id', 'messages', ['whatsapp_message_id'], unique=False)
+
+    # Conversations from before organization_id existed take their lead's org
+    op.execute(
+        "UPDATE conversations SET organization_id = "
+        "(SELECT organization_id FROM leads WHERE leads.id = conversations.lead_id) "
+        "WHERE organization_id IS NULL AND lead_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    if _has_index('messages', 'ix_messages_whatsapp_message_id'):
+        op.drop_index('ix_messages_whatsapp_message_id', table_name='messages')
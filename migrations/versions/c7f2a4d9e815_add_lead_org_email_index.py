@@ -0,0 +1,30 @@
+"""Index leads (organization_id, email) for import de-duplication
+
+Revision ID: c7f2a4d9e815
+Revises: b4e7d2a9c1f3
+Create Date: 2026-10-18 19:12:33.640218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c7f2a4d9e815'
+down_revision = 'b4e7d2a9c1f3'
+branch_labels = None
+depends_on = None
+
+
+def _has_index(table, name):
+    return name in {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # Every import chunk checks its emails with one IN query scoped to the org
+    if not _has_index('leads', 'ix_leads_org_email'):
+        op.create_index('ix_leads_org_email', 'leads', ['organization_id', 'email'], unique=False)
+
+
+def downgrade():
+    if _has_index('leads', 'ix_leads_org_email'):
+        op.drop_index('ix_leads_org_email', table_name='leads')
@@ -0,0 +1,30 @@
+"""Add campaigns.heartbeat_at (lease for Running campaigns)
+
+Revision ID: e3a9c6b1d472
+Revises: c7f2a4d9e815
+Create Date: 2026-10-18 19:48:05.517392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c6b1d472'
+down_revision = 'c7f2a4d9e815'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, name):
+    return name in {col['name'] for col in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # Refreshed while a campaign sends; dispatch takes over Running campaigns whose heartbeat went stale
+    if not _has_column('campaigns', 'heartbeat_at'):
+        op.add_column('campaigns', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    if _has_column('campaigns', 'heartbeat_at'):
+        op.drop_column('campaigns', 'heartbeat_at')
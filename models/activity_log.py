@@ -3,6 +3,9 @@ from datetime import datetime
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
+    __table_args__ = (
+        db.Index('ix_activity_logs_company_created', 'company_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     module = db.Column(db.String(50), nullable=False)
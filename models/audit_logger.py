@@ -1,21 +1,20 @@
+from datetime import datetime
 from flask import request
-from extensions import db
-from models.audit_log import AuditLog
 
 def create_audit_log(user_name, module, action, record_name):
+    """Buffered like log_activity (services/log_buffer.py): no commit on the caller's session."""
+    from services.log_buffer import audit_logs, write_log
     try:
         # Attempt to get IP from request, fallback if outside request context
         ip_address = request.remote_addr if request else "System"
     except RuntimeError:
         ip_address = "System"
 
-    log = AuditLog(
-        user_name=user_name,
-        module=module,
-        action=action,
-        record_name=record_name,
-        ip_address=ip_address
-    )
-
-    db.session.add(log)
-    db.session.commit()
\ No newline at end of file
+    write_log(audit_logs, {
+        "user_name": user_name,
+        "module": module,
+        "action": action,
+        "record_name": record_name,
+        "ip_address": ip_address,
+        "created_at": datetime.utcnow()
+    })
\ No newline at end of file
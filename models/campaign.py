@@ -22,6 +22,7 @@ class Campaign(db.Model):
     spent = db.Column(db.Float, default=0.0)
     revenue = db.Column(db.Float, default=0.0)
     scheduled_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True) # Refreshed while Running; a stale one is taken over
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
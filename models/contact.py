@@ -3,6 +3,9 @@ from datetime import datetime
 
 class Contact(db.Model):
     __tablename__ = "contacts"
+    __table_args__ = (
+        db.Index("ix_contacts_org_deleted_id", "organization_id", "is_deleted", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
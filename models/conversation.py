@@ -3,10 +3,21 @@ from datetime import datetime
 
 class Conversation(db.Model):
     __tablename__ = "conversations"
+    __table_args__ = (
+        db.Index('ix_conversations_org_last_message', 'organization_id', 'last_message_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     lead_id = db.Column(db.Integer, nullable=True)
     channel = db.Column(db.String(50))   # whatsapp, email, instagram
     assigned_to = db.Column(db.Integer, nullable=True)
     status = db.Column(db.String(20), default="open")
+    organization_id = db.Column(db.Integer, nullable=True, index=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+
+    # Inbox projection, maintained on every message write (services/inbox_service.py)
+    last_message_preview = db.Column(db.String(255), nullable=True)
+    last_sender_type = db.Column(db.String(20), nullable=True) # agent / customer / system
+    lead_name = db.Column(db.String(100), nullable=True)
+    inbound_count = db.Column(db.Integer, default=0, nullable=False) # Customer messages ever received
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
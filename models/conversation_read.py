@@ -0,0 +1,14 @@
+from extensions import db
+from datetime import datetime
+
+class ConversationRead(db.Model):
+    """
+    Per-agent read marker. Unread for an agent = conversations.inbound_count
+    minus read_inbound_count (0 when the agent never opened the conversation).
+    """
+    __tablename__ = "conversation_reads"
+
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversations.id"), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    read_inbound_count = db.Column(db.Integer, default=0, nullable=False)
+    read_at = db.Column(db.DateTime, default=datetime.utcnow)
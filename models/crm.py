@@ -1,12 +1,22 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy import event
+from services.phone_service import normalize_phone
 
 class Lead(db.Model):
     __tablename__ = 'leads'
+    __table_args__ = (
+        db.Index('ix_leads_org_phone_normalized', 'organization_id', 'phone_normalized'),
+        db.Index('ix_leads_org_deleted_id', 'organization_id', 'is_deleted', 'id'),
+        db.Index('ix_leads_org_deleted_created', 'organization_id', 'is_deleted', 'created_at'),
+        db.Index('ix_leads_org_status', 'organization_id', 'status'),
+        db.Index('ix_leads_org_email', 'organization_id', 'email'), # Import de-duplication
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     email = db.Column(db.String(120))
     phone = db.Column(db.String(20))
+    phone_normalized = db.Column(db.String(32)) # E.164 lookup key, maintained on insert/update
     city = db.Column(db.String(100))
     state = db.Column(db.String(100))
     country = db.Column(db.String(100))
@@ -38,9 +48,19 @@ class Lead(db.Model):
                 d[c.name] = val
         return d
 
+@event.listens_for(Lead, 'before_insert')
+@event.listens_for(Lead, 'before_update')
+def _normalize_lead_phone(mapper, connection, target):
+    target.phone_normalized = normalize_phone(target.phone)
+
 # Keeping other models to avoid breaking imports
 class Deal(db.Model):
     __tablename__ = 'deals'
+    __table_args__ = (
+        db.Index('ix_deals_org_deleted_id', 'organization_id', 'is_deleted', 'id'),
+        db.Index('ix_deals_org_pipeline_stage', 'organization_id', 'pipeline', 'stage'),
+        db.Index('ix_deals_org_created', 'organization_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     lead_id = db.Column(db.Integer, db.ForeignKey('leads.id'))
     pipeline = db.Column(db.String(50))
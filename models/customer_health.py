@@ -11,4 +11,22 @@ class CustomerHealth(db.Model):
     trend = db.Column(db.Float, default=0.0)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    contact = db.relationship('Contact', backref='health_metrics')
\ No newline at end of file
+    contact = db.relationship('Contact', backref='health_metrics')
+
+class CustomerHealthSnapshot(db.Model):
+    """
+    Latest health score per contact, written in bulk by
+    services/customer_health_service.py and read by the dashboard.
+    """
+    __tablename__ = 'customer_health_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('contacts.id'), unique=True, nullable=False)
+    organization_id = db.Column(db.Integer, index=True)
+    nps = db.Column(db.Float, default=0.0)
+    open_tickets = db.Column(db.Integer, default=0)
+    sla_breaches = db.Column(db.Integer, default=0)
+    health_score = db.Column(db.Integer)
+    health_status = db.Column(db.String(50))
+    trend = db.Column(db.Float, default=0.0)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
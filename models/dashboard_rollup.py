@@ -0,0 +1,23 @@
+from extensions import db
+from datetime import datetime
+
+class DashboardRollup(db.Model):
+    """
+    Daily per-organization aggregate used by the dashboard widgets.
+    One row per (organization, day, metric, dimension), e.g.
+    ('leads_by_status', 'Converted') -> count of leads created that day.
+    """
+    __tablename__ = 'dashboard_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, nullable=False)
+    bucket_date = db.Column(db.Date, nullable=True) # created / close / due date depending on metric
+    metric = db.Column(db.String(50), nullable=False)
+    dimension = db.Column(db.String(100), nullable=True) # status / source / stage / pipeline
+    count = db.Column(db.Integer, default=0)
+    total = db.Column(db.Float, default=0.0) # SUM(value) for deal metrics
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_dashboard_rollups_org_metric', 'organization_id', 'metric', 'bucket_date'),
+    )
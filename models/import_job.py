@@ -0,0 +1,48 @@
+from extensions import db
+from datetime import datetime
+import json
+
+class ImportJob(db.Model):
+    """
+    Background lead/contact import. checkpoint_offset is the number of data rows
+    already committed, so an interrupted job resumes from there.
+    """
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    module = db.Column(db.String(50), nullable=False) # leads / contacts
+    filename = db.Column(db.String(255))
+    file_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), default='queued') # queued, running, completed, failed
+
+    checkpoint_offset = db.Column(db.Integer, default=0)
+    imported = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text(length=2**32 - 1)) # JSON list of {"row", "reason"}; LONGTEXT on MySQL (one entry per failed row)
+    error_message = db.Column(db.Text, nullable=True)
+    rows_per_sec = db.Column(db.Float, default=0.0)
+
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True) # Refreshed on every checkpoint
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "module": self.module,
+            "filename": self.filename,
+            "status": self.status,
+            "rows_done": self.checkpoint_offset or 0,
+            "imported": self.imported or 0,
+            "failed": self.failed or 0,
+            "rows_per_sec": round(self.rows_per_sec or 0, 1),
+            "errors": json.loads(self.errors) if self.errors else [],
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
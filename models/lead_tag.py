@@ -0,0 +1,16 @@
+from extensions import db
+from datetime import datetime
+
+class LeadTag(db.Model):
+    """Free-form label on a lead; used by campaign audiences ({"tag": "..."})."""
+    __tablename__ = 'lead_tags'
+    __table_args__ = (
+        db.UniqueConstraint('lead_id', 'tag', name='uq_lead_tags_lead_tag'),
+        db.Index('ix_lead_tags_org_tag_lead', 'organization_id', 'tag', 'lead_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    lead_id = db.Column(db.Integer, db.ForeignKey('leads.id', ondelete='CASCADE'), nullable=False)
+    tag = db.Column(db.String(50), nullable=False)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organizations.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -4,6 +4,10 @@ from datetime import datetime
 
 class Message(db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        # History paging: WHERE conversation_id = ? ORDER BY created_at DESC, id DESC
+        db.Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
@@ -29,7 +33,23 @@ class Message(db.Model):
     channel = db.Column(db.String(50))  
     # whatsapp / email / instagram
 
+    whatsapp_message_id = db.Column(db.String(255), nullable=True, index=True)
+    # wamid from Meta; de-duplicates webhook retries and matches status receipts
+
     created_at = db.Column(
         db.DateTime,
         default=datetime.utcnow
-    )
\ No newline at end of file
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "conversation_id": self.conversation_id,
+            "sender_type": self.sender_type,
+            "sender_id": self.sender_id,
+            "content": self.content,
+            "status": self.status,
+            "channel": self.channel,
+            "whatsapp_message_id": self.whatsapp_message_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
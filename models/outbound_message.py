@@ -0,0 +1,41 @@
+from extensions import db
+from datetime import datetime
+
+class OutboundMessage(db.Model):
+    """
+    Dispatch queue for agent messages to external providers. The send endpoint only
+    stores the Message (status 'sending') and a row here; services/outbound_service.py
+    delivers it and writes the result back to the Message.
+    """
+    __tablename__ = 'outbound_messages'
+    __table_args__ = (
+        db.Index('ix_outbound_messages_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=False)
+    organization_id = db.Column(db.Integer, nullable=False)
+    channel = db.Column(db.String(50), nullable=False) # whatsapp
+    to_phone = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False) # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+
+class PendingReceipt(db.Model):
+    """
+    A delivery receipt whose wamid matched no message yet: the webhook can beat the
+    outbound worker's commit of the wamid. Applied and deleted when that commit
+    happens; receipts still unmatched after OUTBOUND_RECEIPT_HOLD_SECONDS (messages
+    sent outside the CRM) are purged.
+    """
+    __tablename__ = 'pending_receipts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    wamid = db.Column(db.String(255), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,15 @@
+from extensions import db
+from datetime import datetime
+
+class ReferenceCacheVersion(db.Model):
+    """
+    Invalidation log shared by every server process: a bump here tells the other
+    processes to drop their cached copy; see services/reference_cache.py.
+    organization_id -1 means every organization's copy of the entity.
+    """
+    __tablename__ = 'reference_cache_versions'
+
+    organization_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
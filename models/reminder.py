@@ -3,6 +3,11 @@ from extensions import db
 
 class Reminder(db.Model):
     __tablename__ = "reminders"
+    __table_args__ = (
+        # Partial on SQLite/PostgreSQL: only unsent reminders are indexed
+        db.Index("ix_reminders_due", "is_sent", "remind_at",
+                 sqlite_where=db.text("is_sent = 0"), postgresql_where=db.text("is_sent = false")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('calendar_events.id'), nullable=False)
@@ -0,0 +1,14 @@
+from extensions import db
+from datetime import datetime
+
+class SchedulerLease(db.Model):
+    """
+    Named lease for singleton background jobs. Whichever process holds an
+    unexpired lease owns that job's current run; see services/job_lease.py.
+    """
+    __tablename__ = 'scheduler_leases'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(255), nullable=False) # hostname:pid
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
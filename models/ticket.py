@@ -3,6 +3,10 @@ from datetime import datetime
 
 class Ticket(db.Model):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        db.Index('ix_tickets_org_status_created', 'organization_id', 'status', 'created_at'),
+        db.Index('ix_tickets_assigned_status', 'assigned_to', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     ticket_number = db.Column(db.String(50), unique=True)
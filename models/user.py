@@ -27,6 +27,7 @@ class User(db.Model):
     invite_expiry = db.Column(db.DateTime)
 
     is_deleted = db.Column(db.Boolean, default=False)
+    token_version = db.Column(db.Integer, default=0) # Bump to revoke every token issued before (claim "tv")
 
     # New field from user request
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=True)
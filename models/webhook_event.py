@@ -0,0 +1,22 @@
+from extensions import db
+from datetime import datetime
+
+class WebhookEvent(db.Model):
+    """
+    Durable ingest queue for inbound webhooks. The HTTP handler only appends the
+    raw body here; services/webhook_ingest_service.py drains it.
+    """
+    __tablename__ = 'webhook_events'
+    __table_args__ = (
+        db.Index('ix_webhook_events_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False) # whatsapp
+    payload = db.Column(db.Text, nullable=False) # Raw request body
+    status = db.Column(db.String(20), default='pending', nullable=False) # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    error_message = db.Column(db.Text, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    processed_at = db.Column(db.DateTime, nullable=True)
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, g
 from flask_cors import cross_origin
 from extensions import db
 from models.user import User, LoginHistory
@@ -6,7 +6,8 @@ from models.organization import Organization
 from models.otp_verification import OtpVerification
 from models.password_reset import PasswordResetToken
 from models.pipeline import Pipeline, PipelineStage
-from flask_jwt_extended import create_access_token, verify_jwt_in_request, get_jwt_identity
+from services.identity_cache import get_identity, CurrentUser
+from flask_jwt_extended import create_access_token, verify_jwt_in_request, get_jwt
 from werkzeug.security import generate_password_hash, check_password_hash
 import datetime
 from flask import Blueprint, request, jsonify
@@ -95,12 +96,20 @@ def token_required(f):
             return "", 200
 
         try:
-            verify_jwt_in_request()
-            user_id = get_jwt_identity()
-            current_user = User.query.get(int(user_id))
-            if not current_user:
+            # load_user_context_from_token (app.py) has already verified the JWT for this request
+            if getattr(g, 'user_id', None) is None:
+                verify_jwt_in_request()
+            claims = get_jwt()
+            user_id = int(claims.get('sub'))
+            identity = get_identity(user_id) # Cached; no query on most requests
+            if not identity:
                 print(f"[FAIL] Auth Error: User ID {user_id} not found in database.")
                 return jsonify({"error": "Unauthorized", "message": "User not found"}), 401
+            if identity.is_deleted:
+                return jsonify({"error": "Unauthorized", "message": "User has been deleted"}), 401
+            if claims.get('tv', 0) < identity.token_version:
+                return jsonify({"error": "Unauthorized", "message": "Token has been revoked, please log in again"}), 401
+            current_user = CurrentUser(identity)
 
         except Exception as e:
             print(f"[FAIL] Auth Error: Token verification failed. {str(e)}")
@@ -384,7 +393,8 @@ def login():
         additional_claims={
             "email": user.email, 
             "role": user.role,
-            "organization_id": user.organization_id
+            "organization_id": user.organization_id,
+            "tv": user.token_version or 0
         }
     )
 
@@ -519,7 +529,8 @@ def handle_oauth_login(email, name, provider, provider_id):
             additional_claims={
                 "email": user.email, 
                 "role": user.role,
-                "organization_id": user.organization_id
+                "organization_id": user.organization_id,
+                "tv": user.token_version or 0
             }
         )
 
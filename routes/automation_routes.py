@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.automation import AutomationRule
 from routes.auth_routes import token_required
+from services.automation_engine import validate_rule, invalidate_rules, RuleError
 from extensions import db
 import json
 
@@ -51,9 +52,15 @@ def create_rule(current_user):
         status=data.get("status", "active")
     )
 
+    try:
+        validate_rule(new_rule)
+    except RuleError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
         db.session.add(new_rule)
         db.session.commit()
+        invalidate_rules(current_user.organization_id)
         return jsonify({
             "success": True,
             "message": "Rule created successfully"
@@ -7,31 +7,11 @@ from models.user import User
 import os
 import requests
 from routes.auth_routes import token_required
+from services.phone_service import format_number
 from datetime import datetime
 
 call_bp = Blueprint('call_bp', __name__)
 
-def format_number(num):
-    """Formats number to E.164 format, e.g., +919876543210"""
-    if not num:
-        return None
-    # Remove common characters except '+'
-    num = str(num).strip().replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
-    
-    if num.startswith('+'):
-        return num
-        
-    # If it's a 10-digit Indian number, add +91
-    if len(num) == 10 and num.isdigit():
-        return "+91" + num
-        
-    # If it's a 12-digit Indian number (91...), add +
-    if len(num) == 12 and num.startswith('91') and num.isdigit():
-        return "+" + num
-        
-    # Fallback: return the cleaned number, Twilio might handle it.
-    return num
-
 @call_bp.route("/call-lead/<int:lead_id>", methods=["POST"])
 @token_required
 def call_lead(current_user, lead_id):
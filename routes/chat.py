@@ -25,7 +25,7 @@ def send_message(current_user):
     db.session.add(user_msg)
 
     # Process assistant reply
-    reply_text = process_message(message)
+    reply_text = process_message(message, organization_id=current_user.organization_id)
 
     # Save bot reply
     bot_msg = ChatMessage(
@@ -4,9 +4,43 @@ from models.contact import Contact
 from extensions import db
 from sqlalchemy import text
 from datetime import datetime
+from services.list_query import ListSpec, ListField, ListFilter, run_list_query
 
 contact_bp = Blueprint('contacts', __name__)
 
+CONTACT_LIST = ListSpec(
+    key_column=Contact.id,
+    fields=[
+        ListField("id", Contact.id),
+        ListField("name", Contact.name),
+        ListField("company", Contact.company),
+        ListField("email", Contact.email),
+        ListField("phone", Contact.phone),
+        ListField("owner", Contact.owner),
+        ListField("lastContact", Contact.last_contact),
+        ListField("status", Contact.status),
+        ListField("tag", Contact.status), # Mapping status to tag for frontend compatibility
+        ListField("plan_type", Contact.plan_type),
+    ],
+    default_fields=["id", "name", "company", "email", "phone", "owner", "lastContact", "status", "tag"],
+    filters=[
+        ListFilter('status', Contact.status),
+        ListFilter('owner', Contact.owner),
+        ListFilter('plan_type', Contact.plan_type),
+        ListFilter('name', Contact.name, 'like'),
+        ListFilter('email', Contact.email, 'like'),
+        ListFilter('company', Contact.company, 'like'),
+    ],
+    sorts={'id': Contact.id, 'name': Contact.name}
+)
+
+def contact_list_filters(organization_id):
+    """The org scope every contact list query starts from."""
+    return [
+        Contact.organization_id == organization_id,
+        Contact.is_deleted == False
+    ]
+
 # --- Helper for backward compatibility ---
 def get_contact_query(current_user):
     return Contact.query
@@ -37,22 +71,15 @@ def create_contact(current_user):
 @contact_bp.route('/api/contacts', methods=['GET'])
 @token_required
 def get_contacts(current_user):
-    contacts = Contact.query.filter_by(
-        organization_id=current_user.organization_id,
-        is_deleted=False
-    ).order_by(Contact.id.desc()).all()
-    
-    return jsonify([{
-        "id": c.id,
-        "name": c.name,
-        "company": c.company,
-        "email": c.email,
-        "phone": c.phone,
-        "owner": c.owner,
-        "lastContact": c.last_contact,
-        "status": c.status,
-        "tag": c.status  # Mapping status to tag for frontend compatibility
-    } for c in contacts])
+    # Paged/filtered/sparse list, see CONTACT_LIST and services/list_query.py
+    try:
+        contacts, headers = run_list_query(CONTACT_LIST, contact_list_filters(current_user.organization_id), request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(contacts)
+    response.headers.update(headers)
+    return response
 
 # 👤 3. Get Contact Profile
 @contact_bp.route('/api/contacts/<int:contact_id>', methods=['GET'])
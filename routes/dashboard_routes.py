@@ -2,7 +2,7 @@ from flask import Blueprint, jsonify, request
 from routes.auth_routes import token_required, send_email
 from models.user import User, LoginHistory
 from models.organization import Organization
-from models.crm import Lead, Deal, Activity
+from models.crm import Lead, Deal
 from models.campaign import Campaign
 from models.task import Task
 from extensions import db
@@ -12,7 +12,10 @@ from werkzeug.security import generate_password_hash
 from models.attendance import Attendance
 from models.activity_log import ActivityLog
 from models.activity_logger import log_activity
-from sqlalchemy import extract
+from services.rollup_service import get_rollups
+from services.identity_cache import invalidate_identity
+from services.metrics_engine import compute_metrics, count_if, sum_if
+from services.time_buckets import time_series
 import re
 import calendar
 
@@ -224,29 +227,22 @@ def get_kpis(current_user):
     elif period == 'year':
         start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    # 2. Base Queries
-    leads_query = Lead.query
-    deals_query = Deal.query
-    activities_query = Activity.query
+    # 2. Metrics from the per-org daily rollups (single query)
+    rollups = get_rollups(current_user.organization_id)
+    since = start_date.date() if start_date else None
 
-    if start_date:
-        leads_query = leads_query.filter(Lead.created_at >= start_date, Lead.is_deleted == False)
-        deals_query = deals_query.filter(Deal.created_at >= start_date, Deal.organization_id == current_user.organization_id, Deal.is_deleted == False)
-        activities_query = activities_query.filter(Activity.created_at >= start_date, Activity.organization_id == current_user.organization_id)
-
-    # 3. Calculate Metrics
-    total_leads = leads_query.filter(Lead.is_deleted == False).count()
-    converted_leads = leads_query.filter_by(status='Converted', is_deleted=False).count()
+    total_leads = rollups.count('leads_by_status', start=since)
+    converted_leads = rollups.count('leads_by_status', start=since, where=lambda s: s == 'Converted')
     conversion_rate = round((converted_leads / total_leads * 100), 2) if total_leads > 0 else 0
 
-    total_deals = deals_query.filter(Deal.is_deleted == False).count()
-    won_deals = deals_query.filter_by(stage='Won', is_deleted=False).count()
-    lost_deals = deals_query.filter_by(stage='Lost', is_deleted=False).count()
-    
+    total_deals = rollups.count('deals_by_stage', start=since)
+    won_deals = rollups.count('deals_by_stage', start=since, where=lambda s: s == 'Won')
+    lost_deals = rollups.count('deals_by_stage', start=since, where=lambda s: s == 'Lost')
+
     # Revenue (Sum of value of Won deals)
-    revenue = deals_query.filter(Deal.stage == 'Won', Deal.is_deleted == False).with_entities(func.sum(Deal.value)).scalar() or 0.0
+    revenue = float(rollups.total('deals_by_stage', start=since, where=lambda s: s == 'Won'))
 
-    tasks_completed = activities_query.filter_by(status='Completed').count()
+    tasks_completed = rollups.count('activities_by_status', start=since, where=lambda s: s == 'Completed')
 
     return jsonify({
         "period": period,
@@ -447,13 +443,17 @@ def update_employee(current_user, user_id):
     if is_admin_hr or is_super:
         if "department" in data: user.department = data["department"]
         if "designation" in data: user.designation = data["designation"]
-        if "role" in data: user.role = data["role"]
+        if "role" in data and data["role"] != user.role:
+            user.role = data["role"]
+            # Existing tokens carry the old role claim; make the user log in again
+            user.token_version = (user.token_version or 0) + 1
         if "status" in data: user.status = data["status"]
         if "date_of_joining" in data and data["date_of_joining"]:
              user.date_of_joining = datetime.fromisoformat(data["date_of_joining"].replace("Z", "+00:00"))
 
     try:
         db.session.commit()
+        invalidate_identity(user.id)
         log_activity(
             module="user",
             action="updated",
@@ -487,6 +487,7 @@ def delete_employee(current_user, user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        invalidate_identity(user_id)
         log_activity(
             module="user",
             action="deleted",
@@ -601,21 +602,15 @@ def dashboard_task_stats(current_user):
 @dashboard_bp.route('/dashboard/leads-summary', methods=['GET'])
 @token_required
 def leads_summary(current_user):
-    # Reuse the RBAC logic from lead_routes if possible, or replicate simple filter
-    query = Lead.query
-    if current_user.role != 'SUPER_ADMIN':
-        pass
-        
-    total = query.filter_by(is_deleted=False).count()
-    today = datetime.utcnow().date()
-    new_today = query.filter(func.date(Lead.created_at) == today, Lead.is_deleted == False).count()
-    converted = query.filter_by(status='Converted', is_deleted=False).count()
+    # One conditional-aggregation pass over leads (services/metrics_engine.py)
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    metrics = compute_metrics(Lead, [
+        count_if('total_leads'),
+        count_if('new_today', Lead.created_at >= today_start),
+        count_if('converted', Lead.status == 'Converted')
+    ], organization_id=current_user.organization_id, filters=[Lead.is_deleted == False])
     
-    return jsonify({
-        "total_leads": total,
-        "new_today": new_today,
-        "converted": converted
-    })
+    return jsonify(metrics)
 
 @dashboard_bp.route('/dashboard/deals-pipeline', methods=['GET'])
 @token_required
@@ -636,19 +631,19 @@ def deals_pipeline(current_user):
 def dashboard_summary(current_user):
     """
     Returns dashboard summary metrics as per specific frontend requirements.
+    Served from the per-org daily rollups (services/rollup_service.py).
     """
+    rollups = get_rollups(current_user.organization_id)
+    closed_stages = ['won', 'closed won', 'lost', 'closed lost']
+    won_stages = ['won', 'closed won']
+
     # 1. Total Leads
-    total_leads = Lead.query.filter_by(is_deleted=False).count()
+    total_leads = rollups.count('leads_by_status')
 
     # 2. Active Deals (Not Won or Lost)
-    # Matches: SELECT COUNT(*) FROM deals WHERE status = 'Active' (mapped to stages)
-    active_deals = Deal.query.filter(
-        func.lower(Deal.stage).notin_(['won', 'closed won', 'lost', 'closed lost']),
-        Deal.is_deleted == False
-    ).count()
+    active_deals = rollups.count('deals_by_stage', where=lambda s: s is not None and s.lower() not in closed_stages)
 
-    # 3. Revenue (This Quarter)
-    # Matches: SELECT SUM(amount) ... WHERE QUARTER(closed_at) = QUARTER(CURDATE())
+    # 3. Revenue (This Quarter, by close date)
     today = datetime.utcnow().date()
     current_quarter = (today.month - 1) // 3 + 1
     quarter_start_month = (current_quarter - 1) * 3 + 1
@@ -660,24 +655,14 @@ def dashboard_summary(current_user):
     else:
         next_q_start = today.replace(month=quarter_start_month + 3, day=1)
 
-    revenue = db.session.query(func.sum(Deal.value)).filter(
-        func.lower(Deal.stage).in_(['won', 'closed won']),
-        Deal.close_date >= quarter_start_date,
-        Deal.close_date < next_q_start,
-        Deal.is_deleted == False
-    ).scalar() or 0
-
-    # 4. Tasks Due (Today or Future)
-    tasks_due = Task.query.filter(
-        Task.status != 'Completed',
-        Task.due_date >= today
-    ).count()
+    revenue = rollups.total(
+        'deals_by_close_date', start=quarter_start_date, end=next_q_start,
+        where=lambda s: s is not None and s.lower() in won_stages
+    )
 
-    # 5. Overdue Tasks (Past)
-    overdue_tasks = Task.query.filter(
-        Task.status != 'Completed',
-        Task.due_date < today
-    ).count()
+    # 4. Tasks Due (Today or Future) / 5. Overdue Tasks (Past)
+    tasks_due = rollups.count('open_tasks_by_due_date', start=today)
+    overdue_tasks = rollups.count('open_tasks_by_due_date', end=today)
 
     result = {
         "total_leads": total_leads,
@@ -693,9 +678,12 @@ def dashboard_summary(current_user):
 @dashboard_bp.route('/dashboard/win-loss', methods=['GET'])
 @token_required
 def dashboard_win_loss(current_user):
-    won = Deal.query.filter_by(stage='Won', is_deleted=False).count()
-    lost = Deal.query.filter_by(stage='Lost', is_deleted=False).count()
-    in_progress = Deal.query.filter(Deal.stage.notin_(['Won', 'Lost']), Deal.is_deleted == False).count()
+    rollups = get_rollups(current_user.organization_id)
+    by_stage = rollups.breakdown('deals_by_stage')
+
+    won = by_stage.get('Won', 0)
+    lost = by_stage.get('Lost', 0)
+    in_progress = sum(c for stage, c in by_stage.items() if stage is not None and stage not in ['Won', 'Lost'])
 
     return jsonify({
         "won": won,
@@ -726,33 +714,21 @@ def dashboard_loss_reasons(current_user):
 @dashboard_bp.route('/dashboard/forecast', methods=['GET'])
 @token_required
 def dashboard_forecast(current_user):
+    rollups = get_rollups(current_user.organization_id)
     today = datetime.utcnow().date()
-    current_month = today.month
-    current_year = today.year
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    is_open = lambda s: s is not None and s not in ['Won', 'Lost']
 
     # 1. Total Pipeline (Value of Open Deals)
-    total_pipeline = db.session.query(func.sum(Deal.value)).filter(Deal.stage.notin_(['Won', 'Lost']), Deal.is_deleted == False).scalar() or 0
+    total_pipeline = rollups.total('deals_by_stage', where=is_open)
 
     # 2. Closing This Month (Open deals with close_date in current month)
-    # Note: SQLite extract syntax might differ, but SQLAlchemy usually handles it.
-    # For SQLite, we might need to filter by date range if extract fails, but let's try standard SA first.
-    closing_deals_query = Deal.query.filter(
-        Deal.stage.notin_(['Won', 'Lost']),
-        Deal.is_deleted == False,
-        extract('month', Deal.close_date) == current_month,
-        extract('year', Deal.close_date) == current_year
-    )
-    
-    closing_this_month = closing_deals_query.count()
+    closing_this_month = rollups.count('deals_by_close_date', start=month_start, end=next_month_start, where=is_open)
     
     # 3. Expected Revenue (Sum of value of deals closing this month)
     # In a real CRM, this would be weighted by probability. Here we sum the value.
-    expected_revenue = db.session.query(func.sum(Deal.value)).filter(
-        Deal.stage.notin_(['Won', 'Lost']),
-        Deal.is_deleted == False,
-        extract('month', Deal.close_date) == current_month,
-        extract('year', Deal.close_date) == current_year
-    ).scalar() or 0
+    expected_revenue = rollups.total('deals_by_close_date', start=month_start, end=next_month_start, where=is_open)
 
     return jsonify({
         "total_pipeline": int(total_pipeline),
@@ -765,46 +741,45 @@ def dashboard_forecast(current_user):
 @dashboard_bp.route('/dashboard/summary-widgets', methods=['GET'])
 @token_required
 def get_dashboard_summary_widget(current_user):
+    rollups = get_rollups(current_user.organization_id)
+    closed_stages = ['won', 'closed won', 'lost', 'closed lost']
+    won_stages = ['won', 'closed won']
+
     # 1. Total Leads
-    total_leads = Lead.query.filter_by(is_deleted=False).count()
+    total_leads = rollups.count('leads_by_status')
     
     # 2. Lead Growth (This Month vs Last Month)
-    today = datetime.utcnow()
+    today = datetime.utcnow().date()
     first_day_this_month = today.replace(day=1)
     last_month_end = first_day_this_month - timedelta(days=1)
     first_day_last_month = last_month_end.replace(day=1)
     
-    leads_this_month = Lead.query.filter(Lead.created_at >= first_day_this_month, Lead.is_deleted == False).count()
-    leads_last_month = Lead.query.filter(Lead.created_at >= first_day_last_month, Lead.created_at <= last_month_end, Lead.is_deleted == False).count()
+    leads_this_month = rollups.count('leads_by_status', start=first_day_this_month)
+    leads_last_month = rollups.count('leads_by_status', start=first_day_last_month, end=first_day_this_month)
     
     lead_growth = 0
     if leads_last_month > 0:
         lead_growth = round(((leads_this_month - leads_last_month) / leads_last_month) * 100)
     
     # 3. Active Deals (Not Won/Lost)
-    active_deals = Deal.query.filter(func.lower(Deal.stage).notin_(['won', 'closed won', 'lost', 'closed lost']), Deal.is_deleted == False).count()
+    active_deals = rollups.count('deals_by_stage', where=lambda s: s is not None and s.lower() not in closed_stages)
     
     # 4. In-progress Deals (Same as active for now, or specific stages like Negotiation)
-    in_progress_deals = Deal.query.filter(Deal.stage.in_(['Negotiation', 'Proposal']), Deal.is_deleted == False).count()
+    in_progress_deals = rollups.count('deals_by_stage', where=lambda s: s in ['Negotiation', 'Proposal'])
     
-    # 5. Quarter Revenue (Sum of Won deals in current quarter)
+    # 5. Quarter Revenue (Sum of Won deals created in current quarter)
     current_quarter = (today.month - 1) // 3 + 1
     quarter_start_month = (current_quarter - 1) * 3 + 1
     quarter_start_date = today.replace(month=quarter_start_month, day=1)
     
-    quarter_revenue = db.session.query(func.sum(Deal.value)).filter(
-        func.lower(Deal.stage).in_(['won', 'closed won']),
-        Deal.created_at >= quarter_start_date, # Using created_at as proxy for close_date if close_date is string/null
-        Deal.is_deleted == False
-    ).scalar() or 0
+    quarter_revenue = rollups.total(
+        'deals_by_stage', start=quarter_start_date,
+        where=lambda s: s is not None and s.lower() in won_stages
+    )
     
-    # 6. Tasks Due (Pending tasks due today or in future)
-    tasks_due = Task.query.filter(Task.status != 'Completed', Task.due_date >= today.date()).count()
-    # For overdue, we need to check due_date < today. 
-    # Assuming due_date is stored as string YYYY-MM-DD or Date object.
-    # If string, comparison might be tricky in SQL directly without cast, doing python side check for safety or simple string compare if format ISO.
-    # Let's assume standard ISO string or Date type.
-    tasks_overdue = Task.query.filter(Task.status != 'Completed', Task.due_date < today.date()).count()
+    # 6. Tasks Due (Pending tasks due today or in future) / Overdue
+    tasks_due = rollups.count('open_tasks_by_due_date', start=today)
+    tasks_overdue = rollups.count('open_tasks_by_due_date', end=today)
 
     return jsonify({
         "total_leads": total_leads,
@@ -898,26 +873,20 @@ def get_revenue_chart(current_user):
 
     current_year = datetime.utcnow().year
 
-    # Query Real Data (Group by month of creation for Won deals)
-    revenue_data = db.session.query(
-        extract('month', Deal.created_at).label('month'),
-        func.sum(Deal.value).label('total')
-    ).filter(
-        Deal.organization_id == current_user.organization_id,
-        func.lower(Deal.stage).in_(['won', 'closed won']),
-        extract('year', Deal.created_at) == current_year,
-        Deal.is_deleted == False
-    ).group_by(extract('month', Deal.created_at)).all()
+    # Won deals by month of creation, this calendar year only (services/time_buckets.py)
+    series = time_series(
+        Deal, Deal.created_at, 'month', datetime(current_year, 1, 1), datetime(current_year + 1, 1, 1),
+        [sum_if('revenue', Deal.value), count_if('deals')],
+        organization_id=current_user.organization_id,
+        filters=[func.lower(Deal.stage).in_(['won', 'closed won']), Deal.is_deleted == False],
+        cache_key='dashboard_revenue'
+    )
 
     # If very little real data (< 3 months) -> return dummy
-    if len(revenue_data) < 3:
+    if sum(1 for point in series if point['deals']) < 3:
         return jsonify(DUMMY_REVENUE)
 
-    # Otherwise build real response
-    revenue_dict = {int(r.month): float(r.total) for r in revenue_data}
-    months = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-    
-    response = [{"month": months[i-1], "revenue": revenue_dict.get(i, 0)} for i in range(1, 13)]
+    response = [{"month": calendar.month_abbr[p['bucket'].month], "revenue": float(p['revenue'] or 0)} for p in series]
 
     return jsonify(response)
 
@@ -929,20 +898,22 @@ def get_marketing_dashboard(current_user):
         
         # 1. KPIs
         total_campaigns = Campaign.query.filter_by(organization_id=org_id).count()
-        total_leads = Lead.query.filter_by(organization_id=org_id, is_deleted=False).count()
+        lead_metrics = compute_metrics(Lead, [
+            count_if('total'),
+            count_if('converted', Lead.status == 'Converted')
+        ], organization_id=org_id, filters=[Lead.is_deleted == False])
+        total_leads = lead_metrics['total']
         
         # Conversion Rate
-        converted_leads = Lead.query.filter_by(organization_id=org_id, status='Converted', is_deleted=False).count()
+        converted_leads = lead_metrics['converted']
         conversion_rate = 0
         if total_leads > 0:
             conversion_rate = round((converted_leads / total_leads) * 100, 1)
             
         # Revenue (Using Deal revenue as it represents actual sales)
-        revenue = db.session.query(func.sum(Deal.value)).filter(
-            Deal.organization_id == org_id,
-            Deal.stage.ilike('%won%'),
-            Deal.is_deleted == False
-        ).scalar() or 0
+        revenue = compute_metrics(Deal, [
+            sum_if('revenue', Deal.value, Deal.stage.ilike('%won%'))
+        ], organization_id=org_id, filters=[Deal.is_deleted == False])['revenue']
         
         # 2. Campaigns List
         campaigns_list = Campaign.query.filter_by(organization_id=org_id).order_by(Campaign.created_at.desc()).limit(10).all()
@@ -5,7 +5,8 @@ from routes.auth_routes import token_required
 from datetime import datetime, date
 from sqlalchemy import func
 from models.activity_logger import log_activity
-# from services.automation_engine import run_workflow
+from services.list_query import ListSpec, ListField, ListFilter, run_list_query
+from services.automation_engine import emit_event
 
 deal_bp = Blueprint('deals', __name__)
 
@@ -16,6 +17,50 @@ def get_deal_query(current_user):
     """
     return Deal.query.filter((Deal.is_deleted == False) | (Deal.is_deleted.is_(None)))
 
+DEAL_LIST = ListSpec(
+    key_column=Deal.id,
+    fields=[
+        ListField("id", Deal.id),
+        ListField("title", Deal.title),
+        ListField("company", Deal.company),
+        ListField("pipeline", Deal.pipeline),
+        ListField("stage", Deal.stage),
+        ListField("value", Deal.value),
+        ListField("owner", Deal.owner),
+        ListField("close_date", Deal.close_date, str),
+        ListField("lead_id", Deal.lead_id),
+        ListField("status", Deal.status),
+        ListField("created_at", Deal.created_at),
+    ],
+    default_fields=["id", "title", "company", "pipeline", "stage", "value", "owner", "close_date"],
+    filters=[
+        ListFilter('pipeline', Deal.pipeline),
+        ListFilter('stage', Deal.stage),
+        ListFilter('status', Deal.status),
+        ListFilter('owner', Deal.owner),
+        ListFilter('lead_id', Deal.lead_id),
+        ListFilter('title', Deal.title, 'like'),
+        ListFilter('company', Deal.company, 'like'),
+        ListFilter('min_value', Deal.value, 'gte'),
+        ListFilter('max_value', Deal.value, 'lte'),
+        ListFilter('close_after', Deal.close_date, 'gte'),
+        ListFilter('close_before', Deal.close_date, 'lte'),
+    ],
+    sorts={'id': Deal.id, 'value': Deal.value, 'close_date': Deal.close_date,
+           'created_at': Deal.created_at, 'title': Deal.title}
+)
+
+def deal_list_filters(organization_id):
+    """
+    The org scope every deal list query starts from. is_deleted alone (no
+    "OR IS NULL") so ix_deals_org_deleted_id serves the page. NULLs are backfilled
+    by migration 9a1f3c5e7b20 and again at startup (app.py).
+    """
+    return [
+        Deal.organization_id == organization_id,
+        Deal.is_deleted == False
+    ]
+
 ALLOWED_PIPELINES = ["Deals", "Sales", "Partnership", "Enterprise"]
 ALLOWED_STAGES = ["Proposal", "Negotiation", "Won", "Lost"]
 
@@ -75,8 +120,7 @@ def create_deal(current_user):
 
     log_activity("deal", "created", f"Deal '{new_deal.title}' created in {new_deal.pipeline}.", new_deal.id)
     
-    # AUTOMATION HOOK
-    # run_workflow("deal_created", new_deal)
+    emit_event("deal_created", new_deal, current_user.organization_id)
     
     return jsonify({
         "message": "Deal created successfully",
@@ -86,26 +130,15 @@ def create_deal(current_user):
 @deal_bp.route('/api/deals', methods=['GET'])
 @token_required
 def get_deals(current_user):
-    pipeline_filter = request.args.get('pipeline')
-    query = get_deal_query(current_user)
-    
-    if pipeline_filter:
-        query = query.filter_by(pipeline=pipeline_filter)
-        
-    deals = query.order_by(Deal.id.desc()).all()
-    
-    return jsonify({
-        "deals": [{
-            "id": d.id,
-            "title": d.title,
-            "company": d.company,
-            "pipeline": d.pipeline,
-            "stage": d.stage,
-            "value": d.value,
-            "owner": d.owner,
-            "close_date": str(d.close_date) if d.close_date else None
-        } for d in deals]
-    }), 200
+    # Paged/filtered/sparse list, see DEAL_LIST and services/list_query.py
+    try:
+        deals, headers = run_list_query(DEAL_LIST, deal_list_filters(current_user.organization_id), request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify({"deals": deals})
+    response.headers.update(headers)
+    return response, 200
 
 @deal_bp.route('/api/deals/pipelines', methods=['GET'])
 @token_required
@@ -155,7 +188,6 @@ def update_deal(current_user, deal_id):
     if not deal:
         return jsonify({'message': 'Deal not found'}), 404
 
-    old_stage = deal.stage
     data = request.get_json()
     updated = False
     for field in ["title", "company", "stage", "value", "owner", "pipeline", "close_date"]:
@@ -173,11 +205,7 @@ def update_deal(current_user, deal_id):
     if updated:
         db.session.commit()
         log_activity("deal", "updated", f"Deal '{deal.title}' was updated.", deal.id)
-        
-        # AUTOMATION HOOK
-        if old_stage != deal.stage:
-            # run_workflow("deal_updated", deal)
-            pass
+        emit_event("deal_updated", deal, current_user.organization_id)
         return jsonify({'message': 'Deal updated successfully'}), 200
     
     return jsonify({'message': 'No valid fields provided for update'}), 400
@@ -225,10 +253,8 @@ def update_deal_status(current_user, deal_id):
     db.session.commit()
     log_activity("deal", "status_changed", f"Deal '{deal.title}' status changed to {new_stage}.", deal.id)
     
-    # AUTOMATION HOOK
     if old_stage != deal.stage:
-        # run_workflow("deal_updated", deal)
-        pass
+        emit_event("deal_updated", deal, current_user.organization_id)
     return jsonify({'message': f'Deal status updated to {new_stage}'}), 200
 
 @deal_bp.route('/api/deals/analytics', methods=['GET'])
@@ -1,6 +1,5 @@
-import pandas as pd
-import io
-from flask import Blueprint, request, jsonify, send_file
+import itertools
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from extensions import db
 from routes.auth_routes import token_required
 
@@ -9,13 +8,16 @@ from models.contact import Contact
 from models.crm import Lead, Deal
 from models.note_file import Note
 from models.user import User
+from models.import_job import ImportJob
 from datetime import datetime
 
 # Import existing role-based query helpers
 # The following imports are removed because 'get_lead_query' and 'Account' are no longer in lead_routes.py
 # from routes.lead_routes import get_lead_query, Account
-from routes.deal_routes import get_deal_query # Assuming this is still valid
 from models.activity_logger import log_activity
+from services.import_service import run_import, ImportFileError
+from services.import_job_service import create_import_job, submit_import_job
+from services.export_service import ExportColumn, isoformat, iter_keyset_batches, stream_csv, stream_xlsx
 
 import_export_bp = Blueprint('import_export', __name__)
 
@@ -32,115 +34,50 @@ class Account(db.Model):
 
 # --- IMPORT LOGIC ---
 
-def process_contact_import(df, current_user):
-    """Handles the logic for importing contacts."""
-    required_columns = ['name', 'email']
-    if not all(col in df.columns for col in required_columns):
-        missing = [col for col in required_columns if col not in df.columns]
-        return jsonify({'error': 'File Processing Error', 'message': f'Missing required columns: {", ".join(missing)}'}), 400
-
-    imported_count, failed_count, errors = 0, 0, []
-    # Fetch existing emails and mobiles for duplicate checking
-    existing_emails = {c.email for c in Contact.query.with_entities(Contact.email).all()}
-
-    for index, row in df.iterrows():
-        row_num = index + 2  # Account for header and 0-based index
-        email = str(row.get('email', '')).strip()
-        name = str(row.get('name', '')).strip()
-
-        if not name or not email:
-            errors.append({'row': row_num, 'reason': 'Missing name or email'})
-            failed_count += 1
-            continue
-        if email in existing_emails:
-            errors.append({'row': row_num, 'reason': f'Email "{email}" already exists'})
-            failed_count += 1
-            continue
-
-        try:
-            new_contact = Contact(
-                name=name,
-                email=email,
-                phone=str(row.get('phone', '')).strip(),
-                company=str(row.get('company', '')).strip(),
-                owner=str(row.get('owner', '')).strip(),
-                last_contact=str(row.get('last_contact', '')).strip(),
-                status=str(row.get('status', 'Active')).strip(),
-            )
-            db.session.add(new_contact)
-            existing_emails.add(email)
-            imported_count += 1
-        except Exception as e:
-            db.session.rollback()
-            errors.append({'row': row_num, 'reason': f'Database error: {str(e)}'})
-            failed_count += 1
+def import_error_response(module, e):
+    """
+    400 for an unreadable file. If the error came after some chunks were committed,
+    the body also carries their counts (and the import is logged) so the client
+    knows which rows are already in.
+    """
+    body = {'error': 'File Processing Error', 'message': str(e)}
+    if e.result is not None and e.result.total_rows:
+        body.update(e.result.to_dict())
+        body['partial'] = True
+        log_activity(
+            module="import",
+            action=f"{module}_imported",
+            description=f"Imported {e.result.imported} {module} before a file error. {e.result.failed} rows failed."
+        )
+    return jsonify(body), 400
+
+def process_contact_import(file, filename, current_user):
+    """Handles the logic for importing contacts (streamed in chunks, see services/import_service.py)."""
+    try:
+        result = run_import('contacts', file, filename, current_user.organization_id)
+    except ImportFileError as e:
+        return import_error_response('contacts', e)
 
-    db.session.commit()
     log_activity(
         module="import",
         action="contacts_imported",
-        description=f"Imported {imported_count} contacts. {failed_count} rows failed."
+        description=f"Imported {result.imported} contacts. {result.failed} rows failed."
     )
-    return jsonify({
-        "total_rows": len(df), "imported": imported_count, "failed": failed_count, "errors": errors
-    }), 200
-
-def process_lead_import(df, current_user):
-    """Handles the logic for importing leads."""
-    required_columns = ['name']
-    if not all(col in df.columns for col in required_columns):
-        missing = [col for col in required_columns if col not in df.columns]
-        return jsonify({'error': 'File Processing Error', 'message': f'Missing required columns: {", ".join(missing)}'}), 400
-
-    imported_count, failed_count, errors = 0, 0, []
-    existing_emails = {l.email for l in Lead.query.filter(Lead.email.isnot(None)).all()}
-
-    for index, row in df.iterrows():
-        row_num = index + 2
-        email = str(row.get('email', '')).strip()
-        name = str(row.get('name', '')).strip()
+    return jsonify(result.to_dict()), 200
 
-        if not name:
-            errors.append({'row': row_num, 'reason': 'Missing name'})
-            failed_count += 1
-            continue
-        if email and email in existing_emails:
-            errors.append({'row': row_num, 'reason': f'Email "{email}" already exists for a lead in your organization'})
-            failed_count += 1
-            continue
+def process_lead_import(file, filename, current_user):
+    """Handles the logic for importing leads (streamed in chunks, see services/import_service.py)."""
+    try:
+        result = run_import('leads', file, filename, current_user.organization_id)
+    except ImportFileError as e:
+        return import_error_response('leads', e)
 
-        try:
-            # Updated to match the new Lead model.
-            # Fields like score, sla, owner, description are removed.
-            # The system now auto-assigns users and teams upon API creation, but not for imports.
-            new_lead = Lead(
-                name=name,
-                email=email if email else None,
-                phone=str(row.get('phone', '')).strip(),
-                source=str(row.get('source', 'Import')).strip(),
-                status=str(row.get('status', 'new')).strip(), # Default status is 'new'
-                # Location fields can be provided in the import file
-                city=str(row.get('city', '')).strip() or None,
-                state=str(row.get('state', '')).strip() or None,
-                country=str(row.get('country', '')).strip() or None
-            )
-            db.session.add(new_lead)
-            if email: existing_emails.add(email)
-            imported_count += 1
-        except Exception as e:
-            db.session.rollback()
-            errors.append({'row': row_num, 'reason': f'Database error: {str(e)}'})
-            failed_count += 1
-            
-    db.session.commit()
     log_activity(
         module="import",
         action="leads_imported",
-        description=f"Imported {imported_count} leads. {failed_count} rows failed."
+        description=f"Imported {result.imported} leads. {result.failed} rows failed."
     )
-    return jsonify({
-        "total_rows": len(df), "imported": imported_count, "failed": failed_count, "errors": errors
-    }), 200
+    return jsonify(result.to_dict()), 200
 
 @import_export_bp.route('/import/<string:module>', methods=['POST'])
 @token_required
@@ -155,116 +92,138 @@ def import_data(current_user, module):
     if not (filename.endswith('.csv') or filename.endswith('.xlsx')):
         return jsonify({'error': 'Validation Error', 'message': 'Invalid file type. Please use CSV or XLSX.'}), 400
 
-    try:
-        df = pd.read_csv(file) if filename.endswith('.csv') else pd.read_excel(file)
-        df.columns = [col.lower().replace(' ', '_').strip() for col in df.columns]
-    except Exception as e:
-        return jsonify({'error': 'File Read Error', 'message': str(e)}), 400
+    # Large files: ?async=true persists the upload and returns a job id immediately
+    if request.args.get('async', '').lower() in ['true', '1'] and module in ['contacts', 'leads']:
+        job = create_import_job(module, file, current_user.organization_id, current_user.id)
+        submit_import_job(job.id)
+        return jsonify({
+            "message": "Import queued",
+            "job_id": job.id,
+            "status_url": f"/api/import/jobs/{job.id}"
+        }), 202
 
     if module == 'contacts':
-        return process_contact_import(df, current_user)
+        return process_contact_import(file.stream, filename, current_user)
     elif module == 'leads':
-        return process_lead_import(df, current_user)
+        return process_lead_import(file.stream, filename, current_user)
     else:
         return jsonify({'error': 'Not Found', 'message': f'Import for module "{module}" is not supported.'}), 404
 
-# --- EXPORT LOGIC ---
+@import_export_bp.route('/import/jobs', methods=['GET'])
+@token_required
+def list_import_jobs(current_user):
+    jobs = ImportJob.query.filter_by(organization_id=current_user.organization_id)\
+        .order_by(ImportJob.created_at.desc()).limit(50).all()
+    return jsonify([job.to_dict() for job in jobs]), 200
 
-@import_export_bp.route('/export/<string:module>', methods=['GET'])
+@import_export_bp.route('/import/jobs/<int:job_id>', methods=['GET'])
 @token_required
-def export_data(current_user, module):
-    df = pd.DataFrame()
+def get_import_job(current_user, job_id):
+    """Progress of a background import: rows done, rows/sec and the error list."""
+    job = ImportJob.query.filter_by(id=job_id, organization_id=current_user.organization_id).first()
+    if not job:
+        return jsonify({'error': 'Not Found', 'message': 'Import job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+# --- EXPORT LOGIC ---
 
+def _export_spec(module, current_user):
+    """Returns (columns, key_column, filters, descending) for a module, or None if unsupported."""
     if module == 'contacts':
-        records = Contact.query.all()
-        if records:
-            data = [{
-                "id": r.id,
-                "name": r.name,
-                "company": r.company,
-                "email": r.email,
-                "phone": r.phone,
-                "owner": r.owner,
-                "last_contact": r.last_contact,
-                "status": r.status
-            } for r in records]
-            df = pd.DataFrame(data)
-    
-    elif module == 'leads':
-        # Replaced get_lead_query with a simple query.
-        query = Lead.query
+        columns = [
+            ExportColumn("id", Contact.id), ExportColumn("name", Contact.name),
+            ExportColumn("company", Contact.company), ExportColumn("email", Contact.email),
+            ExportColumn("phone", Contact.phone), ExportColumn("owner", Contact.owner),
+            ExportColumn("last_contact", Contact.last_contact), ExportColumn("status", Contact.status)
+        ]
+        return columns, Contact.id, [], False
+
+    if module == 'leads':
+        filters = [Lead.status != 'Converted']
         # Simple RBAC for export: agents see their own leads, admins see all.
         if current_user.role not in ['SUPER_ADMIN', 'admin']:
-             query = query.filter_by(assigned_user_id=current_user.id)
-
-        records = query.filter(Lead.status != 'Converted').all()
-        if records:
-            # Updated data dictionary to match the new Lead model schema
-            data = [{
-                "id": l.id, "name": l.name,
-                "email": l.email, "phone": l.phone,
-                "status": l.status, "source": l.source,
-                "city": l.city,
-                "state": l.state,
-                "country": l.country,
-                "assigned_team_id": l.assigned_team_id,
-                "assigned_user_id": l.assigned_user_id,
-                "created_at": l.created_at.isoformat() if l.created_at else None
-            } for l in records]
-            df = pd.DataFrame(data)
-
-    elif module == 'deals':
-        records = get_deal_query(current_user).all()
-        if records:
-            data = [{
-                "id": d.id,
-                "pipeline": d.pipeline,
-                "title": d.title,
-                "company": getattr(d, 'company', None),
-                "stage": d.stage,
-                "value": getattr(d, 'value', None),
-                "owner": getattr(d, 'owner', None),
-                "close_date": str(d.close_date) if d.close_date else None,
-                "created_at": d.created_at.isoformat() if d.created_at else None
-            } for d in records]
-            df = pd.DataFrame(data)
-
-    elif module == 'accounts':
-        query = Account.query
+            filters.append(Lead.assigned_user_id == current_user.id)
+        columns = [
+            ExportColumn("id", Lead.id), ExportColumn("name", Lead.name),
+            ExportColumn("email", Lead.email), ExportColumn("phone", Lead.phone),
+            ExportColumn("status", Lead.status), ExportColumn("source", Lead.source),
+            ExportColumn("city", Lead.city), ExportColumn("state", Lead.state),
+            ExportColumn("country", Lead.country),
+            ExportColumn("assigned_team_id", Lead.assigned_team_id),
+            ExportColumn("assigned_user_id", Lead.assigned_user_id),
+            ExportColumn("created_at", Lead.created_at, isoformat)
+        ]
+        return columns, Lead.id, filters, False
+
+    if module == 'deals':
+        # Same visibility as get_deal_query
+        filters = [(Deal.is_deleted == False) | (Deal.is_deleted.is_(None))]
+        columns = [
+            ExportColumn("id", Deal.id), ExportColumn("pipeline", Deal.pipeline),
+            ExportColumn("title", Deal.title), ExportColumn("company", Deal.company),
+            ExportColumn("stage", Deal.stage), ExportColumn("value", Deal.value),
+            ExportColumn("owner", Deal.owner),
+            ExportColumn("close_date", Deal.close_date, str),
+            ExportColumn("created_at", Deal.created_at, isoformat)
+        ]
+        return columns, Deal.id, filters, False
+
+    if module == 'accounts':
+        filters = []
         if current_user.role != 'SUPER_ADMIN':
-            query = query.filter_by(organization_id=current_user.organization_id)
-        records = query.all()
-        if records:
-            data = [{
-                "id": a.id, "account_name": a.account_name, "phone": a.phone,
-                "website": a.website, "owner_id": a.owner_id,
-                "created_at": a.created_at.isoformat() if a.created_at else None
-            } for a in records]
-            df = pd.DataFrame(data)
-
-    elif module == 'notes':
-        # Export all notes (Simple Schema: id, note, created_at)
-        query = Note.query.order_by(Note.created_at.desc())
-        records = query.all()
-        if records: 
-            # Manual dict creation since to_dict might be outdated in model
-            data = [{"id": r.id, "note": r.note, "created_at": r.created_at} for r in records]
-            df = pd.DataFrame(data)
+            filters.append(Account.organization_id == current_user.organization_id)
+        columns = [
+            ExportColumn("id", Account.id), ExportColumn("account_name", Account.account_name),
+            ExportColumn("phone", Account.phone), ExportColumn("website", Account.website),
+            ExportColumn("owner_id", Account.owner_id),
+            ExportColumn("created_at", Account.created_at, isoformat)
+        ]
+        return columns, Account.id, filters, False
+
+    if module == 'notes':
+        # Newest first; id follows insertion order so it doubles as the keyset key
+        columns = [
+            ExportColumn("id", Note.id), ExportColumn("note", Note.note),
+            ExportColumn("created_at", Note.created_at, str)
+        ]
+        return columns, Note.id, [], True
+
+    return None
 
-    else:
+@import_export_bp.route('/export/<string:module>', methods=['GET'])
+@token_required
+def export_data(current_user, module):
+    """
+    Streams the export as CSV (default) or XLSX (?format=xlsx).
+    Rows are read in keyset-paginated batches of plain column tuples,
+    so memory stays constant however large the table is.
+    """
+    spec = _export_spec(module, current_user)
+    if spec is None:
         return jsonify({'error': 'Not Found', 'message': f'Export for module "{module}" is not supported.'}), 404
 
-    if df.empty:
-        return jsonify({'message': 'No data available to export for your role.'}), 200
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ['csv', 'xlsx']:
+        return jsonify({'error': 'Validation Error', 'message': 'Invalid format. Please use csv or xlsx.'}), 400
 
-    # Create file in memory
-    output = io.BytesIO()
-    df.to_csv(output, index=False, encoding='utf-8')
-    output.seek(0)
+    columns, key_column, filters, descending = spec
+    batches = iter_keyset_batches(columns, key_column, filters, descending)
 
-    return send_file(
-        output,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'{module}_export_{pd.Timestamp.now().strftime("%Y-%m-%d")}.csv'
-    )
\ No newline at end of file
+    first_batch = next(batches, None)
+    if not first_batch:
+        return jsonify({'message': 'No data available to export for your role.'}), 200
+    batches = itertools.chain([first_batch], batches)
+
+    if export_format == 'xlsx':
+        body = stream_xlsx(columns, batches)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = stream_csv(columns, batches)
+        mimetype = 'text/csv'
+
+    download_name = f'{module}_export_{datetime.now().strftime("%Y-%m-%d")}.{export_format}'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
@@ -3,6 +3,11 @@ from extensions import db
 from models.conversation import Conversation
 from models.message import Message
 from routes.auth_routes import token_required
+from services.outbound_service import queue_for_delivery, notify_outbound_worker
+from services.realtime import publish_new_message, publish_inbox_update, inbox_update_payload
+from services.inbox_service import (
+    list_inbox, record_message, mark_read, list_messages, message_page_args, message_page_headers, DEFAULT_PAGE_SIZE
+)
 from datetime import datetime
 
 inbox_bp = Blueprint('inbox', __name__)
@@ -11,46 +16,58 @@ inbox_bp = Blueprint('inbox', __name__)
 @inbox_bp.route('/api/inbox', methods=['GET'])
 @token_required
 def get_inbox(current_user):
-    query = Conversation.query.filter_by(organization_id=current_user.organization_id)
-    
-    # Permissions
-    if current_user.role == 'SUPER_ADMIN':
-        pass # See all
-    elif current_user.role == 'MANAGER':
-        # Filter by team (assuming user has team_id and lead has assigned_team_id)
-        # For MVP, managers see all in org or we join with Lead to check team
-        pass 
-    else: # Agent
-        query = query.filter_by(assigned_to=current_user.id)
-        
-    conversations = query.order_by(Conversation.last_message_at.desc()).all()
-    
+    """
+    Newest conversations first, served from the denormalized columns on
+    conversations (see services/inbox_service.py). Paged with ?limit= (default 50,
+    max 200) and ?cursor=; the cursor for the next page is in X-Next-Cursor.
+    """
+    try:
+        rows, next_cursor = list_inbox(
+            current_user,
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
     result = []
-    for c in conversations:
-        # Join last message logic (simplified by using last_message_at sort)
-        # Ideally we fetch the actual message content if needed
-        last_msg = Message.query.filter_by(conversation_id=c.id).order_by(Message.created_at.desc()).first()
-        
+    for c in rows:
         result.append({
             "id": c.id,
             "lead_id": c.lead_id,
-            "lead_name": c.lead.name if c.lead else "Unknown",
+            "lead_name": c.lead_name or "Unknown",
             "channel": c.channel,
             "status": c.status,
             "assigned_to": c.assigned_to,
-            "last_message": last_msg.content if last_msg else "",
+            "last_message": c.last_message_preview or "",
+            "last_sender_type": c.last_sender_type,
             "last_message_at": c.last_message_at.isoformat() if c.last_message_at else None,
-            "unread_count": 0 # Implement logic if needed
+            "unread_count": max(c.unread_count or 0, 0)
         })
-        
-    return jsonify(result), 200
+
+    response = jsonify(result)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 # 2. Get conversation messages
 @inbox_bp.route('/api/inbox/<string:conversation_id>/messages', methods=['GET'])
 @token_required
 def get_messages(current_user, conversation_id):
-    messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at.asc()).all()
-    return jsonify([m.to_dict() for m in messages]), 200
+    """
+    Newest first, ?limit= per page. ?before=<id> / ?after=<id> page through the
+    history; ?since=<id> returns only messages stored after that id (polling).
+    Next cursors are in the X-Before-Cursor / X-After-Cursor / X-Since-Cursor headers.
+    """
+    try:
+        page = message_page_args(request.args)
+        messages, has_more = list_messages(conversation_id, **page)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    response = jsonify([m.to_dict() for m in messages])
+    response.headers.update(message_page_headers(messages, has_more, page))
+    return response, 200
 
 # 3. Send message (agent -> customer)
 @inbox_bp.route('/api/inbox/<string:conversation_id>/send', methods=['POST'])
@@ -74,10 +91,28 @@ def send_message(current_user, conversation_id):
     )
     db.session.add(msg)
     
-    conversation.last_message_at = datetime.utcnow()
+    msg.created_at = datetime.utcnow()
+    db.session.flush()
+    queued = queue_for_delivery(conversation, msg) # Delivered by the outbound worker, not in this request
+    record_message(conversation.id, msg.created_at, content, 'agent')
+    mark_read(conversation.id, current_user.id) # Replying reads the conversation
     db.session.commit()
-    
-    # TODO: Call WhatsApp/Email API here
-    # emit('new_message', msg.to_dict(), room=conversation_id)
-    
-    return jsonify(msg.to_dict()), 201
\ No newline at end of file
+    if queued:
+        notify_outbound_worker()
+
+    db.session.refresh(conversation)
+    publish_new_message(conversation.organization_id, msg.to_dict())
+    publish_inbox_update(conversation.organization_id, conversation.id, inbox_update_payload(conversation))
+
+    return jsonify(msg.to_dict()), 201
+
+# 4. Mark conversation as read (resets the agent's unread_count)
+@inbox_bp.route('/api/inbox/<string:conversation_id>/read', methods=['POST'])
+@token_required
+def mark_conversation_read(current_user, conversation_id):
+    conversation = Conversation.query.filter_by(
+        id=conversation_id, organization_id=current_user.organization_id
+    ).first_or_404()
+    mark_read(conversation.id, current_user.id)
+    db.session.commit()
+    return jsonify({'message': 'Conversation marked as read'}), 200
@@ -1,22 +1,59 @@
 from flask import Blueprint, jsonify, request
 from routes.auth_routes import token_required
 from models.crm import Lead
+from models.lead_tag import LeadTag
 from extensions import db
 from datetime import datetime
+from services.list_query import ListSpec, ListField, ListFilter, run_list_query
+from services.automation_engine import emit_event
 
 lead_bp = Blueprint('lead_bp', __name__)
 
+# Same keys as Lead.to_dict(), selectable with ?fields=
+LEAD_LIST = ListSpec(
+    key_column=Lead.id,
+    fields=[ListField(c.name, Lead.__table__.c[c.name]) for c in Lead.__table__.columns],
+    filters=[
+        ListFilter('status', Lead.status),
+        ListFilter('source', Lead.source),
+        ListFilter('owner', Lead.owner),
+        ListFilter('assigned_user_id', Lead.assigned_user_id),
+        ListFilter('assigned_team_id', Lead.assigned_team_id),
+        ListFilter('city', Lead.city),
+        ListFilter('state', Lead.state),
+        ListFilter('country', Lead.country),
+        ListFilter('name', Lead.name, 'like'),
+        ListFilter('email', Lead.email, 'like'),
+        ListFilter('created_after', Lead.created_at, 'gte'),
+        ListFilter('created_before', Lead.created_at, 'lte'),
+    ],
+    sorts={'id': Lead.id, 'created_at': Lead.created_at, 'name': Lead.name, 'status': Lead.status}
+)
+
+def lead_list_filters(organization_id):
+    """The org scope every lead list query starts from."""
+    return [
+        Lead.organization_id == organization_id,
+        Lead.is_deleted == False
+    ]
+
 @lead_bp.route("/", methods=["GET"], strict_slashes=False)
 @lead_bp.route("/all", methods=["GET"])
 @token_required
 def get_leads(current_user):
     """
-    Get all leads for the user's organization, ensuring data isolation.
+    Get the leads of the user's organization: all of them, or one keyset page at a
+    time with ?limit= / ?cursor=. Also supports ?sort=, ?fields=, ?count= and the
+    filters in LEAD_LIST (see services/list_query.py); the next page's cursor is in X-Next-Cursor.
     """
     try:
-        leads = Lead.query.filter_by(is_deleted=False).all()
+        leads, headers = run_list_query(LEAD_LIST, lead_list_filters(current_user.organization_id), request.args)
 
-        return jsonify([lead.to_dict() for lead in leads])
+        response = jsonify(leads)
+        response.headers.update(headers)
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"[FAIL] Error fetching leads: {e}")
         return jsonify({"error": "An internal error occurred while fetching leads."}), 500
@@ -46,6 +83,7 @@ def create_lead(current_user):
 
     db.session.add(new_lead)
     db.session.commit()
+    emit_event("lead_created", new_lead, current_user.organization_id)
 
     return jsonify({"message": "Lead created successfully"}), 201
 
@@ -85,6 +123,7 @@ def update_lead(current_user, lead_id):
     lead.country = data.get("country", lead.country)
 
     db.session.commit()
+    emit_event("lead_updated", lead, current_user.organization_id)
 
     return jsonify({"message": "Lead updated successfully"})
 
@@ -99,7 +138,42 @@ def delete_lead(current_user, lead_id):
     if not lead:
         return jsonify({"error": "Lead not found"}), 404
 
+    LeadTag.query.filter_by(lead_id=lead.id).delete(synchronize_session=False)
     db.session.delete(lead)
     db.session.commit()
 
-    return jsonify({"message": "Lead deleted successfully"})
\ No newline at end of file
+    return jsonify({"message": "Lead deleted successfully"})
+
+@lead_bp.route("/<int:lead_id>/tags", methods=["GET"])
+@token_required
+def get_lead_tags(current_user, lead_id):
+    lead = Lead.query.filter_by(id=lead_id, organization_id=current_user.organization_id).first()
+    if not lead:
+        return jsonify({"error": "Lead not found"}), 404
+
+    tags = [t.tag for t in LeadTag.query.filter_by(lead_id=lead.id).order_by(LeadTag.tag).all()]
+    return jsonify({"lead_id": lead.id, "tags": tags})
+
+@lead_bp.route("/<int:lead_id>/tags", methods=["PUT"], strict_slashes=False)
+@token_required
+def set_lead_tags(current_user, lead_id):
+    """
+    Replace the tags on a lead. Body: {"tags": ["vip", "webinar"]}
+    Tags drive campaign audiences ({"audience": {"tag": "vip"}}).
+    """
+    lead = Lead.query.filter_by(id=lead_id, organization_id=current_user.organization_id).first()
+    if not lead:
+        return jsonify({"error": "Lead not found"}), 404
+
+    data = request.get_json() or {}
+    tags = data.get("tags")
+    if not isinstance(tags, list):
+        return jsonify({"error": "'tags' must be a list"}), 400
+    tags = sorted({str(t).strip()[:50] for t in tags if str(t).strip()})
+
+    LeadTag.query.filter_by(lead_id=lead.id).delete(synchronize_session=False)
+    for tag in tags:
+        db.session.add(LeadTag(lead_id=lead.id, tag=tag, organization_id=lead.organization_id))
+    db.session.commit()
+
+    return jsonify({"lead_id": lead.id, "tags": tags})
@@ -4,6 +4,8 @@ from models.campaign import Campaign
 from models.crm import Lead, Deal
 from routes.auth_routes import token_required
 from sqlalchemy import func, case
+from services.metrics_engine import count_if
+from services.time_buckets import time_series
 from datetime import datetime
 import calendar
 
@@ -37,22 +39,22 @@ def get_marketing_analytics(current_user):
         if total_leads > 0:
             conversion_rate = round((won_deals_count / total_leads) * 100, 2)
 
-        # 2️⃣ Monthly Trend (Leads)
-        # SQLite uses strftime, MySQL uses DATE_FORMAT. Assuming SQLite based on context.
-        monthly_trends = db.session.query(
-            func.strftime('%Y-%m', Lead.created_at).label('month'),
-            func.count(Lead.id)
-        ).filter(
+        # 2️⃣ Monthly Trend (Leads), from the org's first lead to now
+        first_lead_at = db.session.query(func.min(Lead.created_at)).filter(
             Lead.organization_id == org_id,
             Lead.is_deleted == False
-        ).group_by('month').order_by('month').all()
+        ).scalar()
 
         trend_data = []
-        for mt in monthly_trends:
-            if mt[0]:
-                year, month = mt[0].split('-')
-                month_name = calendar.month_abbr[int(month)]
-                trend_data.append({"name": f"{month_name}", "leads": mt[1]})
+        if first_lead_at:
+            series = time_series(
+                Lead, Lead.created_at, 'month', first_lead_at, datetime.utcnow(),
+                [count_if('leads')],
+                organization_id=org_id,
+                filters=[Lead.is_deleted == False],
+                cache_key='marketing_leads_trend'
+            )
+            trend_data = [{"name": calendar.month_abbr[p['bucket'].month], "leads": p['leads']} for p in series]
 
         # 3️⃣ Funnel Analysis
         # Leads -> Opportunities (Deals Created) -> Wins
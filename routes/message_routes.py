@@ -1,15 +1,23 @@
 from flask import Blueprint, request, jsonify
-from models.message import Message
 from extensions import db
+from services.inbox_service import list_messages, message_page_args, message_page_headers
 
 message_bp = Blueprint("message_bp", __name__, url_prefix="/api/messages")
 
 @message_bp.route("/<int:conversation_id>", methods=["GET"])
 def get_messages(conversation_id):
-    messages = Message.query.filter_by(conversation_id=conversation_id).all()
-    return jsonify([{
+    # Paged newest first; ?before= / ?after= / ?since= message-id cursors (see inbox_service.list_messages)
+    try:
+        page = message_page_args(request.args)
+        messages, has_more = list_messages(conversation_id, **page)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    response = jsonify([{
         "id": m.id,
         "content": m.content,
-        "sender": m.sender,
+        "sender": m.sender_type,
         "status": m.status
-    } for m in messages])
\ No newline at end of file
+    } for m in messages])
+    response.headers.update(message_page_headers(messages, has_more, page))
+    return response
\ No newline at end of file
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from extensions import db
 from models.pipeline import Pipeline, PipelineStage
 from routes.auth_routes import token_required
+from services.reference_cache import get_reference, invalidate_reference
 
 pipeline_bp = Blueprint('pipelines', __name__)
 
@@ -25,6 +26,7 @@ def create_pipeline(current_user):
     
     db.session.add(new_pipeline)
     db.session.commit()
+    invalidate_reference('pipelines', current_user.organization_id)
     
     return jsonify({'message': 'Pipeline created', 'id': new_pipeline.id, 'name': new_pipeline.name}), 201
 
@@ -57,22 +59,29 @@ def add_stages(current_user, pipeline_id):
         
     db.session.add_all(new_stages)
     db.session.commit()
+    invalidate_reference('pipelines', current_user.organization_id)
     
     return jsonify({'message': f'{len(new_stages)} stages added'}), 201
 
 @pipeline_bp.route('/pipelines', methods=['GET'])
 @token_required
 def get_pipelines(current_user):
-    pipelines = Pipeline.query.filter_by(company_id=current_user.organization_id).all()
-    
-    result = []
-    for p in pipelines:
-        stages = PipelineStage.query.filter_by(pipeline_id=p.id).order_by(PipelineStage.stage_order).all()
-        result.append({
-            "id": p.id,
-            "name": p.name,
-            "is_default": p.is_default,
-            "stages": [{"id": s.id, "name": s.name, "order": s.stage_order} for s in stages]
-        })
-        
-    return jsonify(result), 200
\ No newline at end of file
+    return jsonify(get_reference('pipelines', current_user.organization_id,
+                                 lambda: _load_pipelines(current_user.organization_id))), 200
+
+def _load_pipelines(org_id):
+    pipelines = Pipeline.query.filter_by(company_id=org_id).all()
+    stages = PipelineStage.query.filter(
+        PipelineStage.pipeline_id.in_([p.id for p in pipelines])
+    ).order_by(PipelineStage.stage_order).all() if pipelines else []
+
+    stages_by_pipeline = {}
+    for s in stages:
+        stages_by_pipeline.setdefault(s.pipeline_id, []).append({"id": s.id, "name": s.name, "order": s.stage_order})
+
+    return [{
+        "id": p.id,
+        "name": p.name,
+        "is_default": p.is_default,
+        "stages": stages_by_pipeline.get(p.id, [])
+    } for p in pipelines]
\ No newline at end of file
@@ -3,6 +3,7 @@ from extensions import db
 from models.plan import Plan, Feature
 from models.organization import Organization
 from routes.auth_routes import token_required
+from services.reference_cache import get_reference, invalidate_reference, GLOBAL
 
 plan_bp = Blueprint("plans", __name__)
 
@@ -29,6 +30,7 @@ def create_plan(current_user):
     )
     db.session.add(new_plan)
     db.session.commit()
+    invalidate_reference('plans', GLOBAL)
     return jsonify({"message": "Plan created", "plan": new_plan.to_dict()}), 201
 
 @plan_bp.route("/features", methods=["POST"])
@@ -59,6 +61,8 @@ def add_feature_to_plan(current_user, plan_id):
         if feature not in plan.features:
             plan.features.append(feature)
             db.session.commit()
+            invalidate_reference('plans', GLOBAL)
+            invalidate_reference('plan_features') # Every org on this plan
         return jsonify({"message": "Feature added to plan"}), 200
     return jsonify({"message": "Plan or Feature not found"}), 404
 
@@ -102,6 +106,7 @@ def assign_plan(current_user, org_id):
     org.plan = plan
     org.subscription_plan = plan.name
     db.session.commit()
+    invalidate_reference('plan_features', org.id)
 
     return jsonify({"message": f"Assigned {plan.name} plan to {org.name}"}), 200
 
@@ -113,22 +118,28 @@ def check_feature_access(current_user, feature_key):
     """
     Dynamic check to see if the logged-in user's organization has access to a specific feature.
     """
-    if not current_user.organization or not current_user.organization.plan:
+    plan = get_reference('plan_features', current_user.organization_id,
+                         lambda: _load_plan_features(current_user.organization_id))
+    if not plan:
         return jsonify({"has_access": False, "message": "No plan assigned"}), 403
 
-    plan = current_user.organization.plan
-    
     # Check if the feature exists in the plan's feature list
-    has_access = any(f.key == feature_key for f in plan.features)
+    has_access = feature_key in plan["features"]
     
     if has_access:
-        return jsonify({"has_access": True, "plan": plan.name}), 200
+        return jsonify({"has_access": True, "plan": plan["name"]}), 200
     else:
         return jsonify({"has_access": False, "message": f"Upgrade to access {feature_key}"}), 403
 
+def _load_plan_features(org_id):
+    """{"name", "features": set of keys} for the org's plan, or None."""
+    org = Organization.query.get(org_id) if org_id else None
+    if not org or not org.plan:
+        return None
+    return {"name": org.plan.name, "features": frozenset(f.key for f in org.plan.features)}
+
 # --- Public List ---
 
 @plan_bp.route("/plans", methods=["GET"])
 def get_plans():
-    plans = Plan.query.all()
-    return jsonify([p.to_dict() for p in plans])
\ No newline at end of file
+    return jsonify(get_reference('plans', GLOBAL, lambda: [p.to_dict() for p in Plan.query.all()]))
\ No newline at end of file
@@ -3,6 +3,8 @@ from extensions import db
 from models.crm import Lead, Deal
 from routes.auth_routes import token_required
 from sqlalchemy import func, extract
+from services.metrics_engine import count_if
+from services.time_buckets import time_series, floor_bucket, next_bucket
 from datetime import datetime, timedelta
 import calendar
 
@@ -40,36 +42,20 @@ def get_reports_summary(current_user):
 @report_bp.route('/api/reports/leads-trend', methods=['GET'])
 @token_required
 def get_leads_trend(current_user):
-    # Last 6 months data
-    today = datetime.utcnow().date()
-    six_months_ago = today - timedelta(days=180)
-    
-    # Group by Month
-    # SQLite extract syntax: strftime('%m', created_at)
-    # SQLAlchemy extract('month', ...) works for most DBs
-    
-    results = db.session.query(
-        func.strftime('%Y-%m', Lead.created_at).label('month_year'),
-        func.count(Lead.id)
-    ).filter(
-        Lead.created_at >= six_months_ago,
-        Lead.is_deleted == False
-    ).group_by(
-        'month_year'
-    ).order_by(
-        'month_year'
-    ).all()
-    
+    # Last 6 months (this one included), empty months as 0
+    this_month = floor_bucket(datetime.utcnow(), 'month')
+    six_months_ago = floor_bucket(this_month - timedelta(days=150), 'month')
+
+    series = time_series(
+        Lead, Lead.created_at, 'month', six_months_ago, next_bucket(this_month, 'month'),
+        [count_if('leads')],
+        organization_id=current_user.organization_id,
+        filters=[Lead.is_deleted == False],
+        cache_key='leads_trend'
+    )
+
     # Format response: "Aug", "Sep", etc.
-    trend_data = []
-    for r in results:
-        date_obj = datetime.strptime(r[0], '%Y-%m')
-        month_name = date_obj.strftime('%b')
-        trend_data.append({
-            "month": month_name,
-            "leads": r[1]
-        })
-        
+    trend_data = [{"month": p['bucket'].strftime('%b'), "leads": p['leads']} for p in series]
     return jsonify(trend_data), 200
 
 # 3️⃣ Lead Sources API
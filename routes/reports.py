@@ -3,6 +3,7 @@ from extensions import db
 from models.crm import Lead, Deal
 from models.user import User
 from sqlalchemy import func, desc, text
+from services.metrics_engine import compute_metrics, count_if, sum_if, avg_if
 from datetime import datetime, timedelta
 
 reports_bp = Blueprint('reports_new', __name__) # Register as /api/reports in app.py
@@ -30,32 +31,21 @@ def get_date_filter():
 def get_summary():
     start_date, end_date = get_date_filter()
     
-    # 1. Revenue (Sum of Won deals)
-    revenue = db.session.query(func.sum(Deal.value)).filter(
-        text("status = 'won'"), # Use status column as per prompt
-        Deal.created_at >= start_date,
-        Deal.created_at <= end_date
-    ).scalar() or 0
-
-    # 2. Total Leads
-    leads_count = Lead.query.filter(
-        Lead.created_at >= start_date,
-        Lead.created_at <= end_date
-    ).count() or 0
-
-    # 3. Active Deals (Not Won or Lost)
-    active_deals = Deal.query.filter(
-        text("status = 'open'"),
-        Deal.created_at >= start_date,
-        Deal.created_at <= end_date
-    ).count() or 0
-
-    # 4. Conversion Rate
-    won_deals_count = Deal.query.filter(
-        text("status = 'won'"),
-        Deal.created_at >= start_date,
-        Deal.created_at <= end_date
-    ).count()
+    # 1-4. Revenue, active/won deals and lead volume: one pass per table
+    deal_metrics = compute_metrics(Deal, [
+        sum_if('revenue', Deal.value, Deal.status == 'won'),
+        count_if('active_deals', Deal.status == 'open'),
+        count_if('won_deals', Deal.status == 'won')
+    ], date_column=Deal.created_at, start=start_date, end=end_date)
+
+    lead_metrics = compute_metrics(Lead, [
+        count_if('leads')
+    ], date_column=Lead.created_at, start=start_date, end=end_date)
+
+    revenue = deal_metrics['revenue']
+    leads_count = lead_metrics['leads']
+    active_deals = deal_metrics['active_deals']
+    won_deals_count = deal_metrics['won_deals']
     conversion = round((won_deals_count / leads_count * 100), 2) if leads_count > 0 else 0
 
     # 5. Best Performer (By Revenue)
@@ -109,10 +99,14 @@ def get_leads_report():
 
 @reports_bp.route('/sales', methods=['GET'])
 def get_sales_metrics():
-    won = Deal.query.filter(text("status = 'won'")).count()
-    lost = Deal.query.filter(text("status = 'lost'")).count()
-    
-    avg_deal = db.session.query(func.avg(Deal.value)).scalar() or 0
+    metrics = compute_metrics(Deal, [
+        count_if('won', Deal.status == 'won'),
+        count_if('lost', Deal.status == 'lost'),
+        avg_if('avg_deal', Deal.value)
+    ])
+    won = metrics['won']
+    lost = metrics['lost']
+    avg_deal = metrics['avg_deal']
     
     top_deals = Deal.query.filter(text("status = 'won'"))\
         .order_by(desc(Deal.value)).limit(5).all()
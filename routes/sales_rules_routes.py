@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from models.sales_rule import SalesRule
 from extensions import db
 from routes.auth_routes import token_required
+from services.sales_rule_service import apply_sales_rules, SalesRuleError
+from services.reference_cache import get_reference, invalidate_reference
 from datetime import datetime
 
 sales_rules_bp = Blueprint("sales_rules", __name__)
@@ -30,6 +32,7 @@ def create_sales_rule(current_user):
 
     db.session.add(rule)
     db.session.commit()
+    invalidate_reference('sales_rules', current_user.organization_id)
 
     return jsonify({
         "message": "Sales rule created successfully",
@@ -39,7 +42,11 @@ def create_sales_rule(current_user):
 @sales_rules_bp.route("/api/sales-rules", methods=["GET"])
 @token_required
 def get_sales_rules(current_user):
-    rules = SalesRule.query.filter_by(organization_id=current_user.organization_id).order_by(SalesRule.priority).all()
+    return jsonify(get_reference('sales_rules', current_user.organization_id,
+                                 lambda: _load_sales_rules(current_user.organization_id)))
+
+def _load_sales_rules(org_id):
+    rules = SalesRule.query.filter_by(organization_id=org_id).order_by(SalesRule.priority).all()
 
     result = []
     for rule in rules:
@@ -56,7 +63,7 @@ def get_sales_rules(current_user):
             "is_active": rule.is_active
         })
 
-    return jsonify(result)
+    return result
 
 @sales_rules_bp.route("/api/sales-rules/<int:id>", methods=["PUT"])
 @token_required
@@ -75,6 +82,7 @@ def update_rule(current_user, id):
     rule.is_active = data.get("is_active", rule.is_active)
 
     db.session.commit()
+    invalidate_reference('sales_rules', current_user.organization_id)
     return jsonify({"message": "Rule updated"})
 
 @sales_rules_bp.route("/api/sales-rules/<int:id>", methods=["DELETE"])
@@ -84,5 +92,27 @@ def delete_rule(current_user, id):
 
     db.session.delete(rule)
     db.session.commit()
+    invalidate_reference('sales_rules', current_user.organization_id)
+
+    return jsonify({"message": "Rule deleted"})
+
+@sales_rules_bp.route("/api/sales-rules/apply", methods=["POST"])
+@token_required
+def apply_rules(current_user):
+    """
+    Re-applies the active rules to existing records; the highest-priority (lowest
+    number) matching rule wins per field.
+    Body (optional): {"module": "leads" | "deals", "dry_run": true}
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        results = apply_sales_rules(current_user.organization_id, data.get("module"), bool(data.get("dry_run")))
+    except SalesRuleError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify({"message": "Rule deleted"})
\ No newline at end of file
+    return jsonify({
+        "dry_run": bool(data.get("dry_run")),
+        "results": results,
+        "total_matched": sum(r.get("matched", 0) for r in results)
+    })
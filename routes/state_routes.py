@@ -3,22 +3,31 @@ from extensions import db
 from models.state import State
 from models.branch import Branch
 from routes.auth_routes import token_required
+from services.reference_cache import get_reference
 
 state_bp = Blueprint('state', __name__)
 
 @state_bp.route('/api/states', methods=['GET'])
 @token_required
 def get_states(current_user):
+    # States and branches are only written by seed/admin scripts: cached until the TTL
+    return jsonify(get_reference('states', current_user.organization_id,
+                                 lambda: _load_states(current_user.organization_id)))
+
+def _load_states(org_id):
     states = State.query.filter_by(
-        organization_id=current_user.organization_id
+        organization_id=org_id
     ).all()
 
+    branches_by_state = {}
+    if states:
+        for branch in Branch.query.filter(Branch.state_id.in_([s.id for s in states])).all():
+            branches_by_state.setdefault(branch.state_id, []).append(branch)
+
     response = []
 
     for state in states:
-        branches = Branch.query.filter_by(
-            state_id=state.id
-        ).all()
+        branches = branches_by_state.get(state.id, [])
 
         response.append({
             "id": state.id,
@@ -34,4 +43,4 @@ def get_states(current_user):
             ]
         })
 
-    return jsonify(response)
\ No newline at end of file
+    return response
\ No newline at end of file
@@ -3,6 +3,7 @@ from extensions import db
 from models.team import Team, LocationTeamMapping
 from models.user import User
 from routes.auth_routes import token_required
+from services.reference_cache import get_reference, invalidate_reference, GLOBAL
 
 team_bp = Blueprint('teams', __name__)
 
@@ -56,15 +57,16 @@ def create_team(current_user):
     )
     db.session.add(team)
     db.session.commit()
+    invalidate_reference('teams', GLOBAL)
     return jsonify({'message': 'Team created successfully', 'team_id': team.id}), 201
 
 @team_bp.route('/api/teams', methods=['GET'])
 @token_required
 def get_teams(current_user):
-    teams = Team.query.all()
-    return jsonify([{
+    # Teams are not org-scoped: one cached list for everyone
+    return jsonify(get_reference('teams', GLOBAL, lambda: [{
         'id': t.id, 'name': t.name, 'city': t.city, 'country': t.country
-    } for t in teams]), 200
+    } for t in Team.query.all()])), 200
 
 # STEP 3: Create Location -> Team Mapping
 @team_bp.route('/api/location-mapping', methods=['POST'])
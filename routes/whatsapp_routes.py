@@ -3,10 +3,11 @@ from extensions import db
 from models.whatsapp import WhatsAppAccount
 from models.conversation import Conversation
 from models.message import Message
-from models.crm import Lead
 from models.user import User
 from routes.auth_routes import token_required
-from services.automation_engine import run_workflow
+from services.webhook_ingest_service import enqueue_webhook_event
+from services.inbox_service import list_messages, message_page_args, message_page_headers, record_message
+from services.outbound_service import queue_for_delivery, notify_outbound_worker
 from datetime import datetime
 import requests
 import os
@@ -52,97 +53,15 @@ def whatsapp_webhook():
         return 'Forbidden', 403
 
     # 2. Event Notification (POST)
-    data = request.get_json()
-    
+    # Stored raw and acknowledged right away; services/webhook_ingest_service.py
+    # resolves leads/conversations and writes messages and receipts in batches.
     try:
-        # Extract Message Data (Simplified for MVP)
-        entry = data.get('entry', [])[0]
-        changes = entry.get('changes', [])[0]
-        value = changes.get('value', {})
-        
-        if 'messages' in value:
-            message_data = value['messages'][0]
-            sender_phone = message_data.get('from') # e.g., "919876543210"
-            text_body = message_data.get('text', {}).get('body', '')
-            wa_msg_id = message_data.get('id')
-            
-            # 1. Find or Create Lead
-            lead = Lead.query.filter_by(phone=sender_phone).first()
-            is_new_lead = False
-            
-            if not lead:
-                # Determine organization (In real multi-tenant, this is tricky via webhook without mapping. 
-                # For MVP, we assign to the first org or a default one found via phone_number_id mapping)
-                # Here we assume single org or find via account mapping
-                wa_account = WhatsAppAccount.query.filter_by(phone_number_id=value.get('metadata', {}).get('phone_number_id')).first()
-                org_id = wa_account.company_id if wa_account else 1
-                
-                lead = Lead(
-                    name=f"WhatsApp User {sender_phone[-4:]}",
-                    phone=sender_phone,
-                    source='whatsapp',
-                    status='new',
-                    organization_id=org_id,
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(lead)
-                db.session.commit()
-                is_new_lead = True
-                
-                # Run Automation for New Lead
-                run_workflow("lead_created", lead)
-
-            # 2. Find or Create Conversation
-            conversation = Conversation.query.filter_by(lead_id=lead.id, channel='whatsapp').first()
-            if not conversation:
-                conversation = Conversation(
-                    lead_id=lead.id,
-                    channel='whatsapp',
-                    company_id=lead.organization_id,
-                    assigned_to=lead.assigned_user_id, # Inherit from lead
-                    created_at=datetime.utcnow()
-                )
-                db.session.add(conversation)
-                db.session.commit()
-            
-            # 3. Store Message
-            new_msg = Message(
-                conversation_id=conversation.id,
-                direction='incoming',
-                content=text_body,
-                status='read', # Auto-read for now or 'delivered'
-                whatsapp_message_id=wa_msg_id,
-                created_at=datetime.utcnow()
-            )
-            db.session.add(new_msg)
-            
-            # 4. Update Conversation Stats
-            conversation.last_message = text_body
-            conversation.last_message_at = datetime.utcnow()
-            conversation.unread_count += 1
-            
-            db.session.commit()
-            
-            return jsonify({'status': 'processed'}), 200
-            
-        elif 'statuses' in value:
-            # Handle Delivery Receipts (sent, delivered, read)
-            status_data = value['statuses'][0]
-            wa_msg_id = status_data.get('id')
-            new_status = status_data.get('status')
-            
-            msg = Message.query.filter_by(whatsapp_message_id=wa_msg_id).first()
-            if msg:
-                msg.status = new_status
-                db.session.commit()
-            
-            return jsonify({'status': 'updated'}), 200
-            
+        enqueue_webhook_event('whatsapp', request.get_data(as_text=True))
     except Exception as e:
         print(f"Webhook Error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-    return jsonify({'status': 'ignored'}), 200
+    return jsonify({'status': 'queued'}), 200
 
 # ✅ STEP 4: INBOX APIs
 @whatsapp_bp.route('/api/inbox', methods=['GET'])
@@ -185,8 +104,16 @@ def get_messages(current_user, conversation_id):
     conversation.unread_count = 0
     db.session.commit()
     
-    messages = Message.query.filter_by(conversation_id=conversation_id).order_by(Message.created_at.asc()).all()
-    return jsonify([m.to_dict() for m in messages]), 200
+    # Paged newest first; ?before= / ?after= / ?since= message-id cursors (see inbox_service.list_messages)
+    try:
+        page = message_page_args(request.args)
+        messages, has_more = list_messages(conversation_id, **page)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    response = jsonify([m.to_dict() for m in messages])
+    response.headers.update(message_page_headers(messages, has_more, page))
+    return response, 200
 
 # ✅ STEP 5: SEND MESSAGE
 @whatsapp_bp.route('/api/inbox/<int:conversation_id>/send', methods=['POST'])
@@ -203,23 +130,25 @@ def send_message(current_user, conversation_id):
     # 1. Save to DB
     msg = Message(
         conversation_id=conversation.id,
-        direction='outgoing',
+        channel=conversation.channel,
+        sender_type='agent',
+        sender_id=current_user.id,
         content=content,
-        status='sending',
+        status='sent',
         created_at=datetime.utcnow()
     )
     db.session.add(msg)
+    db.session.flush()
     
-    # 2. Update Conversation
-    conversation.last_message = content
-    conversation.last_message_at = datetime.utcnow()
+    # 2. Queue for the WhatsApp API; the outbound worker sends it and updates the status
+    queued = queue_for_delivery(conversation, msg)
     
-    db.session.commit()
+    # 3. Update Conversation
+    record_message(conversation.id, msg.created_at, content, 'agent')
     
-    # 3. Send to WhatsApp API (Placeholder for MVP)
-    # In production: requests.post(whatsapp_api_url, json=payload, headers=headers)
-    # For now, simulate success
-    msg.status = 'sent'
     db.session.commit()
+    if queued:
+        notify_outbound_worker()
+        return jsonify({'message': 'Message queued', 'status': msg.status, 'id': msg.id}), 202
     
-    return jsonify({'message': 'Message sent', 'status': 'sent', 'id': msg.id}), 200
\ No newline at end of file
+    return jsonify({'message': 'Message sent', 'status': msg.status, 'id': msg.id}), 200
\ No newline at end of file
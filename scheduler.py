@@ -1,56 +1,167 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update
 from extensions import db
 from drip_campaign import DripEnrollment, DripStep
-from services.email_service import send_email
+from models.crm import Lead
+from services.email_service import email_session
+
+
+def _load_steps(campaign_ids, steps):
+    """Adds every step of the given campaigns to the {(campaign_id, step_number): DripStep row} map."""
+    missing = [cid for cid in campaign_ids if (cid, None) not in steps]
+    if not missing:
+        return
+    rows = db.session.execute(
+        select(DripStep.campaign_id, DripStep.step_number, DripStep.subject, DripStep.body, DripStep.delay_days)
+        .where(DripStep.campaign_id.in_(missing))
+    ).all()
+    for row in rows:
+        steps[(row.campaign_id, row.step_number)] = row
+    for cid in missing:
+        steps[(cid, None)] = True # Marks the campaign as loaded
+
+
+def _claim_batch(now, batch_size):
+    """
+    Due enrollments (oldest first) joined to the lead's email in one query.
+    FOR UPDATE SKIP LOCKED (MySQL 8+/PostgreSQL) locks the batch until the commit
+    that records it as sent, and makes every other worker skip those rows, so
+    several processes drain the backlog in parallel without double sends.
+    SQLite has no row locks and ignores the clause.
+    """
+    return db.session.execute(
+        select(DripEnrollment.id, DripEnrollment.campaign_id, DripEnrollment.current_step,
+               Lead.id.label('lead_id'), Lead.email)
+        .outerjoin(Lead, Lead.id == DripEnrollment.lead_id)
+        .where(DripEnrollment.status == 'active', DripEnrollment.next_send_at <= now)
+        .order_by(DripEnrollment.next_send_at, DripEnrollment.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=DripEnrollment)
+    ).all()
+
+
+def _send_chunk(app, messages):
+    """
+    Sends (enrollment_id, to_email, subject, body) tuples over one persistent SMTP
+    session. Returns (ids sent, ids the server refused, error or None). A session
+    that fails to connect, or drops for good, stops the chunk there: its remaining
+    enrollments are in neither list. Without MAIL_USERNAME nothing is sent and every
+    enrollment counts as sent, like send_email().
+    """
+    sent, refused = [], []
+    try:
+        with app.app_context():
+            with email_session() as session:
+                for enrollment_id, to_email, subject, body in messages:
+                    if session is None or session.send(to_email, subject, body):
+                        sent.append(enrollment_id)
+                    else:
+                        refused.append(enrollment_id)
+    except Exception as e:
+        return sent, refused, e
+    return sent, refused, None
+
+
+def _send_all(app, messages, connections):
+    """
+    Spreads messages over up to `connections` parallel SMTP sessions.
+    Returns (ids sent, ids refused, first session error or None).
+    """
+    if not messages:
+        return set(), set(), None
+    connections = max(1, min(connections, len(messages)))
+    chunks = [messages[i::connections] for i in range(connections)]
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        results = list(pool.map(lambda chunk: _send_chunk(app, chunk), chunks))
+    sent, refused = set(), set()
+    error = None
+    for chunk_sent, chunk_refused, chunk_error in results:
+        sent.update(chunk_sent)
+        refused.update(chunk_refused)
+        error = error or chunk_error
+    return sent, refused, error
+
 
 def process_drip_emails():
     """
     Background job to process and send drip emails.
     This function is intended to be run within a Flask app context.
+
+    Drains due enrollments in batches of DRIP_BATCH_SIZE (ordered by next_send_at)
+    until none are left or DRIP_TICK_SECONDS has elapsed. Per batch: one query for
+    enrollments + lead emails, one query for any newly seen campaign's steps, sends
+    spread over DRIP_SMTP_CONNECTIONS persistent SMTP sessions, and one bulk UPDATE.
     """
     print(f"[{datetime.utcnow()}] Running drip email scheduler...")
-    
+
+    app = current_app._get_current_object()
+    batch_size = app.config.get('DRIP_BATCH_SIZE', 1000)
+    connections = app.config.get('DRIP_SMTP_CONNECTIONS', 4)
+    deadline = time.monotonic() + app.config.get('DRIP_TICK_SECONDS', 55)
+    retry_minutes = app.config.get('DRIP_RETRY_MINUTES', 15)
+
     now = datetime.utcnow()
-    active_enrollments = DripEnrollment.query.filter(
-        DripEnrollment.status == 'active',
-        DripEnrollment.next_send_at <= now
-    ).all()
+    steps = {}
+    processed = 0
+
+    while time.monotonic() < deadline:
+        batch = _claim_batch(now, batch_size)
+        if not batch:
+            break
+
+        _load_steps({row.campaign_id for row in batch}, steps)
+
+        messages = []
+        updates = []
+        sent_at = datetime.utcnow()
+        for row in batch:
+            current = steps.get((row.campaign_id, row.current_step))
+            if row.lead_id is None or current is None:
+                updates.append({"id": row.id, "status": 'stopped'})
+                print(f"Stopping enrollment {row.id} due to missing lead or step.")
+                continue
+
+            if row.email:
+                messages.append((row.id, row.email, current.subject, current.body))
+
+            next_step = steps.get((row.campaign_id, row.current_step + 1))
+            if next_step:
+                updates.append({
+                    "id": row.id,
+                    "current_step": row.current_step + 1,
+                    "next_send_at": sent_at + timedelta(days=next_step.delay_days)
+                })
+            else:
+                updates.append({"id": row.id, "status": 'completed'})
+
+        sent, refused, error = _send_all(app, messages, connections)
+        # Advance only what went out. Refused messages keep their step and are retried
+        # after DRIP_RETRY_MINUTES; a failed session's unsent enrollments stay due
+        # (their locks are released by the commit below) for the next tick
+        unsent = {m[0] for m in messages} - sent
+        retry_at = sent_at + timedelta(minutes=retry_minutes)
+        updates = [u for u in updates if u["id"] not in unsent]
+        updates += [{"id": enrollment_id, "next_send_at": retry_at} for enrollment_id in refused]
+        if refused:
+            print(f"[WARN] Drip email: {len(refused)} message(s) refused, retrying at {retry_at}.")
+        if error is not None:
+            print(f"[FAIL] Drip email: {len(unsent - refused)} enrollment(s) left for the next tick, SMTP unavailable: {error}")
+
+        # ORM bulk UPDATE by primary key (executemany); split by key set so each statement is uniform
+        for keys in ({'id', 'status'}, {'id', 'current_step', 'next_send_at'}, {'id', 'next_send_at'}):
+            rows = [u for u in updates if set(u) == keys]
+            if rows:
+                db.session.execute(update(DripEnrollment), rows)
+        db.session.commit()
+        processed += len(updates)
+        if error is not None:
+            break # Don't re-claim the same due rows against a failing server
 
-    if not active_enrollments:
+    if not processed:
         print("No drip emails to send at this time.")
         return
 
-    print(f"Found {len(active_enrollments)} emails to send.")
-
-    for enrollment in active_enrollments:
-        lead = enrollment.lead
-        current_step_details = DripStep.query.filter_by(
-            campaign_id=enrollment.campaign_id,
-            step_number=enrollment.current_step
-        ).first()
-
-        if not lead or not current_step_details:
-            enrollment.status = 'stopped'
-            print(f"Stopping enrollment {enrollment.id} due to missing lead or step.")
-            continue
-
-        if lead.email:
-            send_email(
-                to_email=lead.email,
-                subject=current_step_details.subject,
-                body=current_step_details.body
-            )
-
-        next_step_details = DripStep.query.filter_by(
-            campaign_id=enrollment.campaign_id,
-            step_number=enrollment.current_step + 1
-        ).first()
-
-        if next_step_details:
-            enrollment.current_step += 1
-            enrollment.next_send_at = datetime.utcnow() + timedelta(days=next_step_details.delay_days)
-        else:
-            enrollment.status = 'completed'
-
-    db.session.commit()
-    print("Drip email scheduler finished.")
\ No newline at end of file
+    print(f"Drip email scheduler finished: {processed} enrollment(s) processed.")
@@ -0,0 +1,152 @@
+import calendar
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from extensions import db
+from models.crm import Lead, Deal
+from models.task import Task
+from services.metrics_engine import compute_metrics, count_if, sum_if
+from services.time_buckets import time_series, floor_bucket, next_bucket
+from services.resolution_cache import TTLCache, _MISSING
+
+# (organization id, report, start, end) -> response. Short TTL: these back
+# dashboards that refresh often, and a minute of staleness is fine for them
+_results = TTLCache(maxsize=5000, ttl=60)
+
+OPEN_DEALS = [Deal.is_deleted == False]
+LIVE_LEADS = [Lead.is_deleted == False]
+
+
+def _cached(report, organization_id, start, end, build):
+    key = (organization_id, report, start, end)
+    result = _results.get(key)
+    if result is _MISSING:
+        result = build()
+        _results.set(key, result)
+    return result
+
+
+def _range(column, start, end):
+    clauses = []
+    if start is not None:
+        clauses.append(column >= start)
+    if end is not None:
+        clauses.append(column < end)
+    return clauses
+
+
+def _deals_by_stage(organization_id, start, end):
+    """{stage: count} for the org's deals created in [start, end): one grouped query."""
+    rows = db.session.query(Deal.stage, func.count(Deal.id)).filter(
+        Deal.organization_id == organization_id, *OPEN_DEALS, *_range(Deal.created_at, start, end)
+    ).group_by(Deal.stage).all()
+    return {stage: count for stage, count in rows}
+
+
+# -------------------- REVENUE --------------------
+
+def get_revenue_analytics(organization_id, start=None, end=None):
+    """Won deal value per month of creation; defaults to the current calendar year."""
+    def build():
+        year = datetime.utcnow().year
+        series = time_series(
+            Deal, Deal.created_at, 'month', start or datetime(year, 1, 1), end or datetime(year + 1, 1, 1),
+            [sum_if('revenue', Deal.value)],
+            organization_id=organization_id,
+            filters=[Deal.stage == 'Won', *OPEN_DEALS],
+            cache_key='analytics_revenue'
+        )
+        return {"revenueData": [
+            {"name": calendar.month_abbr[p['bucket'].month], "revenue": p['revenue'] or 0} for p in series
+        ]}
+    return _cached('revenue', organization_id, start, end, build)
+
+
+# -------------------- PIPELINE --------------------
+
+def get_pipeline_analytics(organization_id, start=None, end=None):
+    def build():
+        stages = _deals_by_stage(organization_id, start, end)
+        leads = compute_metrics(Lead, [
+            count_if('total'),
+            count_if('qualified', func.lower(Lead.status) != 'new')
+        ], organization_id=organization_id, date_column=Lead.created_at, start=start, end=end, filters=LIVE_LEADS)
+
+        win = stages.get('Won', 0)
+        return {
+            "pipelineStages": [{"stage": stage, "value": count} for stage, count in stages.items()],
+            "winLossData": [
+                {"name": "Win", "value": win},
+                {"name": "Loss", "value": stages.get('Lost', 0)}
+            ],
+            "funnelData": [
+                {"name": "Leads", "value": leads['total']},
+                {"name": "Qualified", "value": leads['qualified']},
+                {"name": "Proposal", "value": stages.get('Proposal', 0)},
+                {"name": "Negotiation", "value": stages.get('Negotiation', 0)},
+                {"name": "Closed Won", "value": win}
+            ]
+        }
+    return _cached('pipeline', organization_id, start, end, build)
+
+
+# -------------------- LEADS --------------------
+
+def get_lead_analytics(organization_id, start=None, end=None):
+    """Source and status breakdowns (one query grouped by both) plus a weekly trend (default: last 12 weeks)."""
+    def build():
+        rows = db.session.query(Lead.source, Lead.status, func.count(Lead.id)).filter(
+            Lead.organization_id == organization_id, *LIVE_LEADS, *_range(Lead.created_at, start, end)
+        ).group_by(Lead.source, Lead.status).all()
+
+        sources, statuses = {}, {}
+        for source, status, count in rows:
+            sources[source] = sources.get(source, 0) + count
+            statuses[status] = statuses.get(status, 0) + count
+
+        this_week = floor_bucket(datetime.utcnow(), 'week')
+        series = time_series(
+            Lead, Lead.created_at, 'week',
+            start or this_week - timedelta(weeks=11), end or next_bucket(this_week, 'week'),
+            [count_if('count')],
+            organization_id=organization_id,
+            filters=LIVE_LEADS,
+            cache_key='analytics_lead_trend'
+        )
+        return {
+            "leadSourceData": [{"name": name, "value": count} for name, count in sources.items()],
+            "leadStatusData": [{"name": name, "count": count} for name, count in statuses.items()],
+            "leadTrendData": [
+                {"name": f"Week {p['bucket'].isocalendar()[1]}", "week_start": p['bucket'].isoformat(), "count": p['count']}
+                for p in series
+            ]
+        }
+    return _cached('leads', organization_id, start, end, build)
+
+
+# -------------------- KPI --------------------
+
+def get_kpi_analytics(organization_id, start=None, end=None):
+    def build():
+        leads = compute_metrics(Lead, [count_if('total')], organization_id=organization_id,
+                                date_column=Lead.created_at, start=start, end=end, filters=LIVE_LEADS)
+        deals = compute_metrics(Deal, [count_if('won', Deal.stage == 'Won')], organization_id=organization_id,
+                                date_column=Deal.created_at, start=start, end=end, filters=OPEN_DEALS)
+        tasks = compute_metrics(Task, [
+            count_if('total'),
+            count_if('completed', Task.status == 'Completed')
+        ], organization_id=organization_id, org_column=Task.company_id,
+           date_column=Task.created_at, start=start, end=end)
+
+        conversion = round((deals['won'] / leads['total']) * 100, 2) if leads['total'] else 0
+        task_percent = round((tasks['completed'] / tasks['total']) * 100, 2) if tasks['total'] else 0
+
+        return {
+            "kpis": {
+                "leadConversion": {"value": f"{conversion}%", "trend": ""},
+                "avgCostPerLead": {"value": "N/A", "trend": ""},
+                "avgResponseTime": {"value": "N/A", "status": ""},
+                "totalActivities": {"value": str(tasks['total']), "trend": ""},
+                "tasksCompleted": {"value": f"{task_percent}%", "status": "Active"}
+            }
+        }
+    return _cached('kpi', organization_id, start, end, build)
@@ -1,26 +1,70 @@
+from sqlalchemy import select, func
 from models.crm import Lead
+from models.lead_tag import LeadTag
+from services.delivery_engine import Recipient
 from extensions import db
 
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Audience:
+    """
+    Lazily evaluated campaign audience. Iterating pages through the matching
+    leads with keyset pagination on Lead.id and yields Recipient rows
+    (only the columns a send needs), so memory stays flat for any audience size.
+    """
+
+    def __init__(self, filters, batch_size=DEFAULT_BATCH_SIZE):
+        self.filters = filters
+        self.batch_size = batch_size
+
+    def count(self):
+        stmt = select(func.count(Lead.id)).where(*self.filters)
+        return db.session.execute(stmt).scalar() or 0
+
+    def __iter__(self):
+        last_id = 0
+        while True:
+            stmt = select(Lead.id, Lead.name, Lead.email, Lead.phone, Lead.owner)\
+                .where(*self.filters, Lead.id > last_id)\
+                .order_by(Lead.id).limit(self.batch_size)
+            rows = db.session.execute(stmt).all()
+            for lead_id, name, email, phone, owner in rows:
+                yield Recipient(lead_id, name, email, phone, None, owner)
+            if len(rows) < self.batch_size:
+                return
+            last_id = rows[-1][0]
+
+
 class AudienceService:
     @staticmethod
-    def resolve_audience(audience_config, organization_id, branch_id=None):
+    def resolve_audience(audience_config, organization_id, branch_id=None, batch_size=DEFAULT_BATCH_SIZE):
         """
         Resolves leads based on audience configuration.
-        audience_config: dict or string (e.g., "all", "hot", or {"tag": "custom"})
+        audience_config: dict or string (e.g., "all", "hot", {"tag": "vip"} or {"tags": ["vip", "webinar"]})
+        Returns an Audience: iterate it for Recipient rows, call count() for the size.
         """
-        query = Lead.query.filter_by(organization_id=organization_id, is_deleted=False)
+        filters = [Lead.organization_id == organization_id, Lead.is_deleted == False]
 
         if branch_id:
             # Filter by branch if the column exists (handled in app.py migration)
             if hasattr(Lead, 'branch_id'):
-                query = query.filter_by(branch_id=branch_id)
+                filters.append(Lead.branch_id == branch_id)
 
         if audience_config == 'all':
             pass
         elif audience_config == 'hot':
-            query = query.filter(Lead.score == 'Hot')
-        elif isinstance(audience_config, dict) and audience_config.get('tag'):
-            # Placeholder for tag filtering
-            pass
-        
-        return query.all()
\ No newline at end of file
+            filters.append(Lead.score == 'Hot')
+        elif isinstance(audience_config, dict) and (audience_config.get('tag') or audience_config.get('tags')):
+            tags = audience_config.get('tags') or [audience_config.get('tag')]
+            if isinstance(tags, str):
+                tags = [tags]
+            # Leads carrying any of the tags; served by ix_lead_tags_org_tag_lead
+            filters.append(Lead.id.in_(
+                select(LeadTag.lead_id).where(
+                    LeadTag.organization_id == organization_id,
+                    LeadTag.tag.in_(tags)
+                )
+            ))
+
+        return Audience(filters, batch_size)
@@ -1,4 +1,341 @@
-# Temporary disabled automation engine
+import json
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import select, inspect
+from extensions import db
+from models.automation import AutomationRule
+from models.crm import Lead, Deal
+from models.message import Message
+from models.conversation import Conversation
+from models.task import Task
+from services.resolution_cache import _MISSING
+from services.reference_cache import get_reference, peek_reference, invalidate_reference
+from services.outbound_service import queue_for_delivery, notify_outbound_worker
+from services.inbox_service import record_message
+from services.realtime import publish_new_message
 
-def run_workflow(*args, **kwargs):
-    pass
\ No newline at end of file
+# trigger_event -> the entity its conditions and actions see
+EVENT_MODELS = {
+    'lead_created': Lead,
+    'lead_updated': Lead,
+    'deal_created': Deal,
+    'deal_updated': Deal,
+    'message_received': Message,
+}
+
+# Never written by update_field
+PROTECTED_FIELDS = {'id', 'organization_id', 'company_id', 'created_at', 'conversation_id'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class RuleError(ValueError):
+    """A rule whose JSON cannot be compiled."""
+
+
+# --- Compilation (once per rule, on cache miss or when a rule is saved) ---
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    return '' if value is None else str(value).strip().lower()
+
+
+def _compile_comparison(operator, target):
+    if operator in ('equals', 'not_equals'):
+        number = _number(target) if not isinstance(target, str) else None
+        if number is not None:
+            test = lambda v: _number(v) == number
+        else:
+            expected = _text(target)
+            test = lambda v: _text(v) == expected
+        return test if operator == 'equals' else (lambda v: not test(v))
+
+    if operator in ('contains', 'not_contains', 'starts_with'):
+        needle = _text(target)
+        if operator == 'starts_with':
+            return lambda v: _text(v).startswith(needle)
+        if operator == 'contains':
+            return lambda v: needle in _text(v)
+        return lambda v: needle not in _text(v)
+
+    if operator in ('in', 'not_in'):
+        if not isinstance(target, list):
+            raise RuleError(f"Operator '{operator}' needs a list value")
+        options = {_text(t) for t in target}
+        if operator == 'in':
+            return lambda v: _text(v) in options
+        return lambda v: _text(v) not in options
+
+    if operator in ('greater_than', 'less_than', 'greater_or_equal', 'less_or_equal'):
+        bound = _number(target)
+        if bound is None:
+            raise RuleError(f"Operator '{operator}' needs a numeric value")
+        compare = {
+            'greater_than': lambda n: n > bound,
+            'less_than': lambda n: n < bound,
+            'greater_or_equal': lambda n: n >= bound,
+            'less_or_equal': lambda n: n <= bound,
+        }[operator]
+        return lambda v: (n := _number(v)) is not None and compare(n)
+
+    if operator == 'is_empty':
+        return lambda v: v is None or _text(v) == ''
+    if operator == 'is_not_empty':
+        return lambda v: v is not None and _text(v) != ''
+
+    raise RuleError(f"Unknown operator '{operator}'")
+
+
+def compile_conditions(conditions, model):
+    """
+    conditions: a list of {"field", "operator", "value"} that must all match, or
+    {"all": [...]} / {"any": [...]} (nestable). Returns predicate(entity) -> bool.
+    """
+    if not conditions:
+        return lambda entity: True
+
+    if isinstance(conditions, dict) and ('all' in conditions or 'any' in conditions):
+        mode = 'all' if 'all' in conditions else 'any'
+        parts = [compile_conditions(c, model) for c in conditions[mode]]
+        if mode == 'all':
+            return lambda entity: all(p(entity) for p in parts)
+        return lambda entity: any(p(entity) for p in parts)
+
+    if isinstance(conditions, list):
+        parts = [compile_conditions(c, model) for c in conditions]
+        return lambda entity: all(p(entity) for p in parts)
+
+    if not isinstance(conditions, dict):
+        raise RuleError("Each condition must be an object")
+    field = conditions.get('field')
+    if field not in model.__table__.c:
+        raise RuleError(f"Unknown field '{field}' for {model.__tablename__}")
+    test = _compile_comparison(conditions.get('operator', 'equals'), conditions.get('value'))
+    return lambda entity: test(getattr(entity, field, None))
+
+
+def _conversation_for(entity):
+    if isinstance(entity, Message):
+        return db.session.get(Conversation, entity.conversation_id)
+    lead_id = entity.id if isinstance(entity, Lead) else entity.lead_id
+    if not lead_id:
+        return None
+    return db.session.scalars(
+        select(Conversation)
+        .where(Conversation.lead_id == lead_id, Conversation.channel == 'whatsapp')
+        .order_by(Conversation.last_message_at.desc())
+        .limit(1)
+    ).first()
+
+
+def _compile_action(action, model):
+    """Returns run(entity, ctx) for one {"type": ...} action."""
+    if not isinstance(action, dict):
+        raise RuleError("Each action must be an object")
+    kind = action.get('type')
+
+    if kind == 'update_field':
+        field = action.get('field')
+        if field not in model.__table__.c or field in PROTECTED_FIELDS:
+            raise RuleError(f"Cannot update field '{field}' of {model.__tablename__}")
+        value = action.get('value')
+
+        def run(entity, ctx):
+            setattr(entity, field, value)
+        return run
+
+    if kind == 'create_task':
+        title = action.get('title')
+        if not title:
+            raise RuleError("create_task needs a title")
+        try:
+            due_in_days = int(action['due_in_days']) if action.get('due_in_days') is not None else None
+        except (TypeError, ValueError):
+            raise RuleError("create_task due_in_days must be a whole number")
+
+        def run(entity, ctx):
+            db.session.add(Task(
+                title=title,
+                description=action.get('description'),
+                priority=action.get('priority', 'Medium'),
+                assigned_to=action.get('assigned_to'),
+                lead_id=entity.id if isinstance(entity, Lead) else getattr(entity, 'lead_id', None),
+                deal_id=entity.id if isinstance(entity, Deal) else None,
+                company_id=ctx['organization_id'],
+                due_date=(datetime.utcnow() + timedelta(days=due_in_days)).date() if due_in_days is not None else None
+            ))
+        return run
+
+    if kind == 'send_whatsapp':
+        content = action.get('message')
+        if not content:
+            raise RuleError("send_whatsapp needs a message")
+
+        def run(entity, ctx):
+            conversation = _conversation_for(entity)
+            if conversation is None:
+                return
+            message = Message(
+                conversation_id=conversation.id,
+                channel=conversation.channel,
+                sender_type='agent',
+                content=content,
+                status='sent',
+                created_at=datetime.utcnow()
+            )
+            db.session.add(message)
+            db.session.flush()
+            if queue_for_delivery(conversation, message):
+                ctx['queued'] = True
+            record_message(conversation.id, message.created_at, content, 'agent')
+            ctx['messages'].append((conversation.organization_id, message))
+        return run
+
+    raise RuleError(f"Unknown action type '{kind}'")
+
+
+class CompiledRule:
+    """An AutomationRule with its JSON turned into a predicate and action closures."""
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.name = rule.name
+        self.trigger_event = rule.trigger_event
+        model = EVENT_MODELS.get(rule.trigger_event)
+        if model is None:
+            raise RuleError(f"Unknown trigger_event '{rule.trigger_event}'. Allowed: {', '.join(EVENT_MODELS)}")
+        try:
+            conditions = json.loads(rule.conditions) if rule.conditions else []
+            actions = json.loads(rule.actions) if rule.actions else []
+        except (TypeError, ValueError):
+            raise RuleError("conditions and actions must be JSON")
+        if not isinstance(actions, list):
+            raise RuleError("actions must be a list")
+        self.matches = compile_conditions(conditions, model)
+        self.actions = [_compile_action(a, model) for a in actions]
+
+
+def validate_rule(rule):
+    """Raises RuleError if the rule would not compile; used before saving."""
+    CompiledRule(rule)
+
+
+def _load_rule_index(organization_id):
+    """{trigger_event: (CompiledRule, ...)} for the org's active rules."""
+    index = {}
+    rules = db.session.scalars(
+        select(AutomationRule)
+        .where(AutomationRule.organization_id == organization_id, AutomationRule.status == 'active')
+        .order_by(AutomationRule.id)
+    ).all()
+    for rule in rules:
+        try:
+            compiled = CompiledRule(rule)
+        except RuleError as e:
+            print(f"[WARN] Skipping automation rule {rule.id}: {e}")
+            continue
+        index.setdefault(compiled.trigger_event, []).append(compiled)
+    return {name: tuple(compiled) for name, compiled in index.items()}
+
+
+def rules_for(organization_id, trigger_event):
+    """
+    The org's active compiled rules for the event. The per-org index lives in the
+    reference cache (services/reference_cache.py); orgs without rules are cached
+    too, so most events return before touching the pool.
+    """
+    index = get_reference('automation_rules', organization_id, lambda: _load_rule_index(organization_id))
+    return index.get(trigger_event, ())
+
+
+def invalidate_rules(organization_id):
+    """Call after an org's rules are created, changed or deleted (and committed)."""
+    invalidate_reference('automation_rules', organization_id)
+
+
+# --- Events (request path: a dict lookup and, if rules may match, a pool submit) ---
+
+def emit_event(trigger_event, entity, organization_id=None):
+    """
+    Fires the org's rules for the event on the automation pool. Call after the
+    entity is committed. Reads nothing from the database here: organization_id
+    comes from the caller or the entity's loaded state.
+    """
+    model = EVENT_MODELS.get(trigger_event)
+    if model is None or entity is None:
+        return
+    state = inspect(entity)
+    if not state.identity:
+        return
+    if organization_id is None:
+        organization_id = state.dict.get('organization_id')
+    if organization_id is None:
+        return
+
+    index = peek_reference('automation_rules', organization_id)
+    if index is not _MISSING and trigger_event not in index:
+        return # Cached: nothing listens to this event
+
+    app = current_app._get_current_object()
+    args = (app, trigger_event, state.identity[0], organization_id)
+    if app.config.get('AUTOMATION_WORKERS', 4) <= 0:
+        _run_rules(*args)
+        return
+    _get_executor(app).submit(_run_rules, *args)
+
+
+def run_workflow(trigger, entity=None, organization_id=None, **kwargs):
+    """Older name for emit_event(); also accepts the entity as deal=/lead=."""
+    entity = entity or kwargs.get('deal') or kwargs.get('lead')
+    emit_event(trigger, entity, organization_id)
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('AUTOMATION_WORKERS', 4), thread_name_prefix='automation'
+            )
+        return _executor
+
+
+def _run_rules(app, trigger_event, entity_id, organization_id):
+    with app.app_context():
+        try:
+            rules = rules_for(organization_id, trigger_event)
+            if not rules:
+                return
+            entity = db.session.get(EVENT_MODELS[trigger_event], entity_id)
+            if entity is None:
+                return
+
+            ctx = {'organization_id': organization_id, 'queued': False, 'messages': []}
+            fired = []
+            for rule in rules:
+                if rule.matches(entity):
+                    for action in rule.actions:
+                        action(entity, ctx)
+                    fired.append(rule.id)
+            if not fired:
+                return
+            db.session.commit()
+            print(f"[OK] {trigger_event} #{entity_id}: ran automation rule(s) {fired}")
+
+            if ctx['queued']:
+                notify_outbound_worker()
+            if ctx['messages']:
+                for org_id, message in ctx['messages']:
+                    publish_new_message(org_id, message.to_dict())
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAIL] Automation for {trigger_event} #{entity_id}: {e}")
@@ -1,23 +1,45 @@
 from extensions import db
 from models.campaign import Campaign
 from models.campaign_log import CampaignLog
-from models.crm import Lead
-from models.whatsapp_log import WhatsAppCampaignLog
 from services.audience_service import AudienceService
-from datetime import datetime
-import time
+from services.delivery_engine import get_delivery_engine
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_, and_
+import itertools
+import threading
 import json
 
+_executor = None
+_executor_lock = threading.Lock()
+_submitted = set() # Campaign ids waiting in or running on the executor
+_submitted_lock = threading.Lock()
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('CAMPAIGN_DISPATCH_WORKERS', 2),
+                thread_name_prefix='campaign-dispatch'
+            )
+    return _executor
+
 def replace_variables(message, lead):
     if not message: return ""
     message = message.replace("{{name}}", lead.name or "Customer")
-    message = message.replace("{{company}}", lead.company or "")
+    message = message.replace("{{company}}", getattr(lead, 'company', None) or "")
     message = message.replace("{{owner}}", lead.owner or "")
     return message
 
-def send_campaign(campaign_id):
+def send_campaign(campaign_id, transport=None, resume=False):
     """
     Background job to execute a campaign.
+    Sends go through the DeliveryEngine (bounded worker pool + per-channel rate limit);
+    pass a transport (e.g. FakeTransport) to run without a provider.
+    resume=True (a stale Running campaign taken over from a crashed worker) skips
+    recipients that already have a CampaignLog row for it.
     """
     # Import app inside function to avoid circular import
     from app import app
@@ -32,89 +54,150 @@ def send_campaign(campaign_id):
 
         # 1. Update Status to Running
         campaign.status = 'Running'
+        campaign.heartbeat_at = datetime.utcnow()
         db.session.commit()
 
         try:
-            # 2. Fetch Audience (Mock logic: Fetch all leads for org)
-            # In production, parse campaign.config['audience']
-            config = json.loads(campaign.config) if campaign.config else {}
+            # 2. Fetch Audience
+            config = campaign.config or {}
+            if isinstance(config, str):
+                config = json.loads(config)
             audience_type = config.get('audience', 'all')
             
-            leads = AudienceService.resolve_audience(audience_type, campaign.organization_id, branch_id=getattr(campaign, 'branch_id', None))
-            
-            print(f"   -> Found {len(leads)} leads for audience.")
-
-            # 3. Execute Channel Logic
-            for lead in leads:
-                status = 'sent'
-                error_msg = None
-                
-                try:
-                    if campaign.channel.lower() == 'email':
-                        # Mock Email Send
-                        print(f"      📧 Sending Email to {lead.email}...")
-                        time.sleep(0.1) # Simulate network delay
-                    
-                    elif campaign.channel.lower() == 'whatsapp':
-                        # Mock WhatsApp Send
-                        print(f"      💬 Sending WhatsApp to {lead.phone}...")
-                        
-                        # Template Replacement
-                        message_body = config.get('message', '')
-                        final_message = replace_variables(message_body, lead)
-                        print(f"         Content: {final_message}")
-                        time.sleep(0.1)
-                        
-                        # WhatsApp Specific Logging
-                        wa_log = WhatsAppCampaignLog(
-                            campaign_id=campaign.id, lead_id=lead.id, phone=lead.phone,
-                            status='sent', organization_id=campaign.organization_id
-                        )
-                        db.session.add(wa_log)
-                        # Continue to main log or replace? Keeping both for now as per prompt structure request
-
-                    elif campaign.channel.lower() == 'social':
-                        # Mock Social Post
-                        print(f"      📱 Posting to Social Media...")
-                        time.sleep(0.1)
-                        # Social usually posts once, not per lead, but keeping structure for now
-                        if leads.index(lead) > 0: break 
-
-                except Exception as e:
-                    status = 'failed'
-                    error_msg = str(e)
-                    print(f"      ❌ Failed: {e}")
-
-                # 4. Log Result
-                log = CampaignLog(
-                    campaign_id=campaign.id,
-                    contact_id=lead.id,
-                    status=status,
-                    channel=campaign.channel,
-                    error_message=error_msg
-                )
-                db.session.add(log)
+            audience = AudienceService.resolve_audience(audience_type, campaign.organization_id, branch_id=getattr(campaign, 'branch_id', None))
             
-            # 5. Update Status to Completed
+            print(f"   -> Found {audience.count()} leads for audience.")
+
+            recipients = iter(audience) # Streamed page by page while sending
+            if resume:
+                done = {cid for (cid,) in db.session.query(CampaignLog.contact_id).filter(CampaignLog.campaign_id == campaign_id)}
+                recipients = (r for r in recipients if r.id not in done)
+                print(f"   -> Resuming: skipping {len(done)} recipient(s) already sent to.")
+            if campaign.channel.lower() == 'social':
+                # Social posts once, not per lead
+                recipients = itertools.islice(recipients, 1)
+
+            # 3. Deliver
+            message_body = config.get('message', '')
+            engine = get_delivery_engine(transport)
+            stats = engine.deliver(campaign, recipients, lambda r: replace_variables(message_body, r))
+
+            # 4. Update Status to Completed
             campaign.status = 'Completed'
             db.session.commit()
-            print(f"--- ✅ CAMPAIGN {campaign_id} COMPLETED ---")
+            print(f"--- ✅ CAMPAIGN {campaign_id} COMPLETED: {stats.sent} sent, {stats.failed} failed, "
+                  f"{stats.per_second:.1f} msg/s ---")
+            return stats
 
         except Exception as e:
+            db.session.rollback()
             print(f"❌ CRITICAL FAILURE IN CAMPAIGN {campaign_id}: {e}")
             campaign.status = 'Failed'
             db.session.commit()
 
 def schedule_campaign_job(campaign_id, run_date):
-    from services.scheduler_instance import scheduler
-    # Add job to scheduler
-    # ID ensures we don't duplicate jobs for the same campaign
-    scheduler.add_job(
-        func=send_campaign,
-        trigger='date',
-        run_date=run_date,
-        args=[campaign_id],
-        id=str(campaign_id),
-        replace_existing=True
+    """
+    Marks the campaign Scheduled for run_date. The schedule lives in the campaigns
+    table (not in one process's APScheduler memory), so it survives restarts and
+    dispatch_due_campaigns sends it exactly once whichever worker picks it up.
+    """
+    campaign = Campaign.query.get(campaign_id)
+    if not campaign:
+        return
+    campaign.scheduled_at = run_date
+    campaign.status = 'Scheduled'
+    db.session.commit()
+    print(f"⏰ Campaign {campaign_id} scheduled at {run_date}")
+
+def claim_campaign(campaign_id, stale_before):
+    """
+    Scheduled (or Running with a heartbeat older than stale_before: its worker
+    died) -> Running with a fresh heartbeat, as a conditional UPDATE; only one
+    worker gets rowcount 1. Running campaigns that never had a heartbeat predate
+    the lease and are left alone.
+    """
+    claimed = db.session.execute(
+        update(Campaign)
+        .where(
+            Campaign.id == campaign_id,
+            or_(
+                Campaign.status == 'Scheduled',
+                and_(Campaign.status == 'Running', Campaign.heartbeat_at < stale_before)
+            )
+        )
+        .values(status='Running', heartbeat_at=datetime.utcnow())
     )
-    print(f"⏰ Job scheduled for Campaign {campaign_id} at {run_date}")
\ No newline at end of file
+    db.session.commit()
+    return claimed.rowcount == 1
+
+def _run_campaign(campaign_id, resume):
+    try:
+        send_campaign(campaign_id, resume=resume)
+    except Exception as e:
+        print(f"❌ Campaign {campaign_id} worker error: {e}")
+    finally:
+        with _submitted_lock:
+            _submitted.discard(campaign_id)
+
+def submit_campaign(campaign_id, app=None, resume=False):
+    """Hands a claimed campaign to this process's dispatch pool (once); returns False if it already has it."""
+    app = app or current_app._get_current_object()
+    with _submitted_lock:
+        if campaign_id in _submitted:
+            return False
+        _submitted.add(campaign_id)
+    try:
+        _get_executor(app).submit(_run_campaign, campaign_id, resume)
+    except Exception:
+        with _submitted_lock:
+            _submitted.discard(campaign_id)
+        raise
+    return True
+
+def expire_stale_campaigns(now, max_lateness):
+    """
+    Scheduled -> Expired for campaigns overdue by more than max_lateness (one
+    conditional UPDATE). Covers campaigns scheduled before anything dispatched
+    them, and any left behind while no worker ran: they are not sent late.
+    """
+    expired = db.session.execute(
+        update(Campaign)
+        .where(Campaign.status == 'Scheduled', Campaign.scheduled_at < now - max_lateness)
+        .values(status='Expired')
+    )
+    db.session.commit()
+    if expired.rowcount:
+        print(f"[WARN] Expired {expired.rowcount} scheduled campaign(s) overdue by more than {max_lateness.total_seconds() / 3600:g}h.")
+    return expired.rowcount
+
+def dispatch_due_campaigns():
+    """
+    Scheduler job (every worker runs it): claims each campaign whose scheduled_at
+    has passed, unless it is overdue by more than CAMPAIGN_SCHEDULE_MAX_LATENESS_HOURS
+    (those are marked Expired), and hands it to the dispatch pool, so a long send
+    never holds up the scheduler thread. Running campaigns whose heartbeat is older
+    than CAMPAIGN_STALE_SECONDS are taken over and resumed. Must run inside an app context.
+    """
+    app = current_app._get_current_object()
+    now = datetime.utcnow()
+    max_lateness = timedelta(hours=app.config.get('CAMPAIGN_SCHEDULE_MAX_LATENESS_HOURS', 24))
+    stale_before = now - timedelta(seconds=app.config.get('CAMPAIGN_STALE_SECONDS', 300))
+    expire_stale_campaigns(now, max_lateness)
+
+    due = db.session.query(Campaign.id, Campaign.status).filter(
+        or_(
+            and_(Campaign.status == 'Scheduled',
+                 Campaign.scheduled_at <= now,
+                 Campaign.scheduled_at >= now - max_lateness),
+            and_(Campaign.status == 'Running', Campaign.heartbeat_at < stale_before)
+        )
+    ).order_by(Campaign.scheduled_at).all()
+
+    for campaign_id, status in due:
+        with _submitted_lock:
+            if campaign_id in _submitted:
+                continue # Ours and still going (a stale heartbeat here means a slow flush, not a crash)
+        if claim_campaign(campaign_id, stale_before):
+            if status == 'Running':
+                print(f"[WARN] Campaign {campaign_id} heartbeat is stale, taking it over.")
+            submit_campaign(campaign_id, app, resume=status == 'Running')
@@ -1,44 +1,46 @@
+from datetime import datetime
 from sqlalchemy import func
 from extensions import db
 from models.crm import Lead, Deal
+from services.metrics_engine import compute_metrics, count_if, sum_if
 
-def process_message(message):
+def process_message(message, organization_id=None):
     msg = message.lower()
 
     # TOTAL LEADS
     if "total leads" in msg:
-        total = db.session.query(func.count(Lead.id)).scalar() or 0
+        total = compute_metrics(Lead, [count_if('total')], organization_id=organization_id)['total']
         return f"You have {total} total leads."
 
     # TODAY LEADS
     elif "today leads" in msg:
-        # SQLite compatible date check
-        total = db.session.query(func.count(Lead.id)) \
-            .filter(func.date(Lead.created_at) == func.date(func.now())) \
-            .scalar() or 0
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        total = compute_metrics(Lead, [count_if('today')], organization_id=organization_id,
+                                date_column=Lead.created_at, start=today_start)['today']
         return f"You have {total} leads today."
 
     # TOTAL REVENUE
     elif "revenue" in msg:
-        revenue = db.session.query(func.sum(Deal.value)) \
-            .filter(Deal.status == "won") \
-            .scalar() or 0
+        revenue = compute_metrics(Deal, [sum_if('revenue', Deal.value, Deal.status == "won")],
+                                  organization_id=organization_id)['revenue']
         return f"Total revenue from won deals is {int(revenue)}."
 
     # WON DEALS
     elif "won deals" in msg:
-        count = db.session.query(func.count(Deal.id)) \
-            .filter(Deal.status == "won") \
-            .scalar() or 0
+        count = compute_metrics(Deal, [count_if('won', Deal.status == "won")],
+                                organization_id=organization_id)['won']
         return f"You have {count} won deals."
 
     # BEST PERFORMER
     elif "best performer" in msg:
-        result = db.session.query(
+        query = db.session.query(
             Deal.owner,
             func.sum(Deal.value)
-        ).filter(Deal.status == "won") \
-         .group_by(Deal.owner) \
+        ).filter(Deal.status == "won")
+        if organization_id is not None:
+            query = query.filter(Deal.organization_id == organization_id)
+
+        result = query.group_by(Deal.owner) \
          .order_by(func.sum(Deal.value).desc()) \
          .first()
 
@@ -48,4 +50,4 @@ def process_message(message):
             return "No performance data available."
 
     else:
-        return "I didn't understand. You can ask about 'total leads', 'revenue', 'won deals', or 'best performer'."
\ No newline at end of file
+        return "I didn't understand. You can ask about 'total leads', 'revenue', 'won deals', or 'best performer'."
@@ -0,0 +1,162 @@
+from datetime import datetime
+from sqlalchemy import func, case
+from sqlalchemy.dialects import mysql, sqlite
+from extensions import db
+from models.contact import Contact
+from models.ticket import Ticket
+from models.feedback import Feedback
+from models.customer_health import CustomerHealth, CustomerHealthSnapshot
+
+OPEN_TICKET_STATUSES = ['Open', 'In Progress', 'Pending']
+
+
+def get_health_status(score):
+    """Determines status based on score."""
+    if score >= 80:
+        return "Healthy"
+    elif score >= 50:
+        return "At Risk"
+    else:
+        return "Churn Risk"
+
+
+def calculate_trend(current_score, previous_score):
+    """Calculates percentage trend."""
+    if not previous_score:
+        return 0.0
+    return round(((current_score - previous_score) / previous_score) * 100, 1)
+
+
+def _nps_by_contact(org_id):
+    rows = db.session.query(Feedback.contact_id, func.avg(Feedback.rating))\
+        .join(Contact, Feedback.contact_id == Contact.id)\
+        .filter(Contact.organization_id == org_id)\
+        .group_by(Feedback.contact_id).all()
+    return {contact_id: round(float(avg or 0), 1) for contact_id, avg in rows}
+
+
+def _tickets_by_contact(org_id):
+    """Open-ticket and SLA-breach counts per contact in one grouped query."""
+    rows = db.session.query(
+        Ticket.contact_id,
+        func.sum(case((Ticket.status.in_(OPEN_TICKET_STATUSES), 1), else_=0)),
+        func.sum(case((Ticket.sla_breached == True, 1), else_=0))
+    ).join(Contact, Ticket.contact_id == Contact.id)\
+        .filter(Contact.organization_id == org_id)\
+        .group_by(Ticket.contact_id).all()
+    return {contact_id: (int(open_count or 0), int(breaches or 0)) for contact_id, open_count, breaches in rows}
+
+
+def _previous_scores(org_id):
+    """Last known score per contact: the current snapshot, falling back to CustomerHealth history."""
+    previous = dict(
+        db.session.query(CustomerHealthSnapshot.contact_id, CustomerHealthSnapshot.health_score)
+        .filter(CustomerHealthSnapshot.organization_id == org_id).all()
+    )
+    if previous:
+        return previous
+
+    latest_ids = db.session.query(func.max(CustomerHealth.id))\
+        .join(Contact, CustomerHealth.contact_id == Contact.id)\
+        .filter(Contact.organization_id == org_id)\
+        .group_by(CustomerHealth.contact_id)
+    return dict(
+        db.session.query(CustomerHealth.contact_id, CustomerHealth.health_score)
+        .filter(CustomerHealth.id.in_(latest_ids)).all()
+    )
+
+
+def _upsert_snapshots(rows):
+    table = CustomerHealthSnapshot.__table__
+    update_cols = ['organization_id', 'nps', 'open_tickets', 'sla_breaches',
+                   'health_score', 'health_status', 'trend', 'computed_at']
+    dialect = db.engine.dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['contact_id'],
+            set_={c: stmt.excluded[c] for c in update_cols}
+        )
+    else:
+        contact_ids = [r['contact_id'] for r in rows]
+        db.session.execute(table.delete().where(table.c.contact_id.in_(contact_ids)))
+        stmt = table.insert().values(rows)
+
+    db.session.execute(stmt)
+
+
+def refresh_customer_health(org_id, batch_size=1000):
+    """
+    Batch health scoring for one organization.
+    Three grouped queries gather NPS, open tickets and SLA breaches for every
+    contact; scores are written with a bulk upsert and a single commit.
+    Returns the number of contacts scored.
+    """
+    now = datetime.utcnow().replace(microsecond=0) # MySQL DATETIME drops microseconds
+    contact_ids = [cid for (cid,) in db.session.query(Contact.id)
+                   .filter_by(organization_id=org_id, is_deleted=False).all()]
+
+    nps_map = _nps_by_contact(org_id)
+    ticket_map = _tickets_by_contact(org_id)
+    previous = _previous_scores(org_id)
+
+    snapshots = []
+    history = []
+    for contact_id in contact_ids:
+        nps = nps_map.get(contact_id, 0)
+        open_tickets, sla = ticket_map.get(contact_id, (0, 0))
+
+        # Formula: (NPS * 4) - (Open Tickets * 5) - (SLA Breaches * 10)
+        score = int((nps * 4) - (open_tickets * 5) - (sla * 10))
+        status = get_health_status(score)
+        prev_score = previous.get(contact_id)
+        trend = calculate_trend(score, prev_score) if prev_score is not None else 0.0
+
+        snapshots.append({
+            "contact_id": contact_id, "organization_id": org_id, "nps": nps,
+            "open_tickets": open_tickets, "sla_breaches": sla, "health_score": score,
+            "health_status": status, "trend": trend, "computed_at": now
+        })
+        # Keep the CustomerHealth history table in step: one row per score change
+        if prev_score is None or prev_score != score:
+            history.append({
+                "contact_id": contact_id, "health_score": score,
+                "health_status": status, "trend": trend, "updated_at": now
+            })
+
+    try:
+        for i in range(0, len(snapshots), batch_size):
+            _upsert_snapshots(snapshots[i:i + batch_size])
+        if history:
+            db.session.execute(CustomerHealth.__table__.insert(), history)
+        # Drop snapshots of contacts that were deleted since the last run
+        CustomerHealthSnapshot.query.filter(
+            CustomerHealthSnapshot.organization_id == org_id,
+            CustomerHealthSnapshot.computed_at < now
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[FAIL] Customer health refresh failed for org {org_id}: {e}")
+        raise
+
+    return len(snapshots)
+
+
+def refresh_all_customer_health():
+    """
+    Scheduler job: rescore every organization that has contacts.
+    Must run inside an app context.
+    """
+    org_ids = [org_id for (org_id,) in db.session.query(Contact.organization_id)
+               .filter(Contact.organization_id.isnot(None)).distinct().all()]
+    for org_id in org_ids:
+        try:
+            refresh_customer_health(org_id)
+        except Exception:
+            pass # Logged in refresh_customer_health
+    print(f"[OK] Customer health refreshed for {len(org_ids)} organization(s).")
@@ -0,0 +1,210 @@
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from flask import current_app
+from extensions import db
+from models.campaign_log import CampaignLog
+from models.whatsapp_log import WhatsAppCampaignLog
+
+# Plain row passed to worker threads (ORM objects must not cross threads)
+Recipient = namedtuple('Recipient', ['id', 'name', 'email', 'phone', 'company', 'owner'])
+
+DeliveryResult = namedtuple('DeliveryResult', ['recipient', 'status', 'error_message', 'sent_at'])
+
+DEFAULT_RATE_LIMITS = {
+    'email': 50,     # messages / second
+    'whatsapp': 20,
+    'social': 1,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(channel):
+    """One bucket per channel per process, shared by every running campaign."""
+    with _buckets_lock:
+        if channel not in _buckets:
+            limits = current_app.config.get('CAMPAIGN_RATE_LIMITS', DEFAULT_RATE_LIMITS)
+            _buckets[channel] = TokenBucket(limits.get(channel, DEFAULT_RATE_LIMITS.get(channel, 10)))
+        return _buckets[channel]
+
+
+class MockTransport:
+    """Simulated provider (no real ESP/WhatsApp/social integration yet): fixed network delay per send."""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+
+    def send(self, channel, recipient, message):
+        time.sleep(self.delay)
+
+
+class FakeTransport:
+    """
+    Local in-memory transport for tests: records every send and raises for
+    recipient ids listed in fail_ids.
+    """
+
+    def __init__(self, fail_ids=()):
+        self.fail_ids = set(fail_ids)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, channel, recipient, message):
+        if recipient.id in self.fail_ids:
+            raise RuntimeError(f"Fake transport rejected recipient {recipient.id}")
+        with self.lock:
+            self.sent.append((channel, recipient.id, message))
+
+
+class DeliveryStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def per_second(self):
+        elapsed = self.elapsed
+        return (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            "sent": self.sent, "failed": self.failed,
+            "elapsed_seconds": round(self.elapsed, 2), "per_second": round(self.per_second, 1)
+        }
+
+
+class DeliveryEngine:
+    """
+    Fans campaign sends out over a bounded thread pool. Workers only talk to the
+    transport; the calling thread (which owns the DB session) collects results
+    and writes CampaignLog / WhatsAppCampaignLog rows in bulk batches, at least
+    every heartbeat_seconds. Each batch commit also refreshes campaign.heartbeat_at.
+    """
+
+    def __init__(self, transport, workers=8, log_batch_size=500, rate_limiter=None, heartbeat_seconds=30):
+        self.transport = transport
+        self.workers = workers
+        self.log_batch_size = log_batch_size
+        self.rate_limiter = rate_limiter or get_rate_limiter
+        self.heartbeat_seconds = heartbeat_seconds
+
+    def _send_one(self, channel, limiter, recipient, message):
+        limiter.acquire()
+        try:
+            self.transport.send(channel, recipient, message)
+            return DeliveryResult(recipient, 'sent', None, datetime.utcnow())
+        except Exception as e:
+            return DeliveryResult(recipient, 'failed', str(e), datetime.utcnow())
+
+    def _flush(self, campaign, channel, results, stats):
+        campaign.heartbeat_at = datetime.utcnow()
+        if not results:
+            db.session.commit()
+            return
+        db.session.execute(CampaignLog.__table__.insert(), [{
+            "campaign_id": campaign.id,
+            "contact_id": r.recipient.id,
+            "status": r.status,
+            "channel": campaign.channel,
+            "error_message": r.error_message,
+            "created_at": r.sent_at
+        } for r in results])
+
+        if channel == 'whatsapp':
+            db.session.execute(WhatsAppCampaignLog.__table__.insert(), [{
+                "campaign_id": str(campaign.id),
+                "lead_id": r.recipient.id,
+                "phone": r.recipient.phone or '',
+                "status": r.status,
+                "error_message": r.error_message,
+                "sent_at": r.sent_at,
+                "organization_id": campaign.organization_id
+            } for r in results])
+
+        db.session.commit()
+        print(f"   -> Campaign {campaign.id}: {stats.sent} sent, {stats.failed} failed ({stats.per_second:.1f}/s)")
+
+    def deliver(self, campaign, recipients, build_message):
+        """
+        Sends build_message(recipient) to every recipient over campaign.channel.
+        recipients may be any iterable (it is consumed lazily); at most
+        workers * 4 sends are in flight at once. Returns DeliveryStats.
+        """
+        channel = (campaign.channel or '').lower()
+        limiter = self.rate_limiter(channel)
+        stats = DeliveryStats()
+        pending_logs = []
+        in_flight = set()
+        max_in_flight = self.workers * 4
+        last_flush = [time.monotonic()]
+
+        def collect(done):
+            for future in done:
+                result = future.result()
+                if result.status == 'sent':
+                    stats.sent += 1
+                else:
+                    stats.failed += 1
+                pending_logs.append(result)
+            if len(pending_logs) >= self.log_batch_size or time.monotonic() - last_flush[0] >= self.heartbeat_seconds:
+                self._flush(campaign, channel, pending_logs, stats)
+                pending_logs.clear()
+                last_flush[0] = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'campaign-{campaign.id}') as pool:
+            for recipient in recipients:
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(pool.submit(self._send_one, channel, limiter, recipient, build_message(recipient)))
+
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        self._flush(campaign, channel, pending_logs, stats)
+        return stats
+
+
+def get_delivery_engine(transport=None):
+    config = current_app.config
+    return DeliveryEngine(
+        transport or MockTransport(config.get('CAMPAIGN_MOCK_DELAY', 0.1)),
+        workers=config.get('CAMPAIGN_WORKERS', 8),
+        log_batch_size=config.get('CAMPAIGN_LOG_BATCH_SIZE', 500),
+        heartbeat_seconds=config.get('CAMPAIGN_HEARTBEAT_SECONDS', 30)
+    )
@@ -1,3 +1,5 @@
+import smtplib
+from contextlib import contextmanager
 from flask_mail import Message
 from extensions import mail
 from flask import current_app
@@ -39,4 +41,53 @@ def send_email(to_email, subject, body):
         )
         mail.send(msg)
     except Exception as e:
-        print(f"[FAIL] Could not send generic email: {e}")
\ No newline at end of file
+        print(f"[FAIL] Could not send generic email: {e}")
+
+
+class EmailSession:
+    """
+    Sends many messages over one persistent SMTP connection.
+    Flask-Mail reconnects on its own every MAIL_MAX_EMAILS messages; a dropped
+    connection is re-opened once and the message retried. If that fails too, the
+    disconnect (or socket error) propagates: the session is unusable.
+    """
+
+    def __init__(self, connection, sender):
+        self.connection = connection
+        self.sender = sender
+
+    def send(self, to_email, subject, body):
+        msg = Message(subject=subject, sender=self.sender, recipients=[to_email], body=body)
+        try:
+            try:
+                self.connection.send(msg)
+            except smtplib.SMTPServerDisconnected:
+                self.connection.host = self.connection.configure_host()
+                self.connection.send(msg)
+            return True
+        except smtplib.SMTPServerDisconnected:
+            raise
+        except smtplib.SMTPException as e: # Refused recipient/data: this message only
+            print(f"[FAIL] Could not send email to {to_email}: {e}")
+            return False
+        except OSError:
+            raise # Socket-level: the connection is gone
+        except Exception as e:
+            print(f"[FAIL] Could not send email to {to_email}: {e}")
+            return False
+
+
+@contextmanager
+def email_session():
+    """
+    Yields an EmailSession bound to a single SMTP connection, or None when
+    MAIL_USERNAME is not configured (callers skip sending, like send_email).
+    """
+    sender = current_app.config.get('MAIL_USERNAME')
+    if not sender:
+        print("[WARN] MAIL_USERNAME not set. Skipping email.")
+        yield None
+        return
+
+    with mail.connect() as connection:
+        yield EmailSession(connection, sender)
@@ -0,0 +1,104 @@
+import io
+import csv
+import os
+import tempfile
+from datetime import datetime, date
+from sqlalchemy import select
+from extensions import db
+
+DEFAULT_BATCH_SIZE = 2000
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class ExportColumn:
+    """One exported column: header label, the SQL column to select and an optional value formatter."""
+
+    def __init__(self, label, column, formatter=None):
+        self.label = label
+        self.column = column
+        self.formatter = formatter
+
+    def format(self, value):
+        if value is None:
+            return ''
+        if self.formatter:
+            return self.formatter(value)
+        return value
+
+
+def isoformat(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else str(value)
+
+
+def iter_keyset_batches(columns, key_column, filters=(), descending=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields lists of row tuples using keyset pagination on key_column
+    (WHERE key > :last ORDER BY key LIMIT n), so every page is an index range scan
+    and no ORM objects are built. The key is selected as the first value of each row
+    and stripped before yielding.
+    """
+    select_columns = [key_column] + [c.column for c in columns]
+    last_key = None
+
+    while True:
+        stmt = select(*select_columns)
+        for clause in filters:
+            stmt = stmt.where(clause)
+        if last_key is not None:
+            stmt = stmt.where(key_column < last_key if descending else key_column > last_key)
+        stmt = stmt.order_by(key_column.desc() if descending else key_column.asc()).limit(batch_size)
+
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            return
+        last_key = rows[-1][0]
+        yield [tuple(col.format(v) for col, v in zip(columns, row[1:])) for row in rows]
+        if len(rows) < batch_size:
+            return
+
+
+def stream_csv(columns, batches):
+    """Generator of CSV text: the header, then one encoded block per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([c.label for c in columns])
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining
+
+
+def stream_xlsx(columns, batches):
+    """
+    Writes rows through openpyxl's write-only workbook (rows are flushed to a temp
+    file as they are appended, so memory stays flat) and then streams the finished
+    file in FILE_CHUNK_SIZE pieces. XLSX is a zip, so bytes can only be sent once
+    the workbook is closed.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([c.label for c in columns])
+    for batch in batches:
+        for row in batch:
+            sheet.append(list(row))
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
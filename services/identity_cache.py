@@ -0,0 +1,88 @@
+from collections import namedtuple
+from sqlalchemy import select, event
+from extensions import db
+from models.user import User
+from services.resolution_cache import TTLCache, _MISSING
+
+# What authorization needs on every request; anything else loads the full User lazily
+Identity = namedtuple('Identity', ['id', 'role', 'organization_id', 'team_id', 'is_deleted', 'token_version'])
+
+# user id -> Identity. Short TTL: other processes see role/org changes within a minute
+_identities = TTLCache(maxsize=20000, ttl=60)
+
+
+def get_identity(user_id):
+    """Identity for the user id, or None if the user does not exist."""
+    identity = _identities.get(user_id)
+    if identity is not _MISSING:
+        return identity
+    row = db.session.execute(
+        select(User.id, User.role, User.organization_id, User.team_id, User.is_deleted, User.token_version)
+        .where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+    identity = Identity(row.id, row.role, row.organization_id, row.team_id, bool(row.is_deleted), row.token_version or 0)
+    _identities.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(user_id):
+    _identities.delete(user_id)
+
+
+class CurrentUser:
+    """
+    What token_required passes to handlers. id, role, organization_id, team_id and
+    is_deleted come from the cached Identity; any other attribute (name, email,
+    organization, ...) or assignment loads the User row on first use and delegates to it.
+    """
+
+    def __init__(self, identity):
+        object.__setattr__(self, '_identity', identity)
+        object.__setattr__(self, '_user', None)
+
+    def _get_current_object(self):
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._identity.id))
+        return self._user
+
+    def __getattr__(self, name):
+        # Only reached for names not defined on the class
+        return getattr(self._get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_current_object(), name, value)
+
+    def _field(name):
+        def getter(self):
+            if self._user is not None: # Loaded (and maybe modified by the handler)
+                return getattr(self._user, name)
+            return getattr(self._identity, name)
+        return property(getter)
+
+    id = _field('id')
+    role = _field('role')
+    organization_id = _field('organization_id')
+    team_id = _field('team_id')
+    is_deleted = _field('is_deleted')
+    token_version = _field('token_version')
+    del _field
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id and isinstance(other, (User, CurrentUser))
+
+    def __hash__(self):
+        return hash(('user', self.id))
+
+    def __repr__(self):
+        return f"<CurrentUser {self.id}>"
+
+
+# Invalidation (local to this process; others converge within the TTL)
+def _forget_user(mapper, connection, target):
+    invalidate_identity(target.id)
+
+
+event.listen(User, 'after_update', _forget_user)
+event.listen(User, 'after_delete', _forget_user)
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_, and_, func
+from werkzeug.utils import secure_filename
+from extensions import db
+from models.import_job import ImportJob
+from models.activity_log import ActivityLog
+from services.import_service import (
+    ImportResult, iter_import_chunks, check_required_columns, import_chunk, DEFAULT_CHUNK_SIZE
+)
+from services.rollup_service import mark_dirty
+
+_executor = None
+_executor_lock = threading.Lock()
+_submitted = set() # Job ids waiting in or running on the executor
+_submitted_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMPORT_WORKERS', 2),
+                thread_name_prefix='import-job'
+            )
+    return _executor
+
+
+def create_import_job(module, file, organization_id, user_id):
+    """Persists the upload under uploads/imports/{org_id}/ and records a queued job."""
+    folder = os.path.join(os.getcwd(), 'uploads', 'imports', str(organization_id or 0))
+    os.makedirs(folder, exist_ok=True)
+
+    filename = secure_filename(file.filename)
+    file_path = os.path.join(folder, f"{uuid.uuid4().hex}_{filename}")
+    file.save(file_path)
+
+    job = ImportJob(
+        module=module,
+        filename=filename,
+        file_path=file_path,
+        status='queued',
+        organization_id=organization_id,
+        created_by=user_id
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def submit_import_job(job_id, app=None):
+    """Queues the job on the executor unless this process already has it queued or running."""
+    app = app or current_app._get_current_object()
+    with _submitted_lock:
+        if job_id in _submitted:
+            return False
+        _submitted.add(job_id)
+    try:
+        _get_executor(app).submit(_run_job, app, job_id)
+    except Exception:
+        with _submitted_lock:
+            _submitted.discard(job_id)
+        raise
+    return True
+
+
+def _claim_job(job_id, stale_before):
+    """
+    Atomically moves a queued (or stalled running) job to running.
+    Only one worker wins the UPDATE, so a job is never processed twice concurrently.
+    """
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(ImportJob)
+        .where(
+            ImportJob.id == job_id,
+            or_(
+                ImportJob.status == 'queued',
+                and_(ImportJob.status == 'running',
+                     or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale_before))
+            )
+        )
+        .values(status='running', heartbeat_at=now, started_at=func.coalesce(ImportJob.started_at, now))
+    )
+    db.session.commit()
+    return claimed.rowcount == 1
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        try:
+            _process_job(app, job_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAIL] Import job {job_id} failed: {e}")
+            job = db.session.get(ImportJob, job_id)
+            if job:
+                job.status = 'failed'
+                job.error_message = str(e)
+                job.finished_at = datetime.utcnow()
+                db.session.commit()
+        finally:
+            db.session.remove()
+            with _submitted_lock:
+                _submitted.discard(job_id)
+
+
+def _process_job(app, job_id):
+    stale_seconds = app.config.get('IMPORT_JOB_STALE_SECONDS', 300)
+    if not _claim_job(job_id, datetime.utcnow() - timedelta(seconds=stale_seconds)):
+        return
+
+    job = db.session.get(ImportJob, job_id)
+    start_offset = job.checkpoint_offset or 0
+
+    # Restore counters so a resumed job reports totals for the whole file
+    result = ImportResult()
+    result.total_rows = start_offset
+    result.imported = job.imported or 0
+    result.failed = job.failed or 0
+    result.errors = json.loads(job.errors) if job.errors else []
+
+    run_started = time.monotonic()
+
+    def checkpoint():
+        elapsed = time.monotonic() - run_started
+        job.checkpoint_offset = result.total_rows
+        job.imported = result.imported
+        job.failed = result.failed
+        job.errors = json.dumps(result.errors)
+        job.rows_per_sec = (result.total_rows - start_offset) / elapsed if elapsed > 0 else 0.0
+        job.heartbeat_at = datetime.utcnow()
+
+    chunk_size = app.config.get('IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    checked = False
+    with open(job.file_path, 'rb') as f:
+        for columns, rows in iter_import_chunks(f, job.filename, chunk_size, start_offset=start_offset):
+            if not checked:
+                check_required_columns(job.module, columns)
+                checked = True
+
+            first_row_num = result.total_rows + 2 # Account for header and 0-based index
+            result.total_rows += len(rows)
+            import_chunk(job.module, rows, first_row_num, job.organization_id, result, before_commit=checkpoint)
+
+    job.status = 'completed'
+    job.finished_at = datetime.utcnow()
+    if job.created_by and job.organization_id:
+        db.session.add(ActivityLog(
+            module="import", action=f"{job.module}_imported",
+            description=f"Imported {result.imported} {job.module}. {result.failed} rows failed.",
+            related_id=job.id, user_id=job.created_by, company_id=job.organization_id
+        ))
+    db.session.commit()
+
+    if job.module == 'leads':
+        mark_dirty(job.organization_id) # Core inserts bypass the ORM flush hooks used by the rollups
+
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+
+
+def resume_import_jobs(app):
+    """
+    Re-submits queued jobs and running jobs whose heartbeat went stale
+    (worker crashed or the process restarted). Safe to call repeatedly: jobs this
+    process already has on its executor are skipped, and _claim_job lets only one
+    worker pick each job up.
+    """
+    with app.app_context():
+        stale_before = datetime.utcnow() - timedelta(seconds=app.config.get('IMPORT_JOB_STALE_SECONDS', 300))
+        job_ids = [job_id for (job_id,) in db.session.query(ImportJob.id).filter(
+            or_(
+                ImportJob.status == 'queued',
+                and_(ImportJob.status == 'running',
+                     or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < stale_before))
+            )
+        ).all()]
+    resumed = sum(1 for job_id in job_ids if submit_import_job(job_id, app))
+    if resumed:
+        print(f"[OK] Resumed {resumed} import job(s).")
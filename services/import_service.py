@@ -0,0 +1,266 @@
+import pandas as pd
+from datetime import datetime
+from extensions import db
+from models.contact import Contact
+from models.crm import Lead
+from services.rollup_service import mark_dirty
+from services.phone_service import normalize_phone
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000 # Keep the error list bounded for very large files
+
+REQUIRED_COLUMNS = {
+    'leads': ['name'],
+    'contacts': ['name', 'email'],
+}
+
+
+class ImportFileError(Exception):
+    """
+    Raised when the uploaded file cannot be read or is missing required columns.
+    When run_import raises it partway through a file, result holds the counts of
+    the chunks already committed (those rows stay imported).
+    """
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class ImportResult:
+    def __init__(self):
+        self.total_rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, row_num, reason):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_num, 'reason': reason})
+
+    def to_dict(self):
+        return {
+            "total_rows": self.total_rows, "imported": self.imported,
+            "failed": self.failed, "errors": self.errors
+        }
+
+
+def normalize_column(col):
+    return str(col).lower().replace(' ', '_').strip()
+
+
+def _clean(value, default=''):
+    if value is None:
+        return default
+    value = str(value).strip()
+    return value if value else default
+
+
+def _iter_csv_chunks(file, chunk_size, start_offset):
+    skip = range(1, start_offset + 1) if start_offset else None
+    reader = pd.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False, skiprows=skip)
+    for chunk in reader:
+        chunk.columns = [normalize_column(c) for c in chunk.columns]
+        yield list(chunk.columns), chunk.to_dict('records')
+
+
+def _iter_xlsx_chunks(file, chunk_size, start_offset):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [normalize_column(c) for c in header]
+
+        batch = []
+        yielded = False
+        for index, values in enumerate(rows):
+            if index < start_offset:
+                continue
+            batch.append({col: ('' if v is None else v) for col, v in zip(columns, values)})
+            if len(batch) >= chunk_size:
+                yield columns, batch
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield columns, batch
+    finally:
+        workbook.close()
+
+
+def iter_import_chunks(file, filename, chunk_size=DEFAULT_CHUNK_SIZE, start_offset=0):
+    """
+    Streams an uploaded CSV/XLSX as (columns, rows) chunks of at most chunk_size rows.
+    start_offset skips that many data rows (used to resume an interrupted import).
+    """
+    name = filename.lower()
+    try:
+        if name.endswith('.csv'):
+            yield from _iter_csv_chunks(file, chunk_size, start_offset)
+        elif name.endswith('.xlsx'):
+            yield from _iter_xlsx_chunks(file, chunk_size, start_offset)
+        else:
+            raise ImportFileError('Invalid file type. Please use CSV or XLSX.')
+    except ImportFileError:
+        raise
+    except Exception as e:
+        raise ImportFileError(str(e))
+
+
+def _existing_emails(model, org_id, emails):
+    """Indexed IN lookup of the emails in this chunk that already exist for the org."""
+    if not emails:
+        return set()
+    rows = db.session.query(model.email).filter(
+        model.organization_id == org_id,
+        model.email.in_(list(emails))
+    ).all()
+    return {e for (e,) in rows}
+
+
+def build_lead_records(rows, first_row_num, org_id, result):
+    """Validates and de-duplicates one chunk of lead rows; returns the insertable records."""
+    candidates = []
+    for offset, row in enumerate(rows):
+        row_num = first_row_num + offset
+        name = _clean(row.get('name'))
+        email = _clean(row.get('email'))
+        if not name:
+            result.fail(row_num, 'Missing name')
+            continue
+        candidates.append((row_num, email, {
+            "name": name,
+            "email": email if email else None,
+            "phone": _clean(row.get('phone')),
+            "phone_normalized": normalize_phone(_clean(row.get('phone'))), # Core insert skips the ORM hook
+            "source": _clean(row.get('source'), 'Import'),
+            "status": _clean(row.get('status'), 'new'), # Default status is 'new'
+            # Location fields can be provided in the import file
+            "city": _clean(row.get('city')) or None,
+            "state": _clean(row.get('state')) or None,
+            "country": _clean(row.get('country')) or None,
+            "organization_id": org_id,
+            "is_deleted": False,
+            "created_at": datetime.utcnow()
+        }))
+
+    existing = _existing_emails(Lead, org_id, {email for _, email, _ in candidates if email})
+    records = []
+    for row_num, email, record in candidates:
+        if email and email in existing:
+            result.fail(row_num, f'Email "{email}" already exists for a lead in your organization')
+            continue
+        if email:
+            existing.add(email)
+        records.append(record)
+
+    return records
+
+
+def build_contact_records(rows, first_row_num, org_id, result):
+    """Validates and de-duplicates one chunk of contact rows; returns the insertable records."""
+    candidates = []
+    for offset, row in enumerate(rows):
+        row_num = first_row_num + offset
+        email = _clean(row.get('email'))
+        name = _clean(row.get('name'))
+        if not name or not email:
+            result.fail(row_num, 'Missing name or email')
+            continue
+        candidates.append((row_num, email, {
+            "name": name,
+            "email": email,
+            "phone": _clean(row.get('phone')),
+            "company": _clean(row.get('company')),
+            "owner": _clean(row.get('owner')),
+            "last_contact": _clean(row.get('last_contact')),
+            "status": _clean(row.get('status'), 'Active'),
+            "organization_id": org_id,
+            "is_deleted": False
+        }))
+
+    existing = _existing_emails(Contact, org_id, {email for _, email, _ in candidates})
+    records = []
+    for row_num, email, record in candidates:
+        if email in existing:
+            result.fail(row_num, f'Email "{email}" already exists')
+            continue
+        existing.add(email)
+        records.append(record)
+
+    return records
+
+
+IMPORTERS = {
+    'leads': (Lead, build_lead_records),
+    'contacts': (Contact, build_contact_records),
+}
+
+
+def check_required_columns(module, columns):
+    missing = [col for col in REQUIRED_COLUMNS[module] if col not in columns]
+    if missing:
+        raise ImportFileError(f'Missing required columns: {", ".join(missing)}')
+
+
+def import_chunk(module, rows, first_row_num, org_id, result, before_commit=None):
+    """
+    Imports one chunk: one IN query for duplicates, one multi-row INSERT and a commit.
+    before_commit runs inside the same transaction (import jobs write their
+    checkpoint there so data and offset commit together).
+    Returns the number of rows inserted.
+    """
+    model, build_records = IMPORTERS[module]
+    records = build_records(rows, first_row_num, org_id, result)
+    try:
+        if records:
+            # executemany; PyMySQL rewrites this into a single INSERT ... VALUES (...), (...)
+            db.session.execute(model.__table__.insert(), records)
+        result.imported += len(records)
+        if before_commit:
+            before_commit()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        result.imported -= len(records)
+        result.failed += len(records)
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            last_row = first_row_num + len(rows) - 1
+            result.errors.append({'row': first_row_num, 'reason': f'Database error in rows {first_row_num}-{last_row}: {str(e)}'})
+        if before_commit:
+            # Still advance past the failed chunk
+            before_commit()
+            db.session.commit()
+        return 0
+    return len(records)
+
+
+def run_import(module, file, filename, org_id, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streaming import: reads the file chunk by chunk, de-duplicates each chunk
+    against the org with one IN query, inserts it as one multi-row batch and
+    commits, so memory stays bounded by chunk_size regardless of file size.
+    """
+    result = ImportResult()
+    checked = False
+
+    try:
+        for columns, rows in iter_import_chunks(file, filename, chunk_size):
+            if not checked:
+                check_required_columns(module, columns)
+                checked = True
+
+            first_row_num = result.total_rows + 2 # Account for header and 0-based index
+            result.total_rows += len(rows)
+            import_chunk(module, rows, first_row_num, org_id, result)
+    except ImportFileError as e:
+        e.result = result # Earlier chunks are committed: report what they imported
+        raise
+    finally:
+        if module == 'leads' and result.imported:
+            mark_dirty(org_id) # Core inserts bypass the ORM flush hooks used by the rollups
+    return result
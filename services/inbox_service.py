@@ -0,0 +1,266 @@
+import json
+import base64
+from datetime import datetime
+from sqlalchemy import select, update, bindparam, case, func, or_, and_, event
+from sqlalchemy.dialects import mysql, sqlite
+from extensions import db
+from models.conversation import Conversation
+from models.conversation_read import ConversationRead
+from models.message import Message
+from models.crm import Lead
+
+PREVIEW_LENGTH = 255
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# --- Write side ---
+
+def summarize_messages(messages):
+    """
+    Folds (conversation_id, created_at, content, sender_type) tuples into one
+    projection update per conversation: the newest message wins the preview,
+    customer messages add to inbound_count.
+    """
+    updates = {}
+    for conversation_id, created_at, content, sender_type in messages:
+        current = updates.get(conversation_id)
+        if current is None:
+            current = updates[conversation_id] = {"b_id": conversation_id, "b_at": created_at, "b_preview": None,
+                                                  "b_sender": None, "b_inbound": 0}
+        if created_at >= current["b_at"] or current["b_preview"] is None:
+            current["b_at"] = created_at
+            current["b_preview"] = (content or '')[:PREVIEW_LENGTH]
+            current["b_sender"] = sender_type
+        if sender_type == 'customer':
+            current["b_inbound"] += 1
+    return list(updates.values())
+
+
+def apply_conversation_updates(updates):
+    """
+    Applies summarize_messages() output with one executemany UPDATE. The counter is
+    incremented in SQL and the preview only moves forward in time, so concurrent
+    writers (ingest workers, agents replying) never lose an update.
+    Runs in the caller's transaction.
+    """
+    if not updates:
+        return
+    table = Conversation.__table__
+    is_newer = or_(table.c.last_message_at.is_(None), table.c.last_message_at <= bindparam('b_at'))
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('b_id'))
+        .values(
+            # Preview/sender first: on MySQL later SET clauses see earlier assignments
+            last_message_preview=case((is_newer, bindparam('b_preview')), else_=table.c.last_message_preview),
+            last_sender_type=case((is_newer, bindparam('b_sender')), else_=table.c.last_sender_type),
+            last_message_at=case((is_newer, bindparam('b_at')), else_=table.c.last_message_at),
+            inbound_count=func.coalesce(table.c.inbound_count, 0) + bindparam('b_inbound')
+        ),
+        updates
+    )
+
+
+def record_message(conversation_id, created_at, content, sender_type):
+    apply_conversation_updates(summarize_messages([(conversation_id, created_at, content, sender_type)]))
+
+
+def mark_read(conversation_id, user_id):
+    """Sets the agent's read marker to the conversation's current inbound_count (upsert)."""
+    inbound = select(func.coalesce(Conversation.inbound_count, 0))\
+        .where(Conversation.id == conversation_id).scalar_subquery()
+    values = {"conversation_id": conversation_id, "user_id": user_id,
+              "read_inbound_count": inbound, "read_at": datetime.utcnow()}
+    table = ConversationRead.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update(read_inbound_count=stmt.inserted.read_inbound_count,
+                                            read_at=stmt.inserted.read_at)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['conversation_id', 'user_id'],
+            set_={"read_inbound_count": stmt.excluded.read_inbound_count, "read_at": stmt.excluded.read_at}
+        )
+    else:
+        db.session.execute(table.delete().where(table.c.conversation_id == conversation_id,
+                                                table.c.user_id == user_id))
+        stmt = table.insert().values(**values)
+    db.session.execute(stmt)
+
+
+# --- Read side ---
+
+def encode_cursor(last_message_at, conversation_id):
+    raw = json.dumps({"t": last_message_at.isoformat() if last_message_at else None, "id": conversation_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns (last_message_at, id); raises ValueError for a malformed cursor."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        at = datetime.fromisoformat(data["t"]) if data.get("t") else None
+        return at, int(data["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def inbox_page_query(user, limit, after=None, never_messaged=False):
+    """
+    One phase of an inbox page, ordered by (last_message_at DESC, id DESC) so the
+    (organization_id, last_message_at, id) index returns rows in order:
+    conversations with messages, or (never_messaged) the ones without any, by id.
+    after: the (last_message_at, id) of the previous row in that phase.
+    """
+    unread = func.coalesce(Conversation.inbound_count, 0) - func.coalesce(ConversationRead.read_inbound_count, 0)
+    stmt = select(
+        Conversation.id, Conversation.lead_id, Conversation.lead_name, Conversation.channel,
+        Conversation.status, Conversation.assigned_to, Conversation.last_message_preview,
+        Conversation.last_sender_type, Conversation.last_message_at, unread.label('unread_count')
+    ).outerjoin(ConversationRead, and_(
+        ConversationRead.conversation_id == Conversation.id,
+        ConversationRead.user_id == user.id
+    )).where(Conversation.organization_id == user.organization_id)
+
+    # Permissions
+    if user.role not in ['SUPER_ADMIN', 'MANAGER']: # Agent
+        stmt = stmt.where(Conversation.assigned_to == user.id)
+
+    if never_messaged:
+        stmt = stmt.where(Conversation.last_message_at.is_(None))
+        if after is not None:
+            stmt = stmt.where(Conversation.id < after[1])
+        return stmt.order_by(Conversation.id.desc()).limit(limit)
+
+    stmt = stmt.where(Conversation.last_message_at.is_not(None))
+    if after is not None:
+        at, last_id = after
+        stmt = stmt.where(or_(
+            Conversation.last_message_at < at,
+            and_(Conversation.last_message_at == at, Conversation.id < last_id)
+        ))
+    return stmt.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(limit)
+
+
+def list_inbox(user, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    One page of the inbox, newest activity first, with the agent's read marker
+    joined in. Conversations that never had a message come last, as a second
+    phase once the others run out; each phase is one indexed query.
+    Returns (rows, next_cursor).
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    rows = []
+    if after is None or after[0] is not None:
+        rows = db.session.execute(inbox_page_query(user, limit + 1, after)).all()
+        after = None # The second phase starts from its beginning
+    if len(rows) <= limit:
+        rows += db.session.execute(inbox_page_query(user, limit + 1 - len(rows), after, never_messaged=True)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].last_message_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def list_messages(conversation_id, limit=DEFAULT_PAGE_SIZE, before=None, after=None, since=None):
+    """
+    One page of a conversation's messages, newest first, on the
+    (conversation_id, created_at, id) index.
+      before=<message id>  older messages than that one (scroll back)
+      after=<message id>   newer messages than that one (scroll forward)
+      since=<message id>   everything stored after that id, for polling/reconnects.
+                           Uses id (insertion order), not created_at: webhook
+                           messages carry the sender's timestamp and can arrive late.
+    Returns (messages, has_more). Raises ValueError for an unknown cursor.
+    """
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    stmt = select(Message).where(Message.conversation_id == conversation_id)
+
+    if since is not None:
+        stmt = stmt.where(Message.id > int(since)).order_by(Message.id)
+        messages = db.session.scalars(stmt.limit(limit + 1)).all()
+        has_more = len(messages) > limit
+        return list(reversed(messages[:limit])), has_more
+
+    cursor_id = before if before is not None else after
+    if cursor_id is not None:
+        cursor_at = db.session.scalar(
+            select(Message.created_at).where(Message.id == int(cursor_id), Message.conversation_id == conversation_id)
+        )
+        if cursor_at is None:
+            raise ValueError("Unknown message cursor")
+        if before is not None:
+            stmt = stmt.where(or_(
+                Message.created_at < cursor_at,
+                and_(Message.created_at == cursor_at, Message.id < int(cursor_id))
+            ))
+        else:
+            stmt = stmt.where(or_(
+                Message.created_at > cursor_at,
+                and_(Message.created_at == cursor_at, Message.id > int(cursor_id))
+            ))
+
+    if after is not None and before is None:
+        # Nearest newer messages first, then flip to the newest-first page order
+        stmt = stmt.order_by(Message.created_at, Message.id)
+        messages = db.session.scalars(stmt.limit(limit + 1)).all()
+        return list(reversed(messages[:limit])), len(messages) > limit
+
+    stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc())
+    messages = db.session.scalars(stmt.limit(limit + 1)).all()
+    return messages[:limit], len(messages) > limit
+
+
+def message_page_args(args):
+    """Reads limit/before/after/since from request.args; raises ValueError on bad input."""
+    page = {"limit": args.get('limit', DEFAULT_PAGE_SIZE, type=int)}
+    for name in ('before', 'after', 'since'):
+        value = args.get(name)
+        if value is not None:
+            if not value.isdigit():
+                raise ValueError(f"'{name}' must be a message id")
+            page[name] = int(value)
+    return page
+
+
+def message_page_headers(messages, has_more, page):
+    """
+    X-Before-Cursor: pass as ?before= to load older messages (only when there are more).
+    X-After-Cursor: pass as ?after= to load newer messages (only when there are more).
+    X-Since-Cursor: pass as ?since= on the next poll (newest page and since mode only).
+    X-Has-More: in since mode, more new messages are waiting than fit in the page.
+    """
+    headers = {}
+    since = page.get('since')
+    if since is not None:
+        headers['X-Since-Cursor'] = str(max([m.id for m in messages], default=since))
+        headers['X-Has-More'] = 'true' if has_more else 'false'
+        return headers
+    if messages and has_more:
+        if page.get('after') is None:
+            headers['X-Before-Cursor'] = str(messages[-1].id)
+        else:
+            headers['X-After-Cursor'] = str(messages[0].id)
+    if page.get('before') is None and page.get('after') is None and messages:
+        headers['X-Since-Cursor'] = str(max(m.id for m in messages))
+    return headers
+
+
+# --- Keep lead_name in step with the lead ---
+
+@event.listens_for(Lead, 'after_update')
+def _sync_lead_name(mapper, connection, target):
+    if db.inspect(target).attrs['name'].history.has_changes():
+        connection.execute(
+            update(Conversation.__table__)
+            .where(Conversation.__table__.c.lead_id == target.id)
+            .values(lead_name=target.name)
+        )
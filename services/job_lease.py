@@ -0,0 +1,55 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.scheduler_lease import SchedulerLease
+
+# Identifies this process across hosts (gunicorn workers, extra nodes)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(name, ttl_seconds):
+    """
+    Takes the named lease if it is free or expired. Returns True for exactly one
+    caller per lease period, whichever process it runs in.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+
+    claimed = db.session.execute(
+        update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.expires_at <= now)
+        .values(owner=WORKER_ID, acquired_at=now, expires_at=expires_at)
+    )
+    db.session.commit()
+    if claimed.rowcount == 1:
+        return True
+
+    # First run ever: the row does not exist yet; the primary key decides the race
+    try:
+        db.session.add(SchedulerLease(name=name, owner=WORKER_ID, acquired_at=now, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def run_exclusive(app, name, ttl_seconds, func, *args, **kwargs):
+    """
+    Scheduler wrapper: runs func inside an app context only if this process wins
+    the lease. The lease is kept until it expires (not released on finish), so
+    workers whose timers fire a little later in the same interval skip the run.
+    ttl_seconds should be slightly shorter than the job interval.
+    """
+    with app.app_context():
+        try:
+            if not acquire_lease(name, ttl_seconds):
+                return None
+        except Exception as e:
+            db.session.rollback()
+            print(f"[FAIL] Could not acquire lease '{name}': {e}")
+            return None
+        return func(*args, **kwargs)
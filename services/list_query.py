@@ -0,0 +1,214 @@
+import json
+import base64
+from datetime import datetime, date
+from sqlalchemy import select, func, or_, and_
+from extensions import db
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+COUNT_ESTIMATE_CAP = 10000
+
+
+class ListField:
+    """One response key: the SQL column behind it and an optional value formatter."""
+
+    def __init__(self, name, column, formatter=None):
+        self.name = name
+        self.column = column
+        self.formatter = formatter
+
+    def format(self, value):
+        if value is None:
+            return None
+        if self.formatter:
+            return self.formatter(value)
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value
+
+
+class ListFilter:
+    """
+    A whitelisted ?param= filter. op: 'eq' (comma-separated values become IN),
+    'like' (case-insensitive substring), 'gte' / 'lte' (ISO dates or numbers).
+    """
+
+    def __init__(self, param, column, op='eq'):
+        self.param = param
+        self.column = column
+        self.op = op
+
+    def clause(self, raw):
+        if self.op == 'eq':
+            values = [v for v in raw.split(',') if v != '']
+            return self.column == values[0] if len(values) == 1 else self.column.in_(values)
+        if self.op == 'like':
+            return self.column.icontains(raw, autoescape=True) # ILIKE with % and _ escaped
+        value = _parse_bound(raw)
+        return self.column >= value if self.op == 'gte' else self.column <= value
+
+
+class ListSpec:
+    """What a list endpoint exposes: fields (in output order), default fields, filters and sorts."""
+
+    def __init__(self, key_column, fields, filters=(), sorts=None, default_sort='id', default_fields=None):
+        self.key_column = key_column
+        self.fields = {f.name: f for f in fields}
+        self.filters = {f.param: f for f in filters}
+        self.sorts = sorts or {'id': key_column}
+        self.default_sort = default_sort
+        self.default_fields = default_fields or [f.name for f in fields]
+
+
+def _parse_bound(raw):
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        pass
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f"Invalid filter value '{raw}'")
+
+
+def _encode_cursor(value, key):
+    kind = 'dt' if isinstance(value, datetime) else 'd' if isinstance(value, date) else None
+    raw = {"v": value.isoformat() if kind else value, "k": kind, "id": key}
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        value = data.get("v")
+        if data.get("k") == 'dt':
+            value = datetime.fromisoformat(value)
+        elif data.get("k") == 'd':
+            value = date.fromisoformat(value)
+        return value, data["id"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _nullable(sort_column, key_column):
+    """Whether sorting on the column needs the NULLs-last ordering term (never for the key)."""
+    return sort_column is not key_column and getattr(sort_column.expression, 'nullable', True)
+
+
+def _keyset_clause(sort_column, key_column, value, key, descending, nullable):
+    """
+    Rows after (value, key) in ORDER BY sort, key, or, for a nullable sort column,
+    ORDER BY sort IS NULL, sort, key (NULLs always last).
+    """
+    key_after = key_column < key if descending else key_column > key
+    if sort_column is key_column:
+        return key_after
+    if value is None:
+        return and_(sort_column.is_(None), key_after)
+    value_after = sort_column < value if descending else sort_column > value
+    if not nullable:
+        return or_(value_after, and_(sort_column == value, key_after))
+    return or_(value_after, and_(sort_column == value, key_after), sort_column.is_(None))
+
+
+def _count(stmt, mode):
+    """Exact COUNT(*), or an estimate: the optimizer's row estimate on MySQL, a capped count elsewhere."""
+    if mode == 'exact':
+        return db.session.scalar(select(func.count()).select_from(stmt.subquery())), False
+    if db.engine.dialect.name == 'mysql':
+        # Bound parameters stay parameters: filter values never become SQL text
+        compiled = stmt.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+        params = compiled.params
+        if compiled.positional:
+            params = tuple(params[name] for name in compiled.positiontup)
+        plan = db.session.connection().exec_driver_sql(f"EXPLAIN {compiled}", params).mappings().first()
+        return int((plan or {}).get('rows') or 0), True
+    capped = db.session.scalar(select(func.count()).select_from(stmt.limit(COUNT_ESTIMATE_CAP + 1).subquery()))
+    return min(capped, COUNT_ESTIMATE_CAP), capped > COUNT_ESTIMATE_CAP
+
+
+def build_list_query(spec, base_filters, args):
+    """
+    The statements behind run_list_query(): (page statement, count statement,
+    fields, limit). The count statement is the filtered query before the cursor,
+    order and limit. limit is None (no LIMIT) unless the request pages with
+    ?limit= or ?cursor=. Also used by explain_queries.py, so the plans it checks
+    are the ones the endpoints run. Raises ValueError for invalid input.
+    """
+    limit = None
+    if 'limit' in args or 'cursor' in args:
+        limit = max(1, min(args.get('limit', DEFAULT_LIMIT, type=int) or DEFAULT_LIMIT, MAX_LIMIT))
+
+    sort = args.get('sort') or f"-{spec.default_sort}"
+    descending = sort.startswith('-')
+    sort_name = sort.lstrip('-')
+    if sort_name not in spec.sorts:
+        raise ValueError(f"Cannot sort by '{sort_name}'. Allowed: {', '.join(spec.sorts)}")
+    sort_column = spec.sorts[sort_name]
+
+    if args.get('fields'):
+        names = [n.strip() for n in args['fields'].split(',') if n.strip()]
+        unknown = [n for n in names if n not in spec.fields]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        fields = [spec.fields[n] for n in names]
+    else:
+        fields = [spec.fields[n] for n in spec.default_fields]
+
+    # The key and sort columns come first (for the cursor) and are stripped from the output
+    stmt = select(spec.key_column, sort_column, *[f.column for f in fields])
+    for clause in base_filters:
+        stmt = stmt.where(clause)
+    for param, list_filter in spec.filters.items():
+        raw = args.get(param)
+        if raw not in (None, ''):
+            stmt = stmt.where(list_filter.clause(raw))
+    count_stmt = stmt
+
+    nullable = _nullable(sort_column, spec.key_column)
+    if args.get('cursor'):
+        value, key = _decode_cursor(args['cursor'])
+        stmt = stmt.where(_keyset_clause(sort_column, spec.key_column, value, key, descending, nullable))
+
+    # Sorting on the key alone (the default) reads the (org, ..., id) index in order
+    key_order = spec.key_column.desc() if descending else spec.key_column.asc()
+    order = [key_order]
+    if sort_column is not spec.key_column:
+        order.insert(0, sort_column.desc() if descending else sort_column.asc())
+        if nullable:
+            order.insert(0, sort_column.is_(None))
+    stmt = stmt.order_by(*order)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1) # One extra row tells whether there is a next page
+    return stmt, count_stmt, fields, limit
+
+
+def run_list_query(spec, base_filters, args):
+    """
+    A list endpoint driven by request args. Paging is opt-in: without ?limit= or
+    ?cursor= every matching row is returned, as before paging existed.
+      ?limit=      page size (default 100 once paging, max 500)
+      ?cursor=     opaque keyset cursor from the previous page's X-Next-Cursor
+      ?sort=       a whitelisted sort; prefix with '-' for descending (default: -<default_sort>)
+      ?fields=     comma-separated response keys; only those columns are selected
+      ?count=      'exact' or 'estimate' (omitted: no count query)
+      plus the spec's filters.
+    Returns (items, headers). Raises ValueError for invalid input.
+    """
+    stmt, count_stmt, fields, limit = build_list_query(spec, base_filters, args)
+
+    headers = {}
+    count_mode = args.get('count')
+    if count_mode in ('exact', 'estimate'):
+        total, is_estimate = _count(count_stmt, count_mode)
+        headers['X-Total-Count'] = str(total)
+        if is_estimate:
+            headers['X-Total-Count-Estimated'] = 'true'
+
+    rows = db.session.execute(stmt).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers['X-Next-Cursor'] = _encode_cursor(rows[-1][1], rows[-1][0])
+
+    items = [{f.name: f.format(v) for f, v in zip(fields, row[2:])} for row in rows]
+    return items, headers
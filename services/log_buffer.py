@@ -0,0 +1,158 @@
+import atexit
+import threading
+from collections import deque
+from sqlalchemy.exc import OperationalError, InterfaceError, ProgrammingError
+from extensions import db
+from models.activity_log import ActivityLog
+from models.audit_log import AuditLog
+
+# The database (not the rows) is the problem: keep the batch and retry it later.
+# Anything else (IntegrityError, DataError, ...) is blamed on individual rows
+RETRYABLE_ERRORS = (OperationalError, InterfaceError, ProgrammingError)
+
+
+class LogBuffer:
+    """
+    Write-behind sink for one log table. add() only appends the row to a bounded
+    in-memory buffer; the flusher thread writes it with one multi-row INSERT on its
+    own connection, so a logging error can never roll back the caller's session.
+    When the buffer is full, add() flushes inline (back-pressure). A batch that fails
+    because the database is unavailable goes back to the front of the buffer and is
+    retried on the next flush; rows are only dropped if that lasts until max_size is
+    reached. A batch rejected for its contents is split until the bad rows are
+    isolated, and only those are dropped (and logged).
+    """
+
+    def __init__(self, table, max_size=10000):
+        self.table = table
+        self.max_size = max_size
+        self._rows = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # One writer at a time keeps rows in order
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, row):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_size
+        if full:
+            self.flush()
+
+    def flush(self, limit=5000):
+        """Writes everything buffered so far in chunks of `limit` rows; returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._rows.popleft() for _ in range(min(limit, len(self._rows)))]
+                if not batch:
+                    return written
+                batch_written, left = self._write(batch)
+                written += batch_written
+                if left:
+                    kept = self._requeue(left)
+                    print(f"[FAIL] Could not write {len(left)} {self.table.name} row(s), {kept} kept for retry.")
+                    return written
+
+    def _write(self, rows):
+        """
+        Inserts rows; returns (number written, rows left unwritten because the database
+        is unavailable). Rows the database rejects are bisected down to the failing ones.
+        """
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(self.table.insert(), rows)
+            return len(rows), []
+        except RETRYABLE_ERRORS as e:
+            print(f"[WARN] {self.table.name} insert failed, will retry: {e}")
+            return 0, rows
+        except Exception as e:
+            if len(rows) == 1:
+                print(f"[FAIL] Dropped a {self.table.name} row the database rejects: {e} ({rows[0]})")
+                return 0, []
+        middle = len(rows) // 2
+        written, left = self._write(rows[:middle])
+        if left:
+            return written, left + rows[middle:]
+        more, left = self._write(rows[middle:])
+        return written + more, left
+
+    def _requeue(self, batch):
+        """Puts a failed batch back in front of newer rows, as much as max_size allows; returns how many."""
+        with self._lock:
+            kept = batch[:max(0, self.max_size - len(self._rows))]
+            self._rows.extendleft(reversed(kept))
+        if len(kept) < len(batch):
+            print(f"[FAIL] Log buffer full: dropped {len(batch) - len(kept)} {self.table.name} row(s).")
+        return len(kept)
+
+
+activity_logs = LogBuffer(ActivityLog.__table__)
+audit_logs = LogBuffer(AuditLog.__table__)
+BUFFERS = (activity_logs, audit_logs)
+
+_wake = threading.Event()
+_flusher = None
+_flusher_lock = threading.Lock()
+_settings = {"enabled": False, "flush_size": 200, "flush_interval": 1.0}
+
+
+def write_log(buffer, row):
+    """Buffers the row, or writes it straight away (still on its own connection) when buffering is off."""
+    if not _settings["enabled"]:
+        buffer.add(row)
+        buffer.flush()
+        return
+    buffer.add(row)
+    if len(buffer) >= _settings["flush_size"]:
+        _wake.set()
+
+
+def flush_logs():
+    """Writes every buffered log row now. Needs an app context."""
+    return sum(buffer.flush() for buffer in BUFFERS)
+
+
+def _flusher_loop(app):
+    while True:
+        _wake.wait(timeout=_settings["flush_interval"])
+        _wake.clear()
+        with app.app_context():
+            try:
+                flush_logs()
+            except Exception as e:
+                print(f"[FAIL] Log flusher error: {e}")
+
+
+def init_log_buffer(app):
+    """
+    Enables write-behind logging (LOG_BUFFER_ENABLED): rows are flushed every
+    LOG_FLUSH_INTERVAL_MS, as soon as LOG_FLUSH_SIZE rows are waiting, after each
+    request (without blocking it) and at process exit.
+    """
+    global _flusher
+    _settings["enabled"] = app.config.get('LOG_BUFFER_ENABLED', True)
+    _settings["flush_size"] = app.config.get('LOG_FLUSH_SIZE', 200)
+    _settings["flush_interval"] = app.config.get('LOG_FLUSH_INTERVAL_MS', 1000) / 1000.0
+    for buffer in BUFFERS:
+        buffer.max_size = app.config.get('LOG_BUFFER_MAX_SIZE', 10000)
+    if not _settings["enabled"]:
+        return
+
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flusher_loop, args=(app,), name='log-flusher', daemon=True)
+            _flusher.start()
+
+    @app.teardown_request
+    def _flush_after_request(exc):
+        if any(len(buffer) for buffer in BUFFERS):
+            _wake.set()
+
+    def _flush_at_exit():
+        with app.app_context():
+            flush_logs()
+
+    atexit.register(_flush_at_exit)
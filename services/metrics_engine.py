@@ -0,0 +1,69 @@
+from sqlalchemy import func, case, and_
+from extensions import db
+
+
+class Metric:
+    """
+    A single named aggregate over one table.
+    kind: 'count' | 'sum' | 'avg'; conditions are ANDed into a CASE so several
+    metrics share one table scan.
+    """
+
+    def __init__(self, name, kind='count', column=None, conditions=()):
+        self.name = name
+        self.kind = kind
+        self.column = column
+        self.conditions = list(conditions)
+
+    def expression(self, model):
+        column = self.column if self.column is not None else model.id
+        if self.conditions:
+            cond = self.conditions[0] if len(self.conditions) == 1 else and_(*self.conditions)
+            column = case((cond, column))
+
+        if self.kind == 'count':
+            return func.count(column)
+        if self.kind == 'sum':
+            return func.coalesce(func.sum(column), 0)
+        if self.kind == 'avg':
+            return func.avg(column)
+        raise ValueError(f"Unsupported metric kind: {self.kind}")
+
+
+def count_if(name, *conditions):
+    return Metric(name, 'count', conditions=conditions)
+
+
+def sum_if(name, column, *conditions):
+    return Metric(name, 'sum', column=column, conditions=conditions)
+
+
+def avg_if(name, column, *conditions):
+    return Metric(name, 'avg', column=column, conditions=conditions)
+
+
+def compute_metrics(model, metrics, organization_id=None, org_column=None,
+                    date_column=None, start=None, end=None, filters=()):
+    """
+    Compiles the metrics into one SELECT of COUNT(CASE ...)/SUM(CASE ...) columns
+    over `model` and returns {metric name: value}.
+
+    organization_id: scopes by org_column (defaults to model.organization_id); None = unscoped.
+    start/end: range on date_column, start inclusive and end exclusive.
+    filters: extra WHERE clauses shared by every metric (e.g. is_deleted == False).
+    """
+    query = db.session.query(*[m.expression(model).label(m.name) for m in metrics])
+
+    if organization_id is not None:
+        if org_column is None:
+            org_column = model.organization_id
+        query = query.filter(org_column == organization_id)
+    if date_column is not None and start is not None:
+        query = query.filter(date_column >= start)
+    if date_column is not None and end is not None:
+        query = query.filter(date_column < end)
+    for clause in filters:
+        query = query.filter(clause)
+
+    row = query.one()
+    return {m.name: (row[i] if row[i] is not None else 0) for i, m in enumerate(metrics)}
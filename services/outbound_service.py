@@ -0,0 +1,408 @@
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from sqlalchemy import select, update, delete, bindparam, case, or_, and_
+from extensions import db
+from models.outbound_message import OutboundMessage, PendingReceipt
+from models.message import Message
+from models.whatsapp import WhatsAppAccount
+from models.crm import Lead
+from services.delivery_engine import TokenBucket
+from services.phone_service import normalize_phone
+from services.realtime import publish_message_status
+
+WHATSAPP_API_URL = "https://graph.facebook.com/v18.0/{phone_number_id}/messages"
+
+# Receipts only move a message forward: a late 'delivered' never overwrites 'read'
+STATUS_RANK = {'sending': 0, 'sent': 1, 'failed': 2, 'delivered': 3, 'read': 4}
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class ProviderError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# --- Providers ---
+
+class WhatsAppCloudProvider:
+    """Meta WhatsApp Cloud API over one pooled HTTP session (connections are reused across sends)."""
+
+    def __init__(self, pool_size=10, timeout=10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def send(self, account, to_phone, content):
+        """Returns the provider message id (wamid)."""
+        if account is None:
+            raise ProviderError("No WhatsApp account connected", retryable=False)
+        try:
+            response = self.session.post(
+                WHATSAPP_API_URL.format(phone_number_id=account.phone_number_id),
+                headers={"Authorization": f"Bearer {account.access_token}"},
+                json={"messaging_product": "whatsapp", "to": to_phone, "type": "text", "text": {"body": content}},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise ProviderError(f"Network error: {e}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}")
+        if response.status_code >= 400:
+            raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}", retryable=False)
+        return (response.json().get('messages') or [{}])[0].get('id')
+
+
+class StubProvider:
+    """
+    Local stand-in for tests and development: records every send and returns a fake
+    wamid. fail_times makes the first N sends to a phone raise a retryable error;
+    reject_phones raise a permanent one.
+    """
+
+    def __init__(self, fail_times=0, reject_phones=()):
+        self.fail_times = fail_times
+        self.reject_phones = set(reject_phones)
+        self.sent = []
+        self._failures = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def send(self, account, to_phone, content):
+        with self._lock:
+            if to_phone in self.reject_phones:
+                raise ProviderError(f"Stub rejected {to_phone}", retryable=False)
+            if self._failures[to_phone] < self.fail_times:
+                self._failures[to_phone] += 1
+                raise ProviderError(f"Stub transient failure for {to_phone}")
+            self.sent.append((to_phone, content))
+            return f"wamid.stub.{len(self.sent)}"
+
+
+_provider = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        config = current_app.config
+        if config.get('OUTBOUND_PROVIDER', 'stub') == 'whatsapp':
+            _provider = WhatsAppCloudProvider(pool_size=config.get('OUTBOUND_WORKERS', 4))
+        else:
+            _provider = StubProvider()
+    return _provider
+
+
+def set_provider(provider):
+    """Swaps the process-wide provider (tests, local development)."""
+    global _provider
+    _provider = provider
+
+
+def _account_limiter(account_id):
+    """One token bucket per WhatsApp account per process."""
+    with _buckets_lock:
+        if account_id not in _buckets:
+            _buckets[account_id] = TokenBucket(current_app.config.get('OUTBOUND_RATE_PER_ACCOUNT', 20))
+        return _buckets[account_id]
+
+
+# --- Enqueue (request path) ---
+
+def enqueue_outbound(message, organization_id, to_phone):
+    """Adds the send to the queue in the caller's transaction; call notify_outbound_worker() after commit."""
+    db.session.add(OutboundMessage(
+        message_id=message.id,
+        organization_id=organization_id,
+        channel=message.channel or 'whatsapp',
+        to_phone=to_phone,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    ))
+
+
+def queue_for_delivery(conversation, message):
+    """
+    Queues an agent message on a WhatsApp conversation (status 'sending' until the
+    worker reports back). Other channels have no provider yet and stay as they are.
+    Call after the message has been flushed; returns True if queued.
+    """
+    if conversation.channel != 'whatsapp':
+        return False
+    lead = db.session.execute(
+        select(Lead.phone, Lead.phone_normalized).where(Lead.id == conversation.lead_id)
+    ).first()
+    # E.164, the format the provider expects; raw phones may be local ("98765 43210")
+    to_phone = lead and (lead.phone_normalized or normalize_phone(lead.phone))
+    if not to_phone:
+        return False
+    message.status = 'sending'
+    enqueue_outbound(message, conversation.organization_id, to_phone)
+    return True
+
+
+def notify_outbound_worker():
+    ensure_outbound_worker(current_app._get_current_object())
+    _wake.set()
+
+
+def ensure_outbound_worker(app):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, args=(app,), name='outbound-dispatch', daemon=True)
+            _worker.start()
+
+
+def _worker_loop(app):
+    poll_seconds = app.config.get('OUTBOUND_POLL_SECONDS', 2)
+    while True:
+        _wake.wait(timeout=poll_seconds)
+        _wake.clear()
+        with app.app_context():
+            try:
+                drain_outbound()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[FAIL] Outbound dispatch worker error: {e}")
+            finally:
+                db.session.remove()
+
+
+# --- Dispatch (worker path) ---
+
+def _claim_due(batch_size, stale_seconds):
+    """Due sends (plus ones a crashed worker left 'processing'), with SKIP LOCKED for parallel workers."""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=stale_seconds)
+    rows = db.session.execute(
+        select(OutboundMessage.id, OutboundMessage.message_id, OutboundMessage.organization_id,
+               OutboundMessage.to_phone, OutboundMessage.attempts, Message.content, Message.conversation_id)
+        .join(Message, Message.id == OutboundMessage.message_id)
+        .where(or_(
+            and_(OutboundMessage.status == 'pending', OutboundMessage.next_attempt_at <= now),
+            and_(OutboundMessage.status == 'processing', OutboundMessage.claimed_at < stale_before)
+        ))
+        .order_by(OutboundMessage.next_attempt_at, OutboundMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True, of=OutboundMessage)
+    ).all()
+    if rows:
+        db.session.execute(
+            update(OutboundMessage)
+            .where(OutboundMessage.id.in_([r.id for r in rows]))
+            .values(status='processing', claimed_at=now, attempts=OutboundMessage.attempts + 1)
+        )
+    db.session.commit()
+    return rows
+
+
+def _load_accounts(organization_ids):
+    """{organization_id: WhatsAppAccount row} (first connected account per org)."""
+    accounts = {}
+    rows = db.session.execute(
+        select(WhatsAppAccount.id, WhatsAppAccount.company_id, WhatsAppAccount.phone_number_id,
+               WhatsAppAccount.access_token)
+        .where(WhatsAppAccount.company_id.in_(organization_ids))
+        .order_by(WhatsAppAccount.id)
+    ).all()
+    for row in rows:
+        accounts.setdefault(row.company_id, row)
+    return accounts
+
+
+def _retry_delay(attempts, base, cap):
+    delay = min(base * (2 ** max(attempts - 1, 0)), cap)
+    return delay + random.uniform(0, delay * 0.1) # Jitter keeps retries from arriving in lockstep
+
+
+def drain_outbound():
+    """Delivers due sends batch by batch until none are left. Must run inside an app context."""
+    app = current_app._get_current_object()
+    config = app.config
+    batch_size = config.get('OUTBOUND_BATCH_SIZE', 100)
+    workers = config.get('OUTBOUND_WORKERS', 4)
+    max_attempts = config.get('OUTBOUND_MAX_ATTEMPTS', 5)
+    retry_base = config.get('OUTBOUND_RETRY_BASE_SECONDS', 5)
+    retry_cap = config.get('OUTBOUND_RETRY_MAX_SECONDS', 900)
+    stale_seconds = config.get('OUTBOUND_CLAIM_TIMEOUT', 300)
+    provider = get_provider()
+
+    sweep_pending_receipts()
+
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbound-send') as pool:
+        while True:
+            jobs = _claim_due(batch_size, stale_seconds)
+            if not jobs:
+                break
+            accounts = _load_accounts({job.organization_id for job in jobs})
+            limiters = {account.id: _account_limiter(account.id) for account in accounts.values()}
+
+            def deliver(job):
+                account = accounts.get(job.organization_id)
+                if account is not None:
+                    limiters[account.id].acquire()
+                try:
+                    return job, provider.send(account, job.to_phone, job.content), None
+                except ProviderError as e:
+                    return job, None, e
+                except Exception as e:
+                    return job, None, ProviderError(str(e))
+
+            results = list(pool.map(deliver, jobs))
+            _record_results(results, max_attempts, retry_base, retry_cap)
+            processed += len(jobs)
+    return processed
+
+
+def _record_results(results, max_attempts, retry_base, retry_cap):
+    """Writes one batch of send results with executemany UPDATEs and one commit."""
+    now = datetime.utcnow()
+    done_jobs, retry_jobs, failed_jobs = [], [], []
+    sent_messages, failed_messages = [], []
+    events = []
+
+    for job, wamid, error in results:
+        attempts = (job.attempts or 0) + 1 # Incremented when claimed
+        if error is None:
+            done_jobs.append({"id": job.id, "status": 'done', "sent_at": now, "error_message": None})
+            sent_messages.append({"b_id": job.message_id, "b_wamid": wamid})
+            events.append((job.conversation_id, job.message_id, 'sent'))
+        elif error.retryable and attempts < max_attempts:
+            retry_jobs.append({
+                "id": job.id, "status": 'pending', "error_message": str(error),
+                "next_attempt_at": now + timedelta(seconds=_retry_delay(attempts, retry_base, retry_cap))
+            })
+        else:
+            failed_jobs.append({"id": job.id, "status": 'failed', "error_message": str(error)})
+            failed_messages.append({"id": job.message_id, "status": 'failed'})
+            events.append((job.conversation_id, job.message_id, 'failed'))
+            print(f"[FAIL] Outbound message {job.message_id} not delivered: {error}")
+
+    for rows in (done_jobs, retry_jobs, failed_jobs):
+        if rows:
+            db.session.execute(update(OutboundMessage), rows)
+    if failed_messages:
+        db.session.execute(update(Message), failed_messages)
+    early = {}
+    if sent_messages:
+        table = Message.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .values(
+                whatsapp_message_id=bindparam('b_wamid'),
+                status=case((table.c.status == 'sending', 'sent'), else_=table.c.status)
+            ),
+            sent_messages
+        )
+        early = _apply_pending_receipts([m["b_wamid"] for m in sent_messages if m["b_wamid"]])
+    db.session.commit()
+
+    status_by_message = {m["b_id"]: early[m["b_wamid"]] for m in sent_messages if m["b_wamid"] in early}
+    for conversation_id, message_id, status in events:
+        publish_message_status(conversation_id, message_id, status_by_message.get(message_id, status))
+
+
+# --- Delivery receipts ---
+
+def _latest_statuses(statuses):
+    """{wamid: most advanced status} of [{"wamid", "status"}] receipts."""
+    latest = {}
+    for s in statuses:
+        current = latest.get(s['wamid'])
+        if current is None or STATUS_RANK.get(s['status'], -1) > STATUS_RANK.get(current, -1):
+            latest[s['wamid']] = s['status']
+    return latest
+
+
+def apply_delivery_receipts(statuses):
+    """
+    Applies webhook receipts [{"wamid", "status"}] in bulk: one UPDATE per distinct
+    status, matched by whatsapp_message_id, and only where it moves the message
+    forward (receipts arrive out of order). Receipts for a wamid no message has yet
+    are kept as PendingReceipt rows (see _apply_pending_receipts). Runs in the
+    caller's transaction.
+    """
+    latest = _latest_statuses(statuses)
+    _update_statuses(latest)
+
+    known = set(db.session.scalars(
+        select(Message.whatsapp_message_id).where(Message.whatsapp_message_id.in_(list(latest)))
+    ))
+    unmatched = [{"wamid": wamid, "status": status, "received_at": datetime.utcnow()}
+                 for wamid, status in latest.items() if wamid not in known]
+    if unmatched:
+        db.session.execute(PendingReceipt.__table__.insert(), unmatched)
+        hold = timedelta(seconds=current_app.config.get('OUTBOUND_RECEIPT_HOLD_SECONDS', 86400))
+        db.session.execute(delete(PendingReceipt).where(PendingReceipt.received_at < datetime.utcnow() - hold))
+
+
+def _apply_pending_receipts(wamids):
+    """
+    Applies (and deletes) receipts that arrived before these wamids were stored.
+    Runs in the caller's transaction, after the wamids are written; returns
+    {wamid: status} for the messages it moved.
+    """
+    rows = db.session.execute(
+        select(PendingReceipt.id, PendingReceipt.wamid, PendingReceipt.status)
+        .where(PendingReceipt.wamid.in_(wamids))
+    ).all()
+    if not rows:
+        return {}
+    latest = _latest_statuses([{"wamid": r.wamid, "status": r.status} for r in rows])
+    _update_statuses(latest)
+    db.session.execute(delete(PendingReceipt).where(PendingReceipt.id.in_([r.id for r in rows])))
+    return {wamid: status for wamid, status in latest.items() if STATUS_RANK.get(status, -1) > STATUS_RANK['sent']}
+
+
+def sweep_pending_receipts():
+    """
+    Applies held receipts whose message now has the wamid. Covers the race where
+    the webhook and the worker commit at the same moment and neither sees the
+    other's row. Must run inside an app context.
+    """
+    wamids = list(db.session.scalars(
+        select(PendingReceipt.wamid.distinct())
+        .join(Message, Message.whatsapp_message_id == PendingReceipt.wamid)
+    ))
+    if not wamids:
+        return 0
+    moved = _apply_pending_receipts(wamids)
+    db.session.commit()
+    if moved:
+        rows = db.session.execute(
+            select(Message.id, Message.conversation_id, Message.whatsapp_message_id)
+            .where(Message.whatsapp_message_id.in_(list(moved)))
+        ).all()
+        for message_id, conversation_id, wamid in rows:
+            publish_message_status(conversation_id, message_id, moved[wamid])
+    return len(wamids)
+
+
+def _update_statuses(latest):
+    """One forward-only UPDATE per distinct status in {wamid: status}."""
+    by_status = defaultdict(list)
+    for wamid, status in latest.items():
+        by_status[status].append(wamid)
+
+    table = Message.__table__
+    for status, wamids in by_status.items():
+        stmt = table.update().where(table.c.whatsapp_message_id.in_(wamids)).values(status=status)
+        if status in STATUS_RANK:
+            same_or_later = [s for s, rank in STATUS_RANK.items() if rank >= STATUS_RANK[status]]
+            stmt = stmt.where(or_(table.c.status.is_(None), table.c.status.notin_(same_or_later)))
+        db.session.execute(stmt)
@@ -0,0 +1,33 @@
+def format_number(num):
+    """Formats number to E.164 format, e.g., +919876543210"""
+    if not num:
+        return None
+    # Remove common characters except '+'
+    num = str(num).strip().replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+    
+    if num.startswith('+'):
+        return num
+        
+    # If it's a 10-digit Indian number, add +91
+    if len(num) == 10 and num.isdigit():
+        return "+91" + num
+        
+    # If it's a 12-digit Indian number (91...), add +
+    if len(num) == 12 and num.startswith('91') and num.isdigit():
+        return "+" + num
+        
+    # Fallback: return the cleaned number, Twilio might handle it.
+    return num
+
+
+def normalize_phone(num):
+    """
+    Lookup key for matching phone numbers across sources (lead forms, imports,
+    WhatsApp wa_id). Same rules as format_number, plus a leading '+' for bare
+    digit strings longer than 10 digits, which already carry a country code
+    (WhatsApp sends "14155550100" for +1 415 555 0100).
+    """
+    num = format_number(num)
+    if num and num.isdigit() and len(num) > 10:
+        return "+" + num
+    return num
@@ -0,0 +1,242 @@
+import threading
+from flask import request, session
+from flask_jwt_extended import decode_token
+from flask_socketio import join_room, leave_room, disconnect
+from extensions import db
+from models.conversation import Conversation
+from services.identity_cache import get_identity
+
+MANAGER_ROLES = ['SUPER_ADMIN', 'MANAGER'] # Same as the inbox list permissions
+
+
+def conversation_room(conversation_id):
+    return f"conversation:{conversation_id}"
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def managers_room(organization_id):
+    """Users who see every conversation of the org (MANAGER_ROLES)."""
+    return f"org:{organization_id}:managers"
+
+
+# --- Message bus adapters ---
+
+class InProcessBus:
+    """
+    Emits through this process's SocketIO server. Reaches every client when there is
+    one server process, or when the server itself is attached to SOCKETIO_MESSAGE_QUEUE.
+    """
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+
+    def publish(self, events):
+        for event, data, room in events:
+            self.socketio.emit(event, data, to=room)
+
+
+class BrokerBus:
+    """
+    Publishes to a message queue (e.g. redis://localhost:6379/0, or any kombu URL)
+    that every SocketIO server process subscribes to, so emits from any process -
+    web worker, scheduler, ingest worker - reach clients connected anywhere.
+    Needs the broker's client library (redis / kombu) installed.
+    """
+
+    def __init__(self, url, channel='flask-socketio'):
+        from flask_socketio import SocketIO
+        self.emitter = SocketIO(message_queue=url, channel=channel) # Write-only, no server
+
+    def publish(self, events):
+        for event, data, room in events:
+            self.emitter.emit(event, data, to=room)
+
+
+# --- Batching / coalescing ---
+
+class RealtimeDispatcher:
+    """
+    Buffers events and hands them to the bus from one background thread every
+    flush_interval seconds (or as soon as max_batch events are waiting).
+    Events published with a coalesce key replace any buffered event with the same
+    (event, room, key), so a burst of inbox updates or receipts for one
+    conversation/message goes out once, with the latest data.
+    """
+
+    def __init__(self, bus, flush_interval=0.2, max_batch=500):
+        self.bus = bus
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._buffer = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def publish(self, event, data, room, key=None):
+        """room: a room name or a list of them (a client in several gets the event once)."""
+        with self._lock:
+            self._sequence += 1
+            buffer_key = (event, str(room), key) if key is not None else self._sequence
+            previous = self._buffer.pop(buffer_key, None)
+            # A coalesced event keeps its place in the stream
+            order = previous[0] if previous else self._sequence
+            self._buffer[buffer_key] = (order, event, data, room)
+            full = len(self._buffer) >= self.max_batch
+        self._ensure_thread()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            pending = sorted(self._buffer.values(), key=lambda item: item[0])
+            self._buffer = {}
+        if pending:
+            self.bus.publish([(event, data, room) for _, event, data, room in pending])
+        return len(pending)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name='realtime-dispatch', daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[FAIL] Realtime flush error: {e}")
+
+
+_dispatcher = None
+
+
+def init_realtime(app, socketio):
+    """Picks the bus from config and registers the socket handlers. Call once at startup."""
+    global _dispatcher
+    url = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    bus = InProcessBus(socketio)
+    if app.config.get('REALTIME_BUS') == 'broker' and url:
+        try:
+            bus = BrokerBus(url)
+        except Exception as e:
+            print(f"[WARN] Realtime broker unavailable ({e}); emitting in-process only.")
+    _dispatcher = RealtimeDispatcher(
+        bus,
+        flush_interval=app.config.get('REALTIME_FLUSH_MS', 200) / 1000.0,
+        max_batch=app.config.get('REALTIME_MAX_BATCH', 500)
+    )
+    register_socket_handlers(socketio)
+    print(f"[OK] Realtime delivery via {type(bus).__name__}.")
+
+
+def publish(event, data, room, key=None):
+    """Queues an event for delivery; a no-op until init_realtime() has run."""
+    if _dispatcher is not None:
+        _dispatcher.publish(event, data, room, key)
+
+
+# --- Domain events ---
+
+def publish_new_message(organization_id, message):
+    """
+    message: Message.to_dict(). Sent only to the conversation room, which
+    handle_join_conversation admits assignees and managers to.
+    """
+    publish('new_message', message, conversation_room(message['conversation_id']))
+
+
+def publish_inbox_update(organization_id, conversation_id, data):
+    """
+    Latest inbox row for a conversation (coalesced per conversation), to the
+    org's managers and the assignee: the same people list_inbox shows it to.
+    """
+    rooms = [managers_room(organization_id)]
+    if data.get('assigned_to'):
+        rooms.append(user_room(data['assigned_to']))
+    publish('inbox_updated', data, rooms, key=conversation_id)
+
+
+def publish_message_status(conversation_id, message_id, status):
+    """Delivery receipt (coalesced per message: only the latest status is sent)."""
+    publish('message_status', {"id": message_id, "conversation_id": conversation_id, "status": status},
+            conversation_room(conversation_id), key=message_id)
+
+
+def inbox_update_payload(conversation):
+    return {
+        "id": conversation.id,
+        "lead_id": conversation.lead_id,
+        "lead_name": conversation.lead_name or "Unknown",
+        "channel": conversation.channel,
+        "status": conversation.status,
+        "assigned_to": conversation.assigned_to,
+        "last_message": conversation.last_message_preview or "",
+        "last_sender_type": conversation.last_sender_type,
+        "last_message_at": conversation.last_message_at.isoformat() if conversation.last_message_at else None
+    }
+
+
+# --- Socket handlers (rooms + authorization) ---
+
+def _identity_for(user_id, token_version):
+    """The cached Identity, or None if the user is gone, deleted or the token was revoked."""
+    identity = get_identity(user_id)
+    if not identity or identity.is_deleted or token_version < identity.token_version:
+        return None
+    return identity
+
+
+def _socket_user():
+    user_id = session.get('user_id')
+    return _identity_for(user_id, session.get('tv', 0)) if user_id else None
+
+
+def register_socket_handlers(socketio):
+
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        """
+        Clients connect with {auth: {token}} (or ?token=). Same checks as
+        token_required; users join their own room, managers also the org's.
+        """
+        token = (auth or {}).get('token') or request.args.get('token')
+        try:
+            claims = decode_token(token)
+            user = _identity_for(int(claims['sub']), claims.get('tv', 0))
+        except Exception as e:
+            print(f"[FAIL] Socket auth failed: {e}")
+            return False
+        if not user:
+            return False
+        session['user_id'] = user.id
+        session['tv'] = claims.get('tv', 0)
+        join_room(user_room(user.id))
+        if user.role in MANAGER_ROLES:
+            join_room(managers_room(user.organization_id))
+
+    @socketio.on('join_conversation')
+    def handle_join_conversation(data):
+        user = _socket_user()
+        if not user:
+            disconnect()
+            return {"ok": False, "message": "Unauthorized"}
+        conversation = db.session.get(Conversation, (data or {}).get('conversation_id'))
+        if not conversation or conversation.organization_id != user.organization_id:
+            return {"ok": False, "message": "Conversation not found"}
+        if user.role not in MANAGER_ROLES and conversation.assigned_to != user.id:
+            return {"ok": False, "message": "Unauthorized"}
+        join_room(conversation_room(conversation.id))
+        return {"ok": True}
+
+    @socketio.on('leave_conversation')
+    def handle_leave_conversation(data):
+        leave_room(conversation_room((data or {}).get('conversation_id')))
+        return {"ok": True}
@@ -0,0 +1,158 @@
+import time
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.reference_cache_version import ReferenceCacheVersion
+from services.resolution_cache import TTLCache, _MISSING
+
+GLOBAL = 0 # organization id for entities shared by every org (plans, teams)
+ALL_ORGS = -1 # invalidates every org's copy of an entity
+
+# (organization id, entity) -> whatever the loader returned (treat as read-only)
+_entries = TTLCache(maxsize=10000, ttl=300)
+
+# Bumped on every local invalidation: a load that started before it is not stored
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+class LocalBackend:
+    """Single process: invalidations stay local, other processes converge within the TTL."""
+
+    def publish(self, entity, organization_id):
+        pass
+
+    def poll(self):
+        return []
+
+
+class DatabaseBackend:
+    """
+    Invalidations are version bumps in reference_cache_versions. Each process
+    reads the rows changed since its last poll (at most every poll_seconds), so
+    all workers and nodes drop stale copies within that interval.
+    """
+
+    # Rows are stamped with each writer's clock; re-read a little further back than needed
+    CLOCK_SKEW = timedelta(seconds=5)
+
+    def __init__(self, poll_seconds=2.0):
+        self.poll_seconds = poll_seconds
+        self._seen = {}
+        self._last_poll = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    def publish(self, entity, organization_id):
+        table = ReferenceCacheVersion.__table__
+        now = datetime.utcnow()
+        bump = (
+            update(table)
+            .where(table.c.organization_id == organization_id, table.c.entity == entity)
+            .values(version=table.c.version + 1, changed_at=now)
+        )
+        with db.engine.begin() as connection:
+            if connection.execute(bump).rowcount:
+                return
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(
+                        organization_id=organization_id, entity=entity, version=1, changed_at=now
+                    ))
+            except IntegrityError:
+                connection.execute(bump) # Another process inserted it first
+
+    def poll(self):
+        """(organization id, entity) pairs changed elsewhere since the last poll."""
+        if time.monotonic() < self._next_poll or not self._lock.acquire(blocking=False):
+            return []
+        try:
+            self._next_poll = time.monotonic() + self.poll_seconds
+            started = datetime.utcnow()
+            stmt = select(ReferenceCacheVersion.organization_id, ReferenceCacheVersion.entity,
+                          ReferenceCacheVersion.version)
+            if self._last_poll is not None:
+                stmt = stmt.where(ReferenceCacheVersion.changed_at >= self._last_poll - self.CLOCK_SKEW)
+            with db.engine.connect() as connection:
+                rows = connection.execute(stmt).all()
+
+            first_poll = self._last_poll is None
+            self._last_poll = started
+            changed = []
+            for organization_id, entity, version in rows:
+                if self._seen.get((organization_id, entity)) != version:
+                    self._seen[(organization_id, entity)] = version
+                    if not first_poll: # Nothing is cached yet that could predate these
+                        changed.append((organization_id, entity))
+            return changed
+        except Exception as e:
+            print(f"[WARN] Reference cache poll failed: {e}")
+            return []
+        finally:
+            self._lock.release()
+
+
+_backend = LocalBackend()
+
+
+def init_reference_cache(app):
+    """Applies REFERENCE_CACHE_* settings; 'database' shares invalidations across processes."""
+    global _backend
+    _entries.ttl = app.config.get('REFERENCE_CACHE_TTL', 300)
+    _entries.maxsize = app.config.get('REFERENCE_CACHE_MAX_SIZE', 10000)
+    if app.config.get('REFERENCE_CACHE_BACKEND', 'database') == 'database':
+        _backend = DatabaseBackend(app.config.get('REFERENCE_CACHE_POLL_MS', 2000) / 1000.0)
+    else:
+        _backend = LocalBackend()
+
+
+def _drop(entity, organization_id):
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    if organization_id == ALL_ORGS:
+        _entries.delete_where(lambda key: key[1] == entity)
+    else:
+        _entries.delete((organization_id, entity))
+
+
+def _sync():
+    for organization_id, entity in _backend.poll():
+        _drop(entity, organization_id)
+
+
+def get_reference(entity, organization_id, loader):
+    """The cached value for (org, entity), calling loader() on a miss."""
+    _sync()
+    key = (organization_id if organization_id is not None else GLOBAL, entity)
+    value = _entries.get(key)
+    if value is _MISSING:
+        generation = _generation
+        value = loader()
+        with _generation_lock:
+            if generation == _generation: # Not invalidated while loading
+                _entries.set(key, value)
+    return value
+
+
+def peek_reference(entity, organization_id):
+    """The cached value or _MISSING; never loads."""
+    _sync()
+    return _entries.get((organization_id if organization_id is not None else GLOBAL, entity))
+
+
+def invalidate_reference(entity, organization_id=ALL_ORGS):
+    """
+    Drops the cached (org, entity) here and, with the database backend, in every
+    other process. Call after the write is committed. Omit organization_id to drop
+    every org's copy.
+    """
+    if organization_id is None:
+        organization_id = GLOBAL
+    _drop(entity, organization_id)
+    try:
+        _backend.publish(entity, organization_id)
+    except Exception as e:
+        print(f"[WARN] Could not publish invalidation of {entity} for org {organization_id}: {e}")
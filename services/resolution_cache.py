@@ -0,0 +1,189 @@
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, event
+from extensions import db
+from models.crm import Lead
+from models.whatsapp import WhatsAppAccount
+from models.conversation import Conversation
+from services.phone_service import normalize_phone
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU map whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize=50000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drops every entry whose key matches predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# (organization_id, normalized phone) -> lead id. Only hits are cached: a miss is
+# followed by creating the lead, which populates the entry.
+lead_by_phone = TTLCache(maxsize=100000, ttl=600)
+# phone_number_id -> organization id (None cached too: unknown numbers are common)
+org_by_number = TTLCache(maxsize=10000, ttl=600)
+# lead id -> its WhatsApp conversation id
+conversation_by_lead = TTLCache(maxsize=100000, ttl=600)
+
+
+def resolve_org_ids(phone_number_ids):
+    """{phone_number_id: organization_id or None}; one IN query for the cache misses."""
+    result = {}
+    misses = []
+    for number_id in phone_number_ids:
+        org_id = org_by_number.get(number_id)
+        if org_id is _MISSING:
+            misses.append(number_id)
+        else:
+            result[number_id] = org_id
+
+    if misses:
+        found = dict(db.session.execute(
+            select(WhatsAppAccount.phone_number_id, WhatsAppAccount.company_id)
+            .where(WhatsAppAccount.phone_number_id.in_(misses))
+        ).all())
+        for number_id in misses:
+            result[number_id] = found.get(number_id)
+            org_by_number.set(number_id, result[number_id])
+    return result
+
+
+def resolve_lead_ids(keys):
+    """
+    {(organization_id, normalized phone): lead id} for the keys that match a lead.
+    Cache misses are looked up with one indexed query on (organization_id, phone_normalized).
+    """
+    result = {}
+    misses = set()
+    for key in keys:
+        lead_id = lead_by_phone.get(key)
+        if lead_id is _MISSING:
+            misses.add(key)
+        else:
+            result[key] = lead_id
+
+    if misses:
+        rows = db.session.execute(
+            select(Lead.id, Lead.organization_id, Lead.phone_normalized)
+            .where(
+                Lead.organization_id.in_({org_id for org_id, _ in misses}),
+                Lead.phone_normalized.in_({phone for _, phone in misses})
+            )
+            .order_by(Lead.id)
+        ).all()
+        for lead_id, org_id, phone in rows:
+            key = (org_id, phone)
+            if key in misses and key not in result: # Oldest lead wins, as before
+                result[key] = lead_id
+                lead_by_phone.set(key, lead_id)
+    return result
+
+
+def resolve_conversation_ids(lead_ids):
+    """{lead id: WhatsApp conversation id} for leads that have one; one IN query for the misses."""
+    result = {}
+    misses = set()
+    for lead_id in lead_ids:
+        conversation_id = conversation_by_lead.get(lead_id)
+        if conversation_id is _MISSING:
+            misses.add(lead_id)
+        else:
+            result[lead_id] = conversation_id
+
+    if misses:
+        rows = db.session.execute(
+            select(Conversation.id, Conversation.lead_id)
+            .where(Conversation.lead_id.in_(misses), Conversation.channel == 'whatsapp')
+            .order_by(Conversation.id)
+        ).all()
+        for conversation_id, lead_id in rows:
+            if lead_id not in result:
+                result[lead_id] = conversation_id
+                conversation_by_lead.set(lead_id, conversation_id)
+    return result
+
+
+def remember_lead(organization_id, phone, lead_id):
+    """Call after the commit that created the lead."""
+    lead_by_phone.set((organization_id, normalize_phone(phone)), lead_id)
+
+
+def remember_conversation(lead_id, conversation_id):
+    """Call after the commit that created the conversation."""
+    conversation_by_lead.set(lead_id, conversation_id)
+
+
+# --- Invalidation ---
+# Local to this process; other processes converge within the TTL.
+
+def _forget_lead(mapper, connection, target):
+    state = db.inspect(target)
+    for attr in ('organization_id', 'phone_normalized'):
+        history = state.attrs[attr].history
+        if history.deleted:
+            # Drop the key the lead was cached under before this change
+            org_id = history.deleted[0] if attr == 'organization_id' else target.organization_id
+            phone = history.deleted[0] if attr == 'phone_normalized' else target.phone_normalized
+            lead_by_phone.delete((org_id, phone))
+    lead_by_phone.delete((target.organization_id, target.phone_normalized))
+
+
+def _forget_conversation(mapper, connection, target):
+    state = db.inspect(target)
+    for old_lead_id in state.attrs['lead_id'].history.deleted or ():
+        conversation_by_lead.delete(old_lead_id)
+    conversation_by_lead.delete(target.lead_id)
+
+
+def _forget_account(mapper, connection, target):
+    state = db.inspect(target)
+    for old_number in state.attrs['phone_number_id'].history.deleted or ():
+        org_by_number.delete(old_number)
+    org_by_number.delete(target.phone_number_id)
+
+
+event.listen(Lead, 'after_insert', _forget_lead)
+event.listen(Lead, 'after_update', _forget_lead)
+event.listen(Lead, 'after_delete', _forget_lead)
+event.listen(Conversation, 'after_update', _forget_conversation)
+event.listen(Conversation, 'after_delete', _forget_conversation)
+event.listen(WhatsAppAccount, 'after_insert', _forget_account)
+event.listen(WhatsAppAccount, 'after_update', _forget_account)
+event.listen(WhatsAppAccount, 'after_delete', _forget_account)
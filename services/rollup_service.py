@@ -0,0 +1,253 @@
+import threading
+from datetime import datetime, date, timedelta
+from flask import current_app
+from sqlalchemy import event, func, literal
+from sqlalchemy.orm import Session
+from extensions import db
+from models.crm import Lead, Deal, Activity
+from models.task import Task
+from models.dashboard_rollup import DashboardRollup
+
+# Sentinel metric written on every refresh so an org with no data still has a freshness marker
+REFRESHED_METRIC = '_refreshed'
+DEFAULT_MAX_AGE_SECONDS = 300
+
+# organization id -> writes seen since its last refresh. A refresh clears the entry
+# only if no write arrived while it was querying
+_dirty_orgs = {}
+_dirty_lock = threading.Lock()
+
+# Organizations with a refresh running in this process (at most one each)
+_refreshing = set()
+
+
+def _as_date(value):
+    """func.date() returns a string on SQLite and a date on MySQL."""
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _rollup_queries(org_id):
+    """
+    Grouped queries that make up an organization's rollup.
+    Yields (metric, query) where every query returns (bucket_date, dimension, count, total).
+    """
+    lead_day = func.date(Lead.created_at)
+    deal_day = func.date(Deal.created_at)
+    activity_day = func.date(Activity.created_at)
+
+    yield 'leads_by_status', db.session.query(
+        lead_day, Lead.status, func.count(Lead.id), literal(0)
+    ).filter(Lead.organization_id == org_id, Lead.is_deleted == False).group_by(lead_day, Lead.status)
+
+    yield 'leads_by_source', db.session.query(
+        lead_day, Lead.source, func.count(Lead.id), literal(0)
+    ).filter(Lead.organization_id == org_id, Lead.is_deleted == False).group_by(lead_day, Lead.source)
+
+    yield 'deals_by_stage', db.session.query(
+        deal_day, Deal.stage, func.count(Deal.id), func.coalesce(func.sum(Deal.value), 0)
+    ).filter(Deal.organization_id == org_id, Deal.is_deleted == False).group_by(deal_day, Deal.stage)
+
+    yield 'deals_by_pipeline', db.session.query(
+        deal_day, Deal.pipeline, func.count(Deal.id), func.coalesce(func.sum(Deal.value), 0)
+    ).filter(Deal.organization_id == org_id, Deal.is_deleted == False).group_by(deal_day, Deal.pipeline)
+
+    yield 'deals_by_close_date', db.session.query(
+        Deal.close_date, Deal.stage, func.count(Deal.id), func.coalesce(func.sum(Deal.value), 0)
+    ).filter(
+        Deal.organization_id == org_id, Deal.is_deleted == False, Deal.close_date.isnot(None)
+    ).group_by(Deal.close_date, Deal.stage)
+
+    yield 'open_tasks_by_due_date', db.session.query(
+        Task.due_date, Task.priority, func.count(Task.id), literal(0)
+    ).filter(
+        Task.company_id == org_id, Task.status != 'Completed', Task.due_date.isnot(None)
+    ).group_by(Task.due_date, Task.priority)
+
+    yield 'activities_by_status', db.session.query(
+        activity_day, Activity.status, func.count(Activity.id), literal(0)
+    ).filter(Activity.organization_id == org_id).group_by(activity_day, Activity.status)
+
+
+def refresh_org_rollups(org_id):
+    """
+    Recompute every rollup row for one organization and replace them in a single transaction.
+    """
+    with _dirty_lock:
+        writes_seen = _dirty_orgs.get(org_id)
+    now = datetime.utcnow()
+    rows = []
+    for metric, query in _rollup_queries(org_id):
+        for bucket, dimension, count, total in query.all():
+            rows.append({
+                "organization_id": org_id,
+                "bucket_date": _as_date(bucket),
+                "metric": metric,
+                "dimension": dimension,
+                "count": int(count or 0),
+                "total": float(total or 0),
+                "updated_at": now
+            })
+    rows.append({
+        "organization_id": org_id, "bucket_date": now.date(), "metric": REFRESHED_METRIC,
+        "dimension": None, "count": 0, "total": 0.0, "updated_at": now
+    })
+
+    try:
+        DashboardRollup.query.filter_by(organization_id=org_id).delete(synchronize_session=False)
+        db.session.execute(DashboardRollup.__table__.insert(), rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[FAIL] Rollup refresh failed for org {org_id}: {e}")
+        raise
+
+    with _dirty_lock:
+        if _dirty_orgs.get(org_id) == writes_seen: # A write during the queries keeps it dirty
+            _dirty_orgs.pop(org_id, None)
+    return rows
+
+
+def mark_dirty(org_id):
+    if org_id is None:
+        return
+    with _dirty_lock:
+        _dirty_orgs[org_id] = _dirty_orgs.get(org_id, 0) + 1
+
+
+def _begin_refresh(org_id):
+    """False if this process is already refreshing the org."""
+    with _dirty_lock:
+        if org_id in _refreshing:
+            return False
+        _refreshing.add(org_id)
+        return True
+
+
+def _end_refresh(org_id):
+    with _dirty_lock:
+        _refreshing.discard(org_id)
+
+
+def _refresh_in_background(org_id):
+    """Starts a refresh off the request thread, unless one is already running for the org."""
+    if not _begin_refresh(org_id):
+        return
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                refresh_org_rollups(org_id)
+            except Exception:
+                pass # Logged in refresh_org_rollups; stays dirty and is retried
+            finally:
+                _end_refresh(org_id)
+
+    threading.Thread(target=run, name=f'rollup-refresh-{org_id}', daemon=True).start()
+
+
+def refresh_dirty_rollups():
+    """
+    Scheduler job: refresh every organization touched by a write since the last run.
+    Must run inside an app context.
+    """
+    with _dirty_lock:
+        pending = list(_dirty_orgs)
+    for org_id in pending:
+        if not _begin_refresh(org_id):
+            continue # A dashboard read already started one
+        try:
+            refresh_org_rollups(org_id)
+        except Exception:
+            pass # Logged in refresh_org_rollups; stays dirty and is retried next tick
+        finally:
+            _end_refresh(org_id)
+    if pending:
+        print(f"[OK] Refreshed dashboard rollups for {len(pending)} organization(s).")
+
+
+def get_rollups(org_id):
+    """
+    Returns all rollup rows for an organization in one query. Reads never wait
+    for a recompute: if the org was written to in this process or the snapshot
+    is older than DASHBOARD_ROLLUP_MAX_AGE seconds, the current snapshot is
+    served and a refresh starts in the background (the scheduler job refreshes
+    dirty orgs too). Only an org with no snapshot yet is computed inline.
+    """
+    max_age = current_app.config.get('DASHBOARD_ROLLUP_MAX_AGE', DEFAULT_MAX_AGE_SECONDS)
+
+    rows = DashboardRollup.query.filter_by(organization_id=org_id).all()
+    marker = next((r for r in rows if r.metric == REFRESHED_METRIC), None)
+    if marker is None:
+        refresh_org_rollups(org_id)
+        return RollupSet(DashboardRollup.query.filter_by(organization_id=org_id).all())
+
+    with _dirty_lock:
+        is_dirty = org_id in _dirty_orgs
+    if is_dirty or marker.updated_at < datetime.utcnow() - timedelta(seconds=max_age):
+        _refresh_in_background(org_id)
+    return RollupSet(rows)
+
+
+class RollupSet:
+    """In-memory view over an organization's rollup rows used to answer dashboard widgets."""
+
+    def __init__(self, rows):
+        self.rows = [r for r in rows if r.metric != REFRESHED_METRIC]
+
+    def _select(self, metric, start=None, end=None, where=None):
+        for r in self.rows:
+            if r.metric != metric:
+                continue
+            if start is not None and (r.bucket_date is None or r.bucket_date < start):
+                continue
+            if end is not None and (r.bucket_date is None or r.bucket_date >= end):
+                continue
+            if where is not None and not where(r.dimension):
+                continue
+            yield r
+
+    def count(self, metric, start=None, end=None, where=None):
+        """Sum of row counts for a metric; start is inclusive, end exclusive."""
+        return sum(r.count or 0 for r in self._select(metric, start, end, where))
+
+    def total(self, metric, start=None, end=None, where=None):
+        return sum(r.total or 0 for r in self._select(metric, start, end, where))
+
+    def breakdown(self, metric, start=None, end=None):
+        result = {}
+        for r in self._select(metric, start, end):
+            result[r.dimension] = result.get(r.dimension, 0) + (r.count or 0)
+        return result
+
+
+# --- Write tracking: flag orgs whose leads/deals/tasks/activities changed ---
+
+def _org_of(obj):
+    if isinstance(obj, (Lead, Deal, Activity)):
+        return obj.organization_id
+    if isinstance(obj, Task):
+        return obj.company_id
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_orgs(session, flush_context):
+    touched = session.info.setdefault('rollup_dirty_orgs', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        org_id = _org_of(obj)
+        if org_id is not None:
+            touched.add(org_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_dirty_orgs(session):
+    for org_id in session.info.pop('rollup_dirty_orgs', ()):
+        mark_dirty(org_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty_orgs(session):
+    session.info.pop('rollup_dirty_orgs', None)
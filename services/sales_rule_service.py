@@ -0,0 +1,223 @@
+import re
+import pandas as pd
+from sqlalchemy import select, update, func, cast, or_, and_, not_, Float
+from extensions import db
+from models.crm import Lead, Deal
+from models.sales_rule import SalesRule
+from services.rollup_service import mark_dirty
+from services.time_buckets import invalidate_series
+
+# SalesRule.module -> model ('lead' / 'leads' / 'Leads' all work)
+MODULE_MODELS = {'lead': Lead, 'deal': Deal}
+
+# action_type -> column it writes, per module
+MODULE_ACTIONS = {
+    'lead': {
+        'set_status': Lead.status,
+        'set_owner': Lead.owner,
+        'set_score': Lead.score,
+        'set_sla': Lead.sla,
+        'set_source': Lead.source,
+        'assign_user': Lead.assigned_user_id,
+        'assign_team': Lead.assigned_team_id,
+    },
+    'deal': {
+        'set_status': Deal.status,
+        'set_stage': Deal.stage,
+        'set_pipeline': Deal.pipeline,
+        'set_owner': Deal.owner,
+    },
+}
+
+OPERATOR_ALIASES = {
+    '=': 'equals', '==': 'equals', '!=': 'not_equals',
+    '>': 'greater_than', '<': 'less_than', '>=': 'greater_or_equal', '<=': 'less_or_equal',
+}
+
+# Evaluated over a column-projected DataFrame instead of in SQL
+FRAME_OPERATORS = {'matches', 'not_matches'}
+
+UPDATE_CHUNK_SIZE = 1000
+
+
+class SalesRuleError(ValueError):
+    """A rule that cannot be turned into an UPDATE."""
+
+
+def module_key(module):
+    key = (module or '').strip().lower().rstrip('s')
+    if key not in MODULE_MODELS:
+        raise SalesRuleError(f"Unknown module '{module}'. Allowed: leads, deals")
+    return key
+
+
+def _number(raw):
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        raise SalesRuleError(f"'{raw}' is not a number")
+
+
+def _condition_clause(column, operator, raw):
+    """The rule's condition as a SQL expression over the column."""
+    text_value = (raw or '').strip().lower()
+    numeric = column.type.python_type in (int, float)
+
+    if operator in ('equals', 'not_equals'):
+        clause = column == _number(raw) if numeric else func.lower(column) == text_value
+        return clause if operator == 'equals' else or_(not_(clause), column.is_(None))
+    if operator == 'contains':
+        return func.lower(column).contains(text_value, autoescape=True)
+    if operator == 'not_contains':
+        return or_(not_(func.lower(column).contains(text_value, autoescape=True)), column.is_(None))
+    if operator == 'starts_with':
+        return func.lower(column).startswith(text_value, autoescape=True)
+    if operator == 'ends_with':
+        return func.lower(column).endswith(text_value, autoescape=True)
+    if operator == 'in':
+        options = [v.strip().lower() for v in (raw or '').split(',') if v.strip()]
+        return func.lower(column).in_(options)
+    if operator in ('greater_than', 'less_than', 'greater_or_equal', 'less_or_equal'):
+        bound = _number(raw)
+        target = column if numeric else cast(column, Float)
+        return {
+            'greater_than': target > bound,
+            'less_than': target < bound,
+            'greater_or_equal': target >= bound,
+            'less_or_equal': target <= bound,
+        }[operator]
+    if operator == 'is_empty':
+        return or_(column.is_(None), column == '')
+    if operator == 'is_not_empty':
+        return and_(column.is_not(None), column != '')
+    raise SalesRuleError(f"Unknown operator '{operator}'")
+
+
+def _action_value(column, raw):
+    if column.type.python_type is int:
+        try:
+            return int(raw) if raw not in (None, '') else None
+        except ValueError:
+            raise SalesRuleError(f"action_value '{raw}' must be an id")
+    return raw
+
+
+def compile_rule(rule):
+    """
+    (model, action column, action value, condition) for a SalesRule, where
+    condition is a SQL clause, or ('frame', column, operator, pattern) for the
+    regex operators. Raises SalesRuleError for rules that cannot run.
+    """
+    key = module_key(rule.module)
+    model = MODULE_MODELS[key]
+
+    column = MODULE_ACTIONS[key].get(rule.action_type)
+    if column is None:
+        raise SalesRuleError(
+            f"Unknown action_type '{rule.action_type}' for {key}s. Allowed: {', '.join(MODULE_ACTIONS[key])}"
+        )
+    value = _action_value(column, rule.action_value)
+
+    if rule.condition_field not in model.__table__.c:
+        raise SalesRuleError(f"Unknown condition_field '{rule.condition_field}' for {key}s")
+    field = model.__table__.c[rule.condition_field]
+    operator = (rule.condition_operator or 'equals').strip().lower()
+    operator = OPERATOR_ALIASES.get(operator, operator)
+
+    if operator in FRAME_OPERATORS:
+        try:
+            re.compile(rule.condition_value or '')
+        except re.error as e:
+            raise SalesRuleError(f"Invalid pattern '{rule.condition_value}': {e}")
+        condition = ('frame', field, operator, rule.condition_value or '')
+    else:
+        condition = _condition_clause(field, operator, rule.condition_value)
+    return model, column, value, condition
+
+
+def _scope(model, organization_id):
+    return [model.organization_id == organization_id, or_(model.is_deleted == False, model.is_deleted.is_(None))]
+
+
+def _frame_matches(model, scope, field, operator, pattern):
+    """Ids whose column matches the regex: one projected SELECT, one vectorized str.contains."""
+    rows = db.session.execute(select(model.id, field).where(*scope)).all()
+    frame = pd.DataFrame(rows, columns=['id', 'value'])
+    if frame.empty:
+        return []
+    hits = frame['value'].astype('string').str.contains(pattern, case=False, regex=True, na=False)
+    if operator == 'not_matches':
+        hits = ~hits
+    return frame.loc[hits, 'id'].tolist()
+
+
+def _matching_ids(model, scope, condition):
+    """Ids of the records the rule's condition matches: one projected SELECT."""
+    if isinstance(condition, tuple):
+        return _frame_matches(model, scope, *condition[1:])
+    return db.session.scalars(select(model.id).where(*scope, condition)).all()
+
+
+def _update_ids(model, column, value, ids):
+    """One UPDATE ... WHERE id IN (...) per UPDATE_CHUNK_SIZE ids."""
+    for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+        db.session.execute(
+            update(model).where(model.id.in_(ids[start:start + UPDATE_CHUNK_SIZE]))
+            .values({column.key: value}).execution_options(synchronize_session=False)
+        )
+
+
+def apply_sales_rules(organization_id, module=None, dry_run=False):
+    """
+    Re-applies the org's active sales rules to its existing leads/deals.
+    Priority 1 is the highest (the order GET /api/sales-rules lists them in), and
+    the first matching rule wins: a record takes each field's value from the
+    highest-priority rule that matches it and writes that field (ties: lower id).
+    Every condition is evaluated against the records as they were before the run,
+    so one rule's write never changes which records another rule matches.
+    Per rule: one SELECT of matching ids, then chunked UPDATEs by id.
+    Returns one result per rule ({rule_id, name, module, matched} or {..., error});
+    matched counts only the records the rule wrote. dry_run writes nothing.
+    """
+    stmt = select(SalesRule).where(SalesRule.organization_id == organization_id, SalesRule.is_active == True)
+    rules = db.session.scalars(stmt.order_by(SalesRule.priority, SalesRule.id)).all()
+    wanted = module_key(module) if module else None
+
+    results = []
+    writes = []
+    claimed = {} # (table, column) -> ids already written by a higher-priority rule
+    try:
+        for rule in rules:
+            entry = {"rule_id": rule.id, "name": rule.name, "module": rule.module}
+            try:
+                if wanted and module_key(rule.module) != wanted:
+                    continue
+                model, column, value, condition = compile_rule(rule)
+            except SalesRuleError as e:
+                entry["error"] = str(e)
+                results.append(entry)
+                continue
+            taken = claimed.setdefault((model.__tablename__, column.key), set())
+            ids = [i for i in _matching_ids(model, _scope(model, organization_id), condition) if i not in taken]
+            taken.update(ids)
+            entry["matched"] = len(ids)
+            writes.append((model, column, value, ids))
+            results.append(entry)
+
+        # All conditions were read above; only now does anything change
+        changed = any(ids for _, _, _, ids in writes)
+        if not dry_run and changed:
+            for model, column, value, ids in writes:
+                _update_ids(model, column, value, ids)
+            db.session.commit()
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if changed and not dry_run:
+        # Bulk UPDATEs bypass the flush hooks that usually do this
+        mark_dirty(organization_id)
+        invalidate_series(organization_id)
+    return results
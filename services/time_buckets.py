@@ -0,0 +1,202 @@
+import threading
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import select, func, event, cast, Date
+from sqlalchemy.orm import Session
+from extensions import db
+from models.crm import Lead, Deal
+from services.resolution_cache import TTLCache
+
+GRAINS = ('day', 'week', 'month', 'quarter')
+
+# (organization id, generation, cache_key, grain) -> {bucket start: {metric: value}}.
+# Holds closed buckets only; the open (current) bucket is always queried
+_closed_buckets = TTLCache(maxsize=5000, ttl=3600)
+
+# organization id -> generation. Bumped when a write may have changed a closed
+# bucket, which orphans that org's cached series
+_generations = {}
+_generations_lock = threading.Lock()
+
+# Writes to these invalidate an org's cached series when they touch past rows
+SERIES_MODELS = (Lead, Deal)
+
+
+# --- Bucket arithmetic (Python side, for ranges and gap filling) ---
+
+def _check_grain(grain):
+    if grain not in GRAINS:
+        raise ValueError(f"Invalid interval '{grain}'. Allowed: {', '.join(GRAINS)}")
+
+
+def _as_date(value):
+    """Bucket keys come back as dates (MySQL/PostgreSQL) or 'YYYY-MM-DD' strings (SQLite)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def floor_bucket(value, grain):
+    """Start (a date) of the bucket containing value. Weeks start on Monday."""
+    _check_grain(grain)
+    d = _as_date(value)
+    if grain == 'day':
+        return d
+    if grain == 'week':
+        return d - timedelta(days=d.weekday())
+    if grain == 'month':
+        return d.replace(day=1)
+    return d.replace(month=(d.month - 1) // 3 * 3 + 1, day=1)
+
+
+def next_bucket(start, grain):
+    if grain == 'day':
+        return start + timedelta(days=1)
+    if grain == 'week':
+        return start + timedelta(days=7)
+    months = 1 if grain == 'month' else 3
+    month = start.month - 1 + months
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+
+def bucket_starts(start, end, grain):
+    """Starts of every bucket overlapping [start, end)."""
+    current = floor_bucket(start, grain)
+    end_date = _as_date(end)
+    if isinstance(end, datetime) and end.time() != time.min:
+        end_date += timedelta(days=1) # Part of that day is in range
+    starts = []
+    while current < end_date:
+        starts.append(current)
+        current = next_bucket(current, grain)
+    return starts
+
+
+# --- SQL side ---
+
+def bucket_expression(column, grain):
+    """
+    SQL for the start of column's bucket, for the current database. Only used in
+    SELECT/GROUP BY: rows are narrowed with a plain range on the column so its
+    index still applies.
+    """
+    _check_grain(grain)
+    dialect = db.engine.dialect.name
+
+    if dialect == 'sqlite':
+        if grain == 'day':
+            return func.date(column)
+        if grain == 'week':
+            return func.date(column, 'weekday 0', '-6 days') # Sunday on/after, back to Monday
+        if grain == 'month':
+            return func.strftime('%Y-%m-01', column)
+        month = (cast(func.strftime('%m', column), db.Integer) - 1) // 3 * 3 + 1
+        return func.printf('%s-%02d-01', func.strftime('%Y', column), month)
+
+    if dialect == 'mysql':
+        if grain == 'day':
+            return func.date(column)
+        if grain == 'week':
+            return func.subdate(func.date(column), func.weekday(column)) # WEEKDAY(): Monday = 0
+        if grain == 'month':
+            return func.date_format(column, '%Y-%m-01')
+        month = (func.quarter(column) - 1) * 3 + 1
+        return func.concat(func.year(column), '-', func.lpad(month, 2, '0'), '-01')
+
+    # PostgreSQL and others with date_trunc (weeks start on Monday there too)
+    return cast(func.date_trunc(grain, column), Date)
+
+
+def _bound(column, value):
+    """Range bound in the column's own type (datetime for DateTime columns)."""
+    if column.type.python_type is datetime:
+        return datetime.combine(value, time.min)
+    return value
+
+
+def _empty_values(metrics):
+    return {m.name: (None if m.kind == 'avg' else 0) for m in metrics}
+
+
+def time_series(model, date_column, grain, start, end, metrics, organization_id=None, org_column=None,
+                filters=(), cache_key=None):
+    """
+    One row per bucket overlapping [start, end), gaps filled:
+        [{"bucket": date, <metric name>: value, ...}, ...]
+    metrics are services.metrics_engine Metrics, so several aggregates share one
+    grouped query. With a cache_key (unique per metrics + filters), closed buckets
+    are remembered and only the open one is queried again.
+    """
+    buckets = bucket_starts(start, end, grain)
+    if not buckets:
+        return []
+    open_bucket = floor_bucket(datetime.utcnow(), grain)
+
+    key = None
+    cached = {}
+    if cache_key is not None:
+        key = (organization_id, _generation(organization_id), cache_key, grain)
+        cached = _closed_buckets.get(key, {})
+    missing = [b for b in buckets if b >= open_bucket or b not in cached]
+
+    fresh = {}
+    if missing:
+        bucket = bucket_expression(date_column, grain)
+        stmt = select(bucket.label('bucket'), *[m.expression(model).label(m.name) for m in metrics]).where(
+            date_column >= _bound(date_column, missing[0]),
+            date_column < _bound(date_column, next_bucket(buckets[-1], grain))
+        )
+        if organization_id is not None:
+            column = org_column if org_column is not None else model.organization_id
+            stmt = stmt.where(column == organization_id)
+        for clause in filters:
+            stmt = stmt.where(clause)
+
+        rows = {_as_date(r.bucket): r for r in db.session.execute(stmt.group_by(bucket)).all()}
+        for b in missing:
+            row = rows.get(b)
+            fresh[b] = {m.name: getattr(row, m.name) for m in metrics} if row else _empty_values(metrics)
+
+        if key is not None:
+            closed = {b: v for b, v in fresh.items() if b < open_bucket}
+            if closed:
+                _closed_buckets.set(key, {**cached, **closed})
+
+    return [{"bucket": b, **(fresh[b] if b in fresh else cached[b])} for b in buckets]
+
+
+# --- Invalidation ---
+
+def _generation(organization_id):
+    with _generations_lock:
+        return _generations.get(organization_id, 0)
+
+
+def invalidate_series(organization_id):
+    """Drops the org's cached closed buckets (local to this process; others converge within the TTL)."""
+    with _generations_lock:
+        _generations[organization_id] = _generations.get(organization_id, 0) + 1
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_past_writes(session, flush_context):
+    # Rows dated today only change open buckets; older (or backdated) rows may change closed ones
+    today = datetime.utcnow().date()
+    touched = session.info.setdefault('series_dirty_orgs', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SERIES_MODELS) and obj.organization_id is not None:
+            created_at = obj.created_at
+            if created_at is None or _as_date(created_at) < today:
+                touched.add(obj.organization_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_past_writes(session):
+    for organization_id in session.info.pop('series_dirty_orgs', ()):
+        invalidate_series(organization_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_past_writes(session):
+    session.info.pop('series_dirty_orgs', None)
@@ -0,0 +1,333 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, or_, and_
+from extensions import db
+from models.webhook_event import WebhookEvent
+from models.conversation import Conversation
+from models.message import Message
+from models.crm import Lead
+from services.automation_engine import emit_event
+from services.phone_service import normalize_phone
+from services.inbox_service import summarize_messages, apply_conversation_updates
+from services.outbound_service import apply_delivery_receipts
+from services.realtime import publish_new_message, publish_inbox_update, publish_message_status, inbox_update_payload
+from services.resolution_cache import (
+    resolve_org_ids, resolve_lead_ids, resolve_conversation_ids, remember_lead, remember_conversation
+)
+
+DEFAULT_ORG_ID = 1 # Fallback when phone_number_id maps to no WhatsAppAccount
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# --- Enqueue (request path) ---
+
+def enqueue_webhook_event(source, payload):
+    """Appends the raw body to the queue and wakes this process's ingest worker."""
+    db.session.execute(WebhookEvent.__table__.insert().values(
+        source=source, payload=payload, status='pending', attempts=0, received_at=datetime.utcnow()
+    ))
+    db.session.commit()
+    ensure_ingest_worker(current_app._get_current_object())
+    _wake.set()
+
+
+def ensure_ingest_worker(app):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, args=(app,), name='webhook-ingest', daemon=True)
+            _worker.start()
+
+
+def _worker_loop(app):
+    poll_seconds = app.config.get('WEBHOOK_POLL_SECONDS', 2)
+    while True:
+        _wake.wait(timeout=poll_seconds)
+        _wake.clear()
+        with app.app_context():
+            try:
+                drain_webhook_events()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[FAIL] Webhook ingest worker error: {e}")
+            finally:
+                db.session.remove()
+
+
+# --- Drain (worker path) ---
+
+def _claim_events(batch_size, stale_seconds):
+    """
+    Claims up to batch_size pending events (plus processing ones whose claim went
+    stale after a crash). SKIP LOCKED lets several processes drain concurrently.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=stale_seconds)
+    rows = db.session.execute(
+        select(WebhookEvent.id, WebhookEvent.payload, WebhookEvent.attempts)
+        .where(or_(
+            WebhookEvent.status == 'pending',
+            and_(WebhookEvent.status == 'processing', WebhookEvent.claimed_at < stale_before)
+        ))
+        .order_by(WebhookEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if rows:
+        db.session.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_([r.id for r in rows]))
+            .values(status='processing', claimed_at=now, attempts=WebhookEvent.attempts + 1)
+        )
+    db.session.commit()
+    return rows
+
+
+def drain_webhook_events():
+    """Processes queued events batch by batch until the queue is empty. Must run inside an app context."""
+    config = current_app.config
+    batch_size = config.get('WEBHOOK_BATCH_SIZE', 200)
+    stale_seconds = config.get('WEBHOOK_CLAIM_TIMEOUT', 300)
+    max_attempts = config.get('WEBHOOK_MAX_ATTEMPTS', 5)
+
+    processed = 0
+    while True:
+        events = _claim_events(batch_size, stale_seconds)
+        if not events:
+            break
+        try:
+            new_messages = process_whatsapp_events(events)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[WARN] Webhook batch failed ({e}); retrying events one by one.")
+            new_messages = []
+            for event in events:
+                try:
+                    new_messages.extend(process_whatsapp_events([event]))
+                except Exception as event_error:
+                    db.session.rollback()
+                    _mark_failed(event, event_error, max_attempts)
+        processed += len(events)
+        _emit_new_messages(new_messages)
+    return processed
+
+
+def _mark_failed(event, error, max_attempts):
+    """
+    Gives up after max_attempts. Otherwise the event stays claimed ('processing'),
+    so it is retried once the claim goes stale (WEBHOOK_CLAIM_TIMEOUT) rather than
+    immediately in the same drain.
+    """
+    # attempts was incremented when the event was claimed
+    status = 'failed' if (event.attempts or 0) + 1 >= max_attempts else 'processing'
+    db.session.execute(
+        update(WebhookEvent).where(WebhookEvent.id == event.id)
+        .values(status=status, error_message=str(error))
+    )
+    db.session.commit()
+    print(f"[FAIL] Webhook event {event.id} ({status}): {error}")
+
+
+def parse_whatsapp_payload(payload):
+    """
+    Flattens every entry -> change -> value of a Meta webhook body into
+    (messages, statuses). Each message: phone_number_id, from, wamid, text, timestamp.
+    """
+    data = json.loads(payload) if isinstance(payload, str) else (payload or {})
+    messages = []
+    statuses = []
+    for entry in data.get('entry', []) or []:
+        for change in entry.get('changes', []) or []:
+            value = change.get('value', {}) or {}
+            phone_number_id = (value.get('metadata') or {}).get('phone_number_id')
+            for msg in value.get('messages', []) or []:
+                if not msg.get('from'):
+                    continue
+                messages.append({
+                    "phone_number_id": phone_number_id,
+                    "from": msg.get('from'),
+                    "wamid": msg.get('id'),
+                    "text": (msg.get('text') or {}).get('body', ''),
+                    "timestamp": msg.get('timestamp')
+                })
+            for status in value.get('statuses', []) or []:
+                if status.get('id') and status.get('status'):
+                    statuses.append({"wamid": status.get('id'), "status": status.get('status')})
+    return messages, statuses
+
+
+def _message_time(timestamp):
+    try:
+        return datetime.utcfromtimestamp(int(timestamp))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+
+def process_whatsapp_events(events):
+    """
+    Processes a batch of queued payloads with set-based queries: one lookup each
+    for accounts, already-stored wamids, leads and conversations, one multi-row
+    INSERT for messages, executemany UPDATEs for the conversations' inbox
+    projection and for receipts,
+    and one commit. Returns the wamids of the messages inserted.
+    """
+    messages = []
+    statuses = []
+    for event in events:
+        event_messages, event_statuses = parse_whatsapp_payload(event.payload)
+        messages.extend(event_messages)
+        statuses.extend(event_statuses)
+
+    # Meta retries deliver the same wamid again: drop ones already stored or repeated in this batch
+    wamids = {m['wamid'] for m in messages if m['wamid']}
+    seen = set()
+    if wamids:
+        seen = {w for (w,) in db.session.execute(
+            select(Message.whatsapp_message_id).where(Message.whatsapp_message_id.in_(wamids))
+        ).all()}
+    unique_messages = []
+    for m in messages:
+        if m['wamid']:
+            if m['wamid'] in seen:
+                continue
+            seen.add(m['wamid'])
+        unique_messages.append(m)
+    messages = unique_messages
+
+    inserted_wamids = []
+    if messages:
+        # 1-3 resolve through services/resolution_cache.py: no queries when every
+        # number, sender and conversation has been seen recently
+        # 1. Organization per receiving number
+        org_ids = resolve_org_ids({m['phone_number_id'] for m in messages if m['phone_number_id']})
+        for m in messages:
+            m['org_id'] = org_ids.get(m['phone_number_id']) or DEFAULT_ORG_ID
+            m['phone'] = normalize_phone(m['from'])
+
+        # 2. Find or create leads
+        lead_by_key = resolve_lead_ids({(m['org_id'], m['phone']) for m in messages})
+
+        new_leads = {}
+        for m in messages:
+            key = (m['org_id'], m['phone'])
+            if key not in lead_by_key and key not in new_leads:
+                new_leads[key] = Lead(
+                    name=f"WhatsApp {m['from']}",
+                    phone=m['from'],
+                    source='whatsapp',
+                    status='new',
+                    organization_id=m['org_id'],
+                    created_at=datetime.utcnow()
+                )
+        if new_leads:
+            db.session.add_all(new_leads.values())
+            db.session.flush()
+            for key, lead in new_leads.items():
+                lead_by_key[key] = lead.id
+
+        # 3. Find or create conversations
+        lead_ids = set(lead_by_key.values())
+        conversation_by_lead = resolve_conversation_ids(lead_ids)
+
+        org_by_lead = {lead_id: org_id for (org_id, _), lead_id in lead_by_key.items()}
+        missing = [lead_id for lead_id in lead_ids if lead_id not in conversation_by_lead]
+        new_conversations = []
+        if missing:
+            # lead_name is denormalized onto the conversation for the inbox list
+            name_by_lead = {lead.id: lead.name for lead in new_leads.values()}
+            existing = [lead_id for lead_id in missing if lead_id not in name_by_lead]
+            if existing:
+                name_by_lead.update(db.session.execute(
+                    select(Lead.id, Lead.name).where(Lead.id.in_(existing))
+                ).all())
+            new_conversations = [
+                Conversation(channel='whatsapp', lead_id=lead_id, organization_id=org_by_lead[lead_id],
+                             status='open', lead_name=name_by_lead.get(lead_id), inbound_count=0)
+                for lead_id in missing
+            ]
+        if new_conversations:
+            db.session.add_all(new_conversations)
+            db.session.flush()
+            for conversation in new_conversations:
+                conversation_by_lead[conversation.lead_id] = conversation.id
+
+        # 4. Insert messages
+        rows = []
+        for m in messages:
+            conversation_id = conversation_by_lead[lead_by_key[(m['org_id'], m['phone'])]]
+            created_at = _message_time(m['timestamp'])
+            rows.append({
+                "conversation_id": conversation_id,
+                "channel": 'whatsapp',
+                "sender_type": 'customer',
+                "content": m['text'],
+                "status": 'received',
+                "whatsapp_message_id": m['wamid'],
+                "created_at": created_at
+            })
+            if m['wamid']:
+                inserted_wamids.append(m['wamid'])
+        db.session.execute(Message.__table__.insert(), rows)
+
+        # Inbox projection: last message, preview, sender and unread counter per conversation
+        apply_conversation_updates(summarize_messages(
+            (r['conversation_id'], r['created_at'], r['content'], r['sender_type']) for r in rows
+        ))
+
+    # 5. Delivery receipts (sent, delivered, read)
+    if statuses:
+        apply_delivery_receipts(statuses)
+
+    db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_([e.id for e in events]))
+        .values(status='done', processed_at=datetime.utcnow(), error_message=None)
+    )
+    db.session.commit()
+
+    if messages:
+        # Cache only what is committed
+        for key in new_leads:
+            remember_lead(key[0], key[1], lead_by_key[key])
+        for lead_id, conversation_id in conversation_by_lead.items():
+            remember_conversation(lead_id, conversation_id)
+
+        # Run Automation for New Leads
+        for key, lead in new_leads.items():
+            emit_event("lead_created", lead, key[0])
+
+    if statuses:
+        _emit_receipts(statuses)
+
+    return inserted_wamids
+
+
+def _emit_new_messages(wamids):
+    """Queues new_message events plus one coalesced inbox_updated per conversation, and fires message_received rules."""
+    if not wamids:
+        return
+    rows = db.session.execute(
+        select(Message, Conversation)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Message.whatsapp_message_id.in_(wamids))
+        .order_by(Message.created_at, Message.id)
+    ).all()
+    for message, conversation in rows:
+        publish_new_message(conversation.organization_id, message.to_dict())
+        publish_inbox_update(conversation.organization_id, conversation.id, inbox_update_payload(conversation))
+        emit_event("message_received", message, conversation.organization_id)
+
+
+def _emit_receipts(statuses):
+    wamids = {s['wamid'] for s in statuses}
+    rows = db.session.execute(
+        select(Message.id, Message.conversation_id, Message.status)
+        .where(Message.whatsapp_message_id.in_(wamids))
+    ).all()
+    for message_id, conversation_id, status in rows:
+        publish_message_status(conversation_id, message_id, status)